@@ -0,0 +1,101 @@
+"""
+   Copyright 2015-2017 Red Hat, Inc. and/or its affiliates
+   and other contributors.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+   Compares decoding and encoding 10k FullTriggers with the per character key
+   conversion used previously and the memoized conversion of ApiObject, and
+   reading id and enabled of 50k triggers from JSON as objects and as lazy views.
+
+   Usage: python -m benchmarks.apiobject
+"""
+from __future__ import print_function
+
+import json
+import timeit
+
+from hawkular.alerts.triggers import FullTrigger, Trigger, Condition, Dampening
+
+
+def to_camelcase(word):
+    s = ''.join(x.capitalize() or '_' for x in word.split('_'))
+    return ''.join([s[0].lower(), s[1:]])
+
+def to_underscore(word):
+    return ''.join(["_" + c.lower() if c.isupper() else c for c in word]).strip('_')
+
+def previous_init(obj, dictionary):
+    udict = dict((to_underscore(k), v) for k, v in dictionary.items() if v is not None)
+    for k in obj.__slots__:
+        setattr(obj, k, udict.get(k, obj.defaults.get(k)))
+    return obj
+
+def previous_decode(d):
+    full = FullTrigger.__new__(FullTrigger)
+    udict = dict((to_underscore(k), v) for k, v in d.items() if v is not None)
+    full.trigger = previous_init(Trigger.__new__(Trigger), udict.get('trigger'))
+    full.dampenings = [previous_init(Dampening.__new__(Dampening), o) for o in udict.get('dampenings')]
+    full.conditions = [previous_init(Condition.__new__(Condition), o) for o in udict.get('conditions')]
+    return full
+
+def previous_encode(obj):
+    dictionary = dict((a, getattr(obj, a)) for a in obj.__slots__ if hasattr(obj, a))
+    return dict((to_camelcase(k), v) for k, v in dictionary.items() if v is not None)
+
+
+def payload(triggers=10000):
+    return [{'trigger': {'id': 'trigger-{0}'.format(i), 'name': 'Trigger {0}'.format(i), 'enabled': True,
+                         'severity': 'HIGH', 'autoDisable': False, 'autoResolve': True, 'eventType': 'ALERT',
+                         'tags': {'host': 'host-{0}'.format(i % 50)}, 'firingMatch': 'ALL'},
+             'conditions': [{'triggerId': 'trigger-{0}'.format(i), 'triggerMode': 'FIRING', 'type': 'THRESHOLD',
+                             'dataId': 'data-{0}'.format(i), 'operator': 'GT', 'threshold': 90.0}],
+             'dampenings': [{'triggerId': 'trigger-{0}'.format(i), 'triggerMode': 'FIRING', 'type': 'STRICT',
+                             'evalTrueSetting': 3}]}
+            for i in range(triggers)]
+
+
+def best(func, repeat=5):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main():
+    data = payload()
+    current = [FullTrigger(d) for d in data]
+    triggers = [f.trigger for f in current]
+
+    rows = [
+        ('decode FullTrigger', lambda: [previous_decode(d) for d in data], lambda: [FullTrigger(d) for d in data]),
+        ('encode Trigger', lambda: [previous_encode(t) for t in triggers], lambda: [t.to_json_object() for t in triggers]),
+    ]
+
+    print('{0:<20} {1:>12} {2:>12} {3:>8}'.format('10k objects', 'previous ms', 'current ms', 'speedup'))
+    for name, previous, memoized in rows:
+        before = best(previous)
+        after = best(memoized)
+        print('{0:<20} {1:>12.1f} {2:>12.1f} {3:>7.1f}x'.format(name, before * 1000, after * 1000, before / after))
+
+    body = json.dumps([d['trigger'] for d in payload(50000)])
+    readers = [
+        ('json.loads only', lambda: json.loads(body)),
+        ('Trigger objects', lambda: [(t.id, t.enabled) for t in Trigger.list_to_object_list(json.loads(body))]),
+        ('Trigger views', lambda: [(t.id, t.enabled) for t in Trigger.list_to_view_list(json.loads(body))]),
+    ]
+
+    print()
+    print('{0:<20} {1:>12}'.format('50k triggers', 'ms'))
+    for name, read in readers:
+        print('{0:<20} {1:>12.1f}'.format(name, best(read) * 1000))
+
+if __name__ == '__main__':
+    main()
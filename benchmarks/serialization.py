@@ -0,0 +1,61 @@
+"""
+   Copyright 2015-2017 Red Hat, Inc. and/or its affiliates
+   and other contributors.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+   Compares the size and encoding time of a 10k datapoint put batch with the
+   indented encoding used previously, compact stdlib encoding and the encoder
+   picked by hawkular.client.
+
+   Usage: python -m benchmarks.serialization
+"""
+from __future__ import print_function
+
+import json
+import timeit
+
+from hawkular.client import encode_json, JSON_ENCODER
+from hawkular.metrics import MetricType, create_datapoint, create_metric
+
+
+def batch(metrics=100, datapoints=100):
+    t = 1500000000000
+    return [create_metric(MetricType.Gauge, 'bench.gauge.{0}'.format(m),
+                          [create_datapoint(m * 0.5 + d * 1.25, t + d * 1000) for d in range(datapoints)])
+            for m in range(metrics)]
+
+
+def measure(encode, data, repeat=5):
+    size = len(encode(data))
+    seconds = min(timeit.repeat(lambda: encode(data), number=1, repeat=repeat))
+    return size, seconds
+
+
+def main():
+    data = batch()
+    encoders = [
+        ('indent=2', lambda d: json.dumps(d, indent=2)),
+        ('compact json', lambda d: json.dumps(d, separators=(',', ':'))),
+        ('encode_json ({0})'.format(JSON_ENCODER), encode_json),
+    ]
+
+    base_size, _ = measure(encoders[0][1], data)
+    print('{0:<24} {1:>10} {2:>10} {3:>10}'.format('encoder', 'bytes', 'ms', 'smaller'))
+    for name, encode in encoders:
+        size, seconds = measure(encode, data)
+        print('{0:<24} {1:>10} {2:>10.2f} {3:>9.0f}%'.format(
+            name, size, seconds * 1000, 100.0 * (1 - float(size) / base_size)))
+
+if __name__ == '__main__':
+    main()
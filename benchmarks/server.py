@@ -0,0 +1,197 @@
+"""
+   Copyright 2015-2017 Red Hat, Inc. and/or its affiliates
+   and other contributors.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+   In-process stand-in for the Hawkular Metrics and Alerts REST endpoints used
+   by the benchmarks. Responses are generated once and cached as encoded bytes,
+   so the measurements are dominated by the client and not by the server.
+"""
+import json
+import re
+import threading
+
+try:
+    # Python 3
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlsplit, parse_qs
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlsplit, parse_qs
+
+METRICS_VERSION = '0.27.0.Final'
+ALERTS_VERSION = '1.7.0.Final'
+START = 1500000000000
+
+
+def datapoints(count):
+    return [{'timestamp': START + i * 1000, 'value': i * 0.5} for i in range(count)]
+
+def buckets(count, duration=60000):
+    return [{'start': START + i * duration, 'end': START + (i + 1) * duration, 'empty': False, 'samples': 60,
+             'min': 0.5 * i, 'max': 0.5 * i + 29.5, 'avg': 0.5 * i + 14.75, 'median': 0.5 * i + 14.75,
+             'sum': 60 * (0.5 * i + 14.75)} for i in range(count)]
+
+def full_triggers(count):
+    return [{'trigger': {'id': 'trigger-{0}'.format(i), 'name': 'Trigger {0}'.format(i), 'enabled': True,
+                         'severity': 'HIGH', 'autoDisable': False, 'autoResolve': True, 'eventType': 'ALERT',
+                         'tags': {'host': 'host-{0}'.format(i % 50)}, 'firingMatch': 'ALL'},
+             'conditions': [{'triggerId': 'trigger-{0}'.format(i), 'triggerMode': 'FIRING', 'type': 'THRESHOLD',
+                             'dataId': 'data-{0}'.format(i), 'operator': 'GT', 'threshold': 90.0}],
+             'dampenings': [{'triggerId': 'trigger-{0}'.format(i), 'triggerMode': 'FIRING', 'type': 'STRICT',
+                             'evalTrueSetting': 3}]}
+            for i in range(count)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and payload are written separately, which would otherwise wait for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def _dispatch(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length > 0 else b''
+        status, payload = self.server.stub.respond(self.command, self.path, body)
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _dispatch
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class HawkularStub(object):
+    """
+    Local HTTP/1.1 server answering like Hawkular Metrics and Alerts:
+
+    - GET  /hawkular/{metrics,alerts}/status
+    - POST /hawkular/metrics/{type}/raw and /hawkular/metrics/{type}/raw/query, writes are only counted
+    - GET  /hawkular/metrics/{type}/{id}/raw returns the amount of datapoints given by the limit
+      parameter, the stats endpoint the amount of buckets given by the buckets parameter
+    - GET  /hawkular/alerts/triggers and /hawkular/alerts/export return the configured amount of
+      triggers, POST /hawkular/alerts/import/{strategy} echoes the definitions
+
+    The amount of received requests and datapoints is kept in the requests and datapoints attributes.
+    """
+    def __init__(self, triggers=1000):
+        self.requests = 0
+        self.datapoints = 0
+        self._lock = threading.Lock()
+        self._responses = {}
+        self._triggers = triggers
+        self._routes = [
+            ('GET', re.compile(r'/hawkular/metrics/status$'), self._metrics_status),
+            ('GET', re.compile(r'/hawkular/alerts/status$'), self._alerts_status),
+            ('POST', re.compile(r'/hawkular/metrics/[a-z_]+/raw$'), self._write),
+            ('POST', re.compile(r'/hawkular/metrics/[a-z_]+/raw/query$'), self._query_many),
+            ('GET', re.compile(r'/hawkular/metrics/[a-z_]+/[^/]+/raw$'), self._raw),
+            ('GET', re.compile(r'/hawkular/metrics/[a-z_]+/[^/]+/stats$'), self._stats),
+            ('GET', re.compile(r'/hawkular/alerts/triggers$'), self._trigger_list),
+            ('GET', re.compile(r'/hawkular/alerts/export$'), self._export),
+            ('POST', re.compile(r'/hawkular/alerts/import/[a-z]+$'), self._import),
+        ]
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def _cached(self, key, build):
+        with self._lock:
+            payload = self._responses.get(key)
+        if payload is None:
+            payload = json.dumps(build(), separators=(',', ':')).encode('utf-8')
+            with self._lock:
+                self._responses[key] = payload
+        return payload
+
+    def respond(self, method, path, body):
+        parts = urlsplit(path)
+        query = dict((k, v[0]) for k, v in parse_qs(parts.query).items())
+        with self._lock:
+            self.requests += 1
+
+        for route_method, pattern, handler in self._routes:
+            if route_method == method and pattern.match(parts.path):
+                return 200, handler(query, body)
+
+        return 404, json.dumps({'errorMsg': 'No route for ' + parts.path}).encode('utf-8')
+
+    def _metrics_status(self, query, body):
+        return self._cached('metrics-status', lambda: {'MetricsService': 'STARTED',
+                                                       'Implementation-Version': METRICS_VERSION,
+                                                       'Built-From-Git-SHA1': '0'})
+
+    def _alerts_status(self, query, body):
+        return self._cached('alerts-status', lambda: {'status': 'STARTED',
+                                                      'Implementation-Version': ALERTS_VERSION,
+                                                      'Built-From-Git-SHA1': '0', 'distributed': 'false'})
+
+    def _write(self, query, body):
+        count = sum(len(m.get('data', [])) for m in json.loads(body.decode('utf-8')))
+        with self._lock:
+            self.datapoints += count
+        return b''
+
+    def _query_many(self, query, body):
+        ids = json.loads(body.decode('utf-8')).get('ids', [])
+        points = self._cached(('raw', 100), lambda: datapoints(100))
+        return b'[' + b','.join(b'{"id":' + json.dumps(i).encode('utf-8') + b',"data":' + points + b'}'
+                                for i in ids) + b']'
+
+    def _raw(self, query, body):
+        count = int(query.get('limit', 1000))
+        return self._cached(('raw', count), lambda: datapoints(count))
+
+    def _stats(self, query, body):
+        count = int(query.get('buckets', 60))
+        return self._cached(('stats', count), lambda: buckets(count))
+
+    def _trigger_list(self, query, body):
+        return self._cached('triggers', lambda: [t['trigger'] for t in full_triggers(self._triggers)])
+
+    def _export(self, query, body):
+        return self._cached('export', lambda: {'triggers': full_triggers(self._triggers), 'actions': []})
+
+    def _import(self, query, body):
+        return body
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,238 @@
+"""
+   Copyright 2015-2017 Red Hat, Inc. and/or its affiliates
+   and other contributors.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+   Runs the client scenarios against the in-process HawkularStub and reports the
+   best of repeated runs. The results can be written as JSON and compared with
+   the JSON of an earlier run to spot regressions between releases.
+
+   Usage: python -m benchmarks.suite [--quick] [--filter NAME] [--repeat N]
+                                     [--json FILE] [--compare FILE]
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import platform
+import sys
+import time
+import timeit
+
+from benchmarks.server import HawkularStub, full_triggers, START
+from hawkular.alerts import HawkularAlertsClient, FullTrigger
+from hawkular.client import JSON_ENCODER, encode_json
+from hawkular.metrics import HawkularMetricsClient, MetricType, create_datapoint, create_metric
+
+SCENARIOS = []
+
+
+def scenario(name, quick=True, **params):
+    """
+    Register a scenario. The decorated function receives the stub and params and returns a
+    (run, operations) tuple, run being called once per measurement. Scenarios with quick=False
+    are skipped by --quick.
+    """
+    def register(setup):
+        SCENARIOS.append((name, params, quick, setup))
+        return setup
+    return register
+
+
+def metrics_client(stub):
+    return HawkularMetricsClient(tenant_id='benchmark', port=stub.port)
+
+def alerts_client(stub):
+    return HawkularAlertsClient(tenant_id='benchmark', port=stub.port)
+
+
+@scenario('push', datapoints=1000)
+def push(stub, datapoints):
+    client = metrics_client(stub)
+
+    def run():
+        for i in range(datapoints):
+            client.push(MetricType.Gauge, 'bench.push', i * 0.5, START + i)
+    return run, datapoints
+
+@scenario('put', requests=10, metrics=100, datapoints=100)
+def put(stub, requests, metrics, datapoints):
+    client = metrics_client(stub)
+    batch = [create_metric(MetricType.Gauge, 'bench.put.{0}'.format(m),
+                           [create_datapoint(m * 0.5 + d * 1.25, START + d * 1000) for d in range(datapoints)])
+             for m in range(metrics)]
+
+    def run():
+        for _ in range(requests):
+            # put removes the type from the dicts
+            client.put([dict(m) for m in batch])
+    return run, requests * metrics * datapoints
+
+@scenario('aggregate', samples=100000, metrics=100)
+def aggregate(stub, samples, metrics):
+    client = metrics_client(stub)
+    ids = ['bench.aggregate.{0}'.format(m) for m in range(metrics)]
+
+    def run():
+        # 100 Hz samples rolled up into 10 second windows
+        with client.aggregator(window=10) as aggregator:
+            for i in range(samples):
+                aggregator.push(MetricType.Gauge, ids[i % metrics], i * 0.5, START + (i // metrics) * 10)
+    return run, samples
+
+@scenario('batch_writer', datapoints=200000, metrics=100)
+def batch_writer(stub, datapoints, metrics):
+    client = metrics_client(stub)
+    ids = ['bench.ingest.{0}'.format(m) for m in range(metrics)]
+
+    def run():
+        with client.batch_writer(batch_size=5000) as writer:
+            for i in range(datapoints):
+                writer.push(MetricType.Gauge, ids[i % metrics], i * 0.5, START + i)
+    return run, datapoints
+
+@scenario('ingest_pool', datapoints=200000, metrics=100, processes=1)
+@scenario('ingest_pool', datapoints=200000, metrics=100, processes=4)
+def ingest_pool(stub, datapoints, metrics, processes):
+    client = metrics_client(stub)
+    ids = ['bench.ingest.{0}'.format(m) for m in range(metrics)]
+
+    def run():
+        # Includes starting and stopping the worker processes
+        with client.ingest_pool(processes=processes, batch_size=5000) as pool:
+            for i in range(datapoints):
+                pool.push(MetricType.Gauge, ids[i % metrics], i * 0.5, START + i)
+    return run, datapoints
+
+@scenario('query_metric', datapoints=1000)
+@scenario('query_metric', datapoints=100000)
+@scenario('query_metric', quick=False, datapoints=1000000)
+def query_metric(stub, datapoints):
+    client = metrics_client(stub)
+    return lambda: client.query_metric(MetricType.Gauge, 'bench.query', limit=datapoints), datapoints
+
+@scenario('iter_metric', datapoints=100000)
+def iter_metric(stub, datapoints):
+    client = metrics_client(stub)
+
+    def run():
+        for _ in client.iter_metric(MetricType.Gauge, 'bench.query', limit=datapoints):
+            pass
+    return run, datapoints
+
+@scenario('query_metric_stats', buckets=1000)
+def query_metric_stats(stub, buckets):
+    client = metrics_client(stub)
+    return lambda: client.query_metric_stats(MetricType.Gauge, 'bench.stats', buckets=buckets), buckets
+
+@scenario('apiobject_decode', triggers=10000)
+def apiobject_decode(stub, triggers):
+    data = full_triggers(triggers)
+    return lambda: [FullTrigger(d) for d in data], triggers
+
+@scenario('apiobject_encode', triggers=10000)
+def apiobject_encode(stub, triggers):
+    objects = [FullTrigger(d) for d in full_triggers(triggers)]
+    return lambda: encode_json(objects), triggers
+
+@scenario('trigger_list', triggers=10000, lazy=False)
+@scenario('trigger_list', triggers=10000, lazy=True)
+def trigger_list(stub, triggers, lazy):
+    client = alerts_client(stub)
+    return lambda: [(t.id, t.enabled) for t in client.triggers.get(lazy=lazy)], triggers
+
+@scenario('trigger_sync_unchanged', triggers=10000)
+def trigger_sync_unchanged(stub, triggers):
+    client = alerts_client(stub)
+    desired = [FullTrigger(d) for d in full_triggers(triggers)]
+    return lambda: client.triggers.sync(desired), triggers
+
+
+def measure(run, repeat):
+    run()  # Warm up connections and caches
+    times = timeit.repeat(run, number=1, repeat=repeat)
+    return min(times), sum(times) / len(times)
+
+
+def run_suite(quick=False, name_filter=None, repeat=5):
+    """
+    Run the registered scenarios and return the report as a JSON serializable dict
+    """
+    results = []
+    triggers = max([p.get('triggers', 0) for _, p, _, _ in SCENARIOS] + [1])
+    with HawkularStub(triggers=triggers) as stub:
+        for name, params, is_quick, setup in sorted(SCENARIOS, key=lambda s: (s[0], sorted(s[1].items()))):
+            if (quick and not is_quick) or (name_filter and name_filter not in name):
+                continue
+
+            run, operations = setup(stub, **params)
+            best, mean = measure(run, repeat)
+            results.append({'name': name,
+                            'params': params,
+                            'repeat': repeat,
+                            'best_seconds': best,
+                            'mean_seconds': mean,
+                            'operations': operations,
+                            'operations_per_second': operations / best})
+
+    return {'timestamp': int(time.time()),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'json_encoder': JSON_ENCODER,
+            'results': results}
+
+
+def result_key(result):
+    return result['name'] + ''.join(' {0}={1}'.format(k, v) for k, v in sorted(result['params'].items()))
+
+
+def print_report(report, baseline=None):
+    previous = dict((result_key(r), r) for r in (baseline or {}).get('results', []))
+    print('{0:<44} {1:>10} {2:>14} {3:>8}'.format('scenario', 'best ms', 'ops/s', 'change'), file=sys.stderr)
+    for r in report['results']:
+        key = result_key(r)
+        change = ''
+        if key in previous:
+            change = '{0:+.0f}%'.format(100.0 * (r['best_seconds'] / previous[key]['best_seconds'] - 1))
+        print('{0:<44} {1:>10.1f} {2:>14.0f} {3:>8}'.format(
+            key, r['best_seconds'] * 1000, r['operations_per_second'], change), file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='hawkular-client benchmarks')
+    parser.add_argument('--quick', action='store_true', help='skip the largest scenarios')
+    parser.add_argument('--filter', help='only run scenarios whose name contains FILTER')
+    parser.add_argument('--repeat', type=int, default=5, help='measurements per scenario, the best is reported')
+    parser.add_argument('--json', help='write the results as JSON to this file, - for stdout')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    args = parser.parse_args(argv)
+
+    report = run_suite(quick=args.quick, name_filter=args.filter, repeat=args.repeat)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.json == '-':
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+    elif args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
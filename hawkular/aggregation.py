@@ -0,0 +1,253 @@
+"""
+   Copyright 2015-2017 Red Hat, Inc. and/or its affiliates
+   and other contributors.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+import threading
+import time
+from datetime import datetime
+
+from hawkular.client import HawkularError
+from hawkular.metrics import MetricType, create_metric, create_datapoint, datetime_to_time_millis, time_millis
+
+STATS = ('min', 'max', 'avg', 'sum', 'count', 'last')
+
+
+class Aggregator(object):
+    """
+    Rolls up pushed samples per metric into windows of window seconds, aligned to the epoch, and sends
+    one datapoint per window and metric, timestamped with the start of the window, with target.put from
+    a background thread. The target is a HawkularMetricsClient, or a BatchWriter to have failed sends
+    retried. Create instances with client.aggregator().
+
+    Gauges: the summary statistic of the window (min, max, avg, sum, count or last) is sent with the
+    id of the gauge, every statistic in extra_stats as a gauge with the id {id}.{stat}. summary=None
+    only sends the extra_stats.
+
+    Counters: with counters='sum' the pushed values are increments, which are added to a running total
+    and the total is sent at the end of each window. With counters='last' the pushed values are
+    already totals and the last one of each window is sent.
+
+    Availability and string datapoints are sent unchanged.
+
+    A window is sent once grace seconds have passed since its end. Samples arriving for a window that
+    has already been sent are dropped and counted as late, see stats(). Memory use depends on the
+    amount of metrics, not on the amount of samples.
+    """
+    def __init__(self, target, window=10, summary='avg', extra_stats=(), counters='sum', grace=1.0):
+        for stat in ((summary,) if summary else ()) + tuple(extra_stats):
+            if stat not in STATS:
+                raise ValueError('Unknown statistic {0}, expected one of {1}'.format(stat, ', '.join(STATS)))
+        if counters not in ('sum', 'last'):
+            raise ValueError("counters must be 'sum' or 'last'")
+
+        self.target = target
+        self.window = window
+        self.summary = summary
+        self.extra_stats = tuple(extra_stats)
+        self.counters = counters
+        self.grace = grace
+        self.last_error = None
+
+        self._window_ms = int(window * 1000)
+        # Window starts per (metric_type, metric_id) -> [count, sum, min, max, last, last timestamp]
+        self._windows = {}
+        self._totals = {}
+        self._passthrough = []
+        # Windows starting before the watermark have been sent
+        self._watermark = 0
+        self._samples = 0
+        self._emitted = 0
+        self._late = 0
+        self._failures = 0
+        self._closed = False
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='hawkular-aggregator')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def push(self, metric_type, metric_id, value, timestamp=None):
+        """
+        Add a single sample, see HawkularMetricsClient.push
+        """
+        if timestamp is None:
+            timestamp = time_millis()
+        elif isinstance(timestamp, datetime):
+            timestamp = datetime_to_time_millis(timestamp)
+        self._add(metric_type, metric_id, [{'timestamp': timestamp, 'value': value}])
+
+    def put(self, data):
+        """
+        Add the samples of one or more metrics, see HawkularMetricsClient.put
+
+        :param data: A dict or a list of dicts created with create_metric(metric_type, metric_id, datapoints)
+        """
+        if not isinstance(data, list):
+            data = [data]
+
+        for d in data:
+            metric_type = d.get('type')
+            if metric_type is None:
+                raise HawkularError('Undefined MetricType')
+            self._add(metric_type, d['id'], d['data'])
+
+    def _add(self, metric_type, metric_id, datapoints):
+        if self._closed:
+            raise ValueError('Aggregator is closed')
+
+        with self._lock:
+            self._samples += len(datapoints)
+            if metric_type not in (MetricType.Gauge, MetricType.Counter):
+                self._passthrough.append(create_metric(metric_type, metric_id, datapoints))
+                return
+
+            windows = self._windows.setdefault((metric_type, metric_id), {})
+            for dp in datapoints:
+                # create_datapoint turns datetimes into strings
+                timestamp = int(dp['timestamp'])
+                start = timestamp - timestamp % self._window_ms
+                if start < self._watermark:
+                    self._late += 1
+                    continue
+
+                value = dp['value']
+                w = windows.get(start)
+                if w is None:
+                    windows[start] = [1, value, value, value, value, timestamp]
+                    continue
+
+                w[0] += 1
+                w[1] += value
+                if value < w[2]:
+                    w[2] = value
+                if value > w[3]:
+                    w[3] = value
+                if timestamp >= w[5]:
+                    w[4] = value
+                    w[5] = timestamp
+
+    def _gauge_values(self, metric_id, w):
+        count, total, low, high, last, _ = w
+        values = {'min': low, 'max': high, 'avg': float(total) / count, 'sum': total, 'count': count, 'last': last}
+        if self.summary:
+            yield metric_id, values[self.summary]
+        for stat in self.extra_stats:
+            yield '{0}.{1}'.format(metric_id, stat), values[stat]
+
+    def _collect(self, until=None):
+        """
+        Take the windows starting before until, all of them if None, and turn them into metric dicts
+        """
+        points = {}
+        with self._lock:
+            if until is None:
+                starts = [s for windows in self._windows.values() for s in windows]
+                until = max(starts) + self._window_ms if starts else self._watermark
+            self._watermark = max(self._watermark, until)
+            passthrough, self._passthrough = self._passthrough, []
+
+            for (metric_type, metric_id), windows in list(self._windows.items()):
+                for start in sorted(s for s in windows if s < until):
+                    w = windows.pop(start)
+                    if metric_type == MetricType.Counter:
+                        if self.counters == 'sum':
+                            total = self._totals.get(metric_id, 0) + w[1]
+                            self._totals[metric_id] = total
+                        else:
+                            total = w[4]
+                        points.setdefault((metric_type, metric_id), []).append(create_datapoint(total, start))
+                    else:
+                        for gauge_id, value in self._gauge_values(metric_id, w):
+                            points.setdefault((metric_type, gauge_id), []).append(create_datapoint(value, start))
+                if not windows:
+                    del self._windows[(metric_type, metric_id)]
+
+        return passthrough + [create_metric(t, i, d) for (t, i), d in points.items()]
+
+    def flush(self, everything=False):
+        """
+        Send the completed windows, or with everything=True also the ones still open. Samples for
+        windows sent early are counted as late.
+
+        :return: Amount of datapoints sent
+        """
+        return self._flush(everything, raise_errors=True)
+
+    def _flush(self, everything, raise_errors):
+        with self._flush_lock:
+            until = None
+            if not everything:
+                now = time_millis() - int(self.grace * 1000)
+                # Start of the window holding now, every window before it is complete
+                until = now - now % self._window_ms
+
+            metrics = self._collect(until)
+            if not metrics:
+                return 0
+
+            size = sum(len(m['data']) for m in metrics)
+            try:
+                self.target.put(metrics)
+            except Exception as e:
+                self.last_error = e
+                with self._lock:
+                    self._failures += 1
+                if raise_errors:
+                    raise
+                return 0
+
+            with self._lock:
+                self._emitted += size
+            return size
+
+    def _run(self):
+        while not self._closed:
+            # Wake up shortly after the grace period of the next window ends
+            now = time.time()
+            self._wakeup.wait(self.window - (now - self.grace) % self.window + 0.01)
+            if not self._closed:
+                self._flush(False, raise_errors=False)
+
+    def close(self):
+        """
+        Stop the background thread and send all the windows, including the open ones
+        """
+        if self._closed:
+            return
+
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        self.flush(everything=True)
+
+    def stats(self):
+        """
+        Returns a dict with the amount of samples received, datapoints sent, late samples dropped, failed
+        sends and the amount of metrics with open windows.
+        """
+        with self._lock:
+            return {'samples': self._samples,
+                    'emitted': self._emitted,
+                    'late': self._late,
+                    'failures': self._failures,
+                    'metrics': len(self._windows)}
@@ -0,0 +1,669 @@
+"""
+   Copyright 2015-2017 Red Hat, Inc. and/or its affiliates
+   and other contributors.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+   asyncio variants of the Hawkular clients, requires Python 3.5 or newer.
+"""
+import asyncio
+import collections
+import io
+import ssl
+import time
+import zlib
+
+from http.client import HTTPMessage
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from hawkular.client import HawkularBaseClient, HawkularError, encode_json, version_cache
+from hawkular.transport import HawkularConnectionPool, gzip_compress, endpoint_key
+from hawkular.metrics import HawkularMetricsClient, MetricType, create_metric, create_datapoint
+from hawkular.alerts.common import Status
+from hawkular.alerts.triggers import Trigger, FullTrigger, Condition, Dampening
+
+
+class AsyncConnectionPool(object):
+    """
+    Non-blocking HTTP/1.1 transport with keep-alive connections, keyed by (scheme, host, port).
+
+    At most limit requests are in flight at the same time, at most maxsize idle connections are
+    kept per host and connections idle for longer than idle_timeout seconds are closed. Compression
+    works as in HawkularConnectionPool.
+    """
+    accepted_codes = HawkularConnectionPool.accepted_codes
+
+    def __init__(self, limit=100, maxsize=10, idle_timeout=60, context=None, compression_threshold=None,
+                 compression_level=6, retry=None, circuit_breaker=None, timeout=None):
+        self.retry = retry
+        self.circuit_breaker = circuit_breaker
+        self.connect_timeout, self.read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        self.limit = limit
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.context = context
+        self.compression_threshold = compression_threshold
+        self.compression_level = compression_level
+        self._idle = collections.defaultdict(collections.deque)
+        self._semaphore = None
+
+    async def _acquire(self, key):
+        now = time.monotonic()
+        idle = self._idle[key]
+        while idle:
+            reader, writer, last_used = idle.pop()
+            if (self.idle_timeout is not None and now - last_used > self.idle_timeout) or reader.at_eof():
+                writer.close()
+                continue
+            return reader, writer, True
+
+        scheme, host, port = key
+        context = None
+        if scheme == 'https':
+            context = self.context or ssl.create_default_context()
+
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port, ssl=context),
+                                                self.connect_timeout)
+        return reader, writer, False
+
+    def _release(self, key, reader, writer):
+        idle = self._idle[key]
+        if len(idle) < self.maxsize:
+            idle.append((reader, writer, time.monotonic()))
+        else:
+            writer.close()
+
+    def idle_connections(self, scheme, host, port):
+        return len(self._idle[(scheme, host, port)])
+
+    def clear(self):
+        """
+        Close all the idle connections
+        """
+        idle, self._idle = self._idle, collections.defaultdict(collections.deque)
+        for connections in idle.values():
+            for _, writer, _ in connections:
+                writer.close()
+
+    @staticmethod
+    async def _read_response(reader, method, info=None):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('Connection closed by the server')
+
+        version, status, reason = (status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+        status = int(status)
+
+        headers = HTTPMessage()
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, value = line.decode('latin-1').split(':', 1)
+            headers[name.strip()] = value.strip()
+
+        keep_alive = version == 'HTTP/1.1' and (headers.get('Connection') or '').lower() != 'close'
+        if info is not None:
+            info.mark('wait')
+
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            payload = b''
+        elif (headers.get('Transfer-Encoding') or '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0].strip(), 16)
+                if size == 0:
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            payload = b''.join(chunks)
+        elif headers.get('Content-Length') is not None:
+            payload = await reader.readexactly(int(headers.get('Content-Length')))
+        else:
+            payload = await reader.read()
+            keep_alive = False
+
+        if info is not None:
+            info.bytes_in = len(payload)
+
+        if (headers.get('Content-Encoding') or '').lower() == 'gzip':
+            payload = zlib.decompress(payload, 16 + zlib.MAX_WBITS)
+
+        if info is not None:
+            info.mark('read')
+        return status, reason, headers, payload, keep_alive
+
+    async def request(self, method, url, headers, body=None, idempotent=None, info=None):
+        """
+        Send a request and read the whole response.
+
+        HTTPError is raised for response codes other than accepted_codes, connection failures are
+        raised as URLError.
+
+        :param idempotent: Whether the request can be safely retried, None decides by the method
+        :param info: RequestInfo receiving the timings, status and sizes, see hawkular.instrumentation
+        :return: Tuple of (status, headers, payload bytes)
+        """
+        key = endpoint_key(url)
+        attempt = 1
+        while True:
+            try:
+                response = await self._send(key, method, url, headers, body, info)
+            except URLError as e:
+                if self.retry is None or not self.retry.should_retry(method, e, attempt, idempotent):
+                    raise
+                await asyncio.sleep(self.retry.delay(attempt, e))
+                if info is not None:
+                    info.mark('backoff')
+                attempt += 1
+                continue
+
+            if self.retry is not None:
+                self.retry.succeeded(attempt)
+            return response
+
+    async def _send(self, key, method, url, headers, body, info=None):
+        if self.circuit_breaker is None:
+            return await self._request(key, method, url, headers, body, info)
+
+        self.circuit_breaker.before_request(key)
+        try:
+            response = await self._request(key, method, url, headers, body, info)
+        except Exception as e:
+            self.circuit_breaker.record(key, e)
+            raise
+        self.circuit_breaker.record(key)
+        return response
+
+    async def _request(self, key, method, url, headers, body, info=None):
+        parts = urlsplit(url)
+
+        path = parts.path or '/'
+        if parts.query:
+            path = '{0}?{1}'.format(path, parts.query)
+
+        headers = dict(headers)
+        headers.setdefault('Accept-Encoding', 'gzip')
+
+        if body and self.compression_threshold is not None and len(body) >= self.compression_threshold:
+            body = gzip_compress(body, self.compression_level)
+            headers['Content-Encoding'] = 'gzip'
+
+        lines = ['{0} {1} HTTP/1.1'.format(method, path)]
+        lines.extend('{0}: {1}'.format(k, v) for k, v in headers.items())
+        lines.append('Content-Length: {0}'.format(len(body) if body else 0))
+        head = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+        if info is not None:
+            info.attempts += 1
+            info.bytes_out = len(body) if body else 0
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+
+        async with self._semaphore:
+            if info is not None:
+                info.mark('queue')
+            while True:
+                reader, writer, reused = None, None, False
+                try:
+                    reader, writer, reused = await self._acquire(key)
+                    if info is not None:
+                        info.mark('connect')
+                    writer.write(head + body if body else head)
+                    await writer.drain()
+                    if info is not None:
+                        info.mark('send')
+                    status, reason, response_headers, payload, keep_alive = await asyncio.wait_for(
+                        self._read_response(reader, method, info), self.read_timeout)
+                    break
+                except (OSError, EOFError, ValueError, asyncio.TimeoutError) as e:
+                    # ValueError: malformed response, such as a truncated chunked body, like HTTPException
+                    if writer is not None:
+                        writer.close()
+                    # The server may have closed a keep-alive connection while it was idle,
+                    # try again with another one. Failing on a fresh connection or timing out is final.
+                    if reused and not isinstance(e, asyncio.TimeoutError):
+                        continue
+                    raise URLError(e)
+                except BaseException:
+                    # Cancelled or failed halfway, the connection can't be reused
+                    if writer is not None:
+                        writer.close()
+                    raise
+
+            if keep_alive:
+                self._release(key, reader, writer)
+            else:
+                writer.close()
+
+        if info is not None:
+            info.status = status
+        if status not in self.accepted_codes:
+            raise HTTPError(url, status, reason, response_headers, io.BytesIO(payload))
+
+        return status, response_headers, payload
+
+
+class AsyncHawkularBaseClient(HawkularBaseClient):
+    """
+    Base for the asyncio clients. The constructor parameters are the same as in HawkularBaseClient,
+    limit is the maximum amount of concurrent requests. The server version used to set legacy_api is
+    detected on the first request which needs it, using the same version cache as the blocking clients.
+    """
+    default_path = None
+
+    def __init__(self,
+                 tenant_id,
+                 host='localhost',
+                 port=8080,
+                 path=None,
+                 scheme='http',
+                 cafile=None,
+                 context=None,
+                 token=None,
+                 username=None,
+                 password=None,
+                 auto_set_legacy_api=True,
+                 authtoken=None,
+                 pool_size=10,
+                 idle_timeout=60,
+                 compression_threshold=None,
+                 compression_level=6,
+                 retry=None,
+                 circuit_breaker=None,
+                 timeout=None,
+                 version_cache_file=None,
+                 version_cache_ttl=3600,
+                 instrumentation=None,
+                 limit=100):
+        self.tenant_id = tenant_id
+        self.host = host
+        self.port = port
+        self.path = path if path is not None else self.default_path
+        self.cafile = cafile
+        self.scheme = scheme
+        self.context = context
+        self.token = token
+        self.username = username
+        self.password = password
+        self.legacy_api = False
+        self.server_version = None
+        self.authtoken = authtoken
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.compression_threshold = compression_threshold
+        self.compression_level = compression_level
+        self.retry = retry
+        self.circuit_breaker = circuit_breaker
+        self.timeout = timeout
+        self.version_cache_file = version_cache_file
+        self.version_cache_ttl = version_cache_ttl
+        self.instrumentation = instrumentation
+        self.limit = limit
+
+        self._version_detection = None if auto_set_legacy_api else False
+
+        self._setup_path()
+        self._setup_transport()
+
+    def _setup_transport(self):
+        context = self.context
+        if context is None and self.cafile is not None:
+            context = ssl.create_default_context(cafile=self.cafile)
+
+        self._pool = AsyncConnectionPool(limit=self.limit, maxsize=self.pool_size, idle_timeout=self.idle_timeout,
+                                         context=context, compression_threshold=self.compression_threshold,
+                                         compression_level=self.compression_level, retry=self.retry,
+                                         circuit_breaker=self.circuit_breaker, timeout=self.timeout)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        """
+        Close the idle connections of the client
+        """
+        self._pool.clear()
+
+    async def _http(self, url, method, data=None, decoder=None, parse_json=True, idempotent=None):
+        if data is not None and not isinstance(data, (str, bytes)):
+            data = encode_json(data)
+
+        body = None
+        if data:
+            body = data if isinstance(data, bytes) else data.encode('utf-8')
+
+        info = self._instrument(method, url, body)
+        error = None
+        try:
+            status, headers, payload = await self._pool.request(method, url, self._headers(), body, idempotent, info)
+
+            if parse_json:
+                if status == 200:
+                    data = json.loads(payload.decode('utf-8'), cls=decoder)
+                elif status == 204:
+                    data = {}
+            else:
+                data = payload.decode('utf-8')
+
+            if info is not None:
+                info.mark('decode')
+            return data
+
+        except Exception as e:
+            error = e
+            self._handle_error(e)
+
+        finally:
+            if info is not None:
+                self.instrumentation.finish(info, error)
+
+    async def _ensure_legacy_api(self):
+        """
+        Set legacy_api from the server version, the status is only queried once.
+        """
+        if self._version_detection is False:
+            return
+
+        url = self._get_base_url()
+        if self._version_detection is None:
+            version = version_cache.get(url, self.version_cache_ttl, self.version_cache_file)
+            if version is not None:
+                self._version_detection = False
+                self._set_version(version)
+                return
+            self._version_detection = asyncio.ensure_future(self.query_semantic_version())
+
+        try:
+            version = await self._version_detection
+        except Exception:
+            self._version_detection = None
+            raise
+
+        if self._version_detection is not False:
+            self._version_detection = False
+            version_cache.put(url, version, self.version_cache_file)
+        self._set_version(version)
+
+    async def query_semantic_version(self):
+        status_hash = await self.query_status()
+        try:
+            version = status_hash['Implementation-Version']
+            major, minor = map(int, version.split('.')[:2])
+        except Exception as e:
+            self._handle_error(e)
+        return major, minor
+
+    async def query_status(self):
+        return await self._get(self._get_status_url())
+
+
+class AsyncHawkularMetricsClient(AsyncHawkularBaseClient):
+    """
+    asyncio variant of HawkularMetricsClient, all the methods are coroutines with the same
+    parameters as in the blocking client.
+    """
+    default_path = 'hawkular/metrics'
+
+    # URL and parameter construction is shared with the blocking client
+    _get_url = HawkularMetricsClient._get_url
+    _get_metrics_single_url = HawkularMetricsClient._get_metrics_single_url
+    _get_metrics_raw_url = HawkularMetricsClient._get_metrics_raw_url
+    _get_metrics_stats_url = HawkularMetricsClient._get_metrics_stats_url
+    _get_metrics_tags_url = HawkularMetricsClient._get_metrics_tags_url
+    _get_tenants_url = HawkularMetricsClient._get_tenants_url
+    _get_single_id_url = HawkularMetricsClient._get_single_id_url
+    _time_options = staticmethod(HawkularMetricsClient._time_options)
+    _split_by_type = staticmethod(HawkularMetricsClient._split_by_type)
+    _transform_tags = staticmethod(HawkularMetricsClient._transform_tags)
+
+    async def put(self, data):
+        """
+        Send multiple different metric_ids to the server, see HawkularMetricsClient.put. The requests
+        of different metric types are sent concurrently.
+        """
+        await self._ensure_legacy_api()
+        r = self._split_by_type(data)
+
+        await asyncio.gather(*[self._post(self._get_metrics_raw_url(self._get_url(l)), r[l], parse_json=False,
+                                          idempotent=True) for l in r])
+
+    async def push(self, metric_type, metric_id, value, timestamp=None):
+        """
+        Pushes a single metric_id, datapoint combination to the server, see HawkularMetricsClient.push
+        """
+        await self.put(create_metric(metric_type, metric_id, create_datapoint(value, timestamp)))
+
+    async def query_metric(self, metric_type, metric_id, start=None, end=None, **query_options):
+        """
+        Query for metrics datapoints from the server, see HawkularMetricsClient.query_metric
+        """
+        await self._ensure_legacy_api()
+        self._time_options(query_options, start, end)
+
+        return await self._get(
+            self._get_metrics_raw_url(
+                self._get_metrics_single_url(metric_type, metric_id)),
+            **query_options)
+
+    async def query_metric_stats(self, metric_type, metric_id=None, start=None, end=None, bucketDuration=None, **query_options):
+        """
+        Query for metric aggregates from the server, see HawkularMetricsClient.query_metric_stats
+        """
+        await self._ensure_legacy_api()
+        self._time_options(query_options, start, end, bucketDuration)
+
+        if metric_id is not None:
+            url = self._get_metrics_stats_url(self._get_metrics_single_url(metric_type, metric_id))
+        else:
+            url = self._get_metrics_stats_url(self._get_url(metric_type))
+
+        return await self._get(url, **query_options)
+
+    async def query_metric_definition(self, metric_type, metric_id):
+        return await self._get(self._get_metrics_single_url(metric_type, metric_id))
+
+    async def query_metric_definitions(self, metric_type=None, id_filter=None, **tags):
+        params = {}
+
+        if id_filter is not None:
+            params['id'] = id_filter
+
+        if metric_type is not None:
+            params['type'] = MetricType.short(metric_type)
+
+        if len(tags) > 0:
+            params['tags'] = self._transform_tags(**tags)
+
+        return await self._get(self._get_url(), **params)
+
+    async def query_tag_values(self, metric_type=None, **tags):
+        tagql = self._transform_tags(**tags)
+
+        return await self._get(self._get_metrics_tags_url(self._get_url(metric_type)) + '/{}'.format(tagql))
+
+    async def create_metric_definition(self, metric_type, metric_id, **tags):
+        item = { 'id': metric_id }
+        if len(tags) > 0:
+            data_retention = tags.pop('dataRetention', None)
+            if data_retention is not None:
+                item['dataRetention'] = data_retention
+
+            if len(tags) > 0:
+                item['tags'] = tags
+
+        try:
+            await self._post(self._get_url(metric_type), item)
+        except HawkularError as e:
+            if e.code == 409:
+                return False
+            raise e
+
+        return True
+
+    async def query_metric_tags(self, metric_type, metric_id):
+        return await self._get(self._get_metrics_tags_url(self._get_metrics_single_url(metric_type, metric_id)))
+
+    async def update_metric_tags(self, metric_type, metric_id, **tags):
+        await self._put(self._get_metrics_tags_url(self._get_metrics_single_url(metric_type, metric_id)), tags, parse_json=False)
+
+    async def delete_metric_tags(self, metric_type, metric_id, **deleted_tags):
+        tags = self._transform_tags(**deleted_tags)
+        tags_url = self._get_metrics_tags_url(self._get_metrics_single_url(metric_type, metric_id)) + '/{0}'.format(tags)
+
+        await self._delete(tags_url)
+
+    async def query_tenants(self):
+        return await self._get(self._get_tenants_url())
+
+    async def create_tenant(self, tenant_id, retentions=None):
+        item = { 'id': tenant_id }
+        if retentions is not None:
+            item['retentions'] = retentions
+
+        await self._post(self._get_tenants_url(), item)
+
+    async def delete_tenant(self, tenant_id):
+        await self._delete(self._get_single_id_url(self._get_tenants_url(), tenant_id))
+
+
+class AsyncHawkularAlertsClient(AsyncHawkularBaseClient):
+    """
+    asyncio variant of HawkularAlertsClient. Trigger definitions are managed through the
+    triggers attribute, an AsyncAlertsTriggerClient.
+    """
+    default_path = 'hawkular/alerts'
+
+    def __init__(self, tenant_id='hawkular', **opts):
+        opts.setdefault('auto_set_legacy_api', False)
+        super(AsyncHawkularAlertsClient, self).__init__(tenant_id, **opts)
+        self.triggers = AsyncAlertsTriggerClient(self)
+
+    async def status(self):
+        """
+        Get the status of Alerting Service
+
+        :return: Status object
+        """
+        orig_dict = await self._get(self._service_url('status'))
+        orig_dict['implementation_version'] = orig_dict.pop('Implementation-Version')
+        orig_dict['built_from_git_sha1'] = orig_dict.pop('Built-From-Git-SHA1')
+        return Status(orig_dict)
+
+
+class AsyncAlertsTriggerClient(object):
+    """
+    asyncio variant of AlertsTriggerClient, the methods have the same parameters, including lazy,
+    and return values as in the blocking client.
+    """
+    def __init__(self, alerts_client):
+        self.__client = alerts_client
+
+    def __getattr__(self, name):
+        return getattr(self.__client, name)
+
+    async def get(self, tags=[], trigger_ids=[], lazy=False):
+        params = {}
+        if len(tags) > 0:
+            params['tags'] = ','.join(tags)
+
+        if len(trigger_ids) > 0:
+            params['triggerIds'] = ','.join(trigger_ids)
+
+        url = self._service_url('triggers', params=params)
+        if lazy:
+            return Trigger.list_to_view_list(await self._get(url))
+        return Trigger.list_to_object_list(await self._get(url))
+
+    async def create(self, trigger):
+        data = self._serialize_object(trigger)
+        if isinstance(trigger, (FullTrigger, FullTrigger.view_class())):
+            return FullTrigger(await self._post(self._service_url(['triggers', 'trigger']), data))
+        return Trigger(await self._post(self._service_url('triggers'), data))
+
+    async def update(self, trigger_id, full_trigger):
+        data = self._serialize_object(full_trigger)
+        return FullTrigger(await self._put(self._service_url(['triggers', 'trigger', trigger_id]), data))
+
+    async def delete(self, trigger_id):
+        await self._delete(self._service_url(['triggers', trigger_id]))
+
+    async def single(self, trigger_id, full=False, lazy=False):
+        if full:
+            cls = FullTrigger.view if lazy else FullTrigger
+            return cls(await self._get(self._service_url(['triggers', 'trigger', trigger_id])))
+        cls = Trigger.view if lazy else Trigger
+        return cls(await self._get(self._service_url(['triggers', trigger_id])))
+
+    async def group_members(self, group_id, include_orphans=False, lazy=False):
+        params = {'includeOrphans': str(include_orphans).lower()}
+        url = self._service_url(['triggers', 'groups', group_id, 'members'], params=params)
+        if lazy:
+            return Trigger.list_to_view_list(await self._get(url))
+        return Trigger.list_to_object_list(await self._get(url))
+
+    async def set_conditions(self, trigger_id, conditions, trigger_mode=None):
+        data = self._serialize_object(conditions)
+        if trigger_mode is not None:
+            url = self._service_url(['triggers', trigger_id, 'conditions', trigger_mode])
+        else:
+            url = self._service_url(['triggers', trigger_id, 'conditions'])
+
+        return Condition.list_to_object_list(await self._put(url, data))
+
+    async def conditions(self, trigger_id, lazy=False):
+        response = await self._get(self._service_url(['triggers', trigger_id, 'conditions']))
+        if lazy:
+            return Condition.list_to_view_list(response)
+        return Condition.list_to_object_list(response)
+
+    async def dampenings(self, trigger_id, trigger_mode=None):
+        if trigger_mode is not None:
+            url = self._service_url(['triggers', trigger_id, 'dampenings', 'mode', trigger_mode])
+        else:
+            url = self._service_url(['triggers', trigger_id, 'dampenings'])
+
+        return Dampening.list_to_object_list(await self._get(url))
+
+    async def create_dampening(self, trigger_id, dampening):
+        data = self._serialize_object(dampening)
+        url = self._service_url(['triggers', trigger_id, 'dampenings'])
+        return Dampening(await self._post(url, data))
+
+    async def update_dampening(self, trigger_id, dampening_id, dampening):
+        data = self._serialize_object(dampening)
+        url = self._service_url(['triggers', trigger_id, 'dampenings', dampening_id])
+        return Dampening(await self._put(url, data))
+
+    async def delete_dampening(self, trigger_id, dampening_id):
+        await self._delete(self._service_url(['triggers', trigger_id, 'dampenings', dampening_id]))
+
+    async def enable(self, trigger_ids=[]):
+        url = self._service_url(['triggers', 'enabled'], params={'triggerIds': ','.join(trigger_ids), 'enabled': 'true'})
+        await self._put(url, data=None, parse_json=False)
+
+    async def disable(self, trigger_ids=[]):
+        url = self._service_url(['triggers', 'enabled'], params={'triggerIds': ','.join(trigger_ids), 'enabled': 'false'})
+        await self._put(url, data=None, parse_json=False)
@@ -23,6 +23,7 @@ __all__ = ['HawkularAlertsClient',
            'Condition',
            'Dampening',
            'FullTrigger',
+           'TriggerSyncPlan',
            'GroupMemberInfo',
            'GroupConditionsInfo',
            'TriggerType',
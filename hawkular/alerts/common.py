@@ -55,7 +55,15 @@ class HawkularAlertsClient(HawkularBaseClient):
                  username=None,
                  password=None,
                  auto_set_legacy_api=True,
-                 authtoken=None
+                 authtoken=None,
+                 pool_size=10,
+                 idle_timeout=60,
+                 compression_threshold=None,
+                 compression_level=6,
+                 retry=None,
+                 circuit_breaker=None,
+                 timeout=None,
+                 instrumentation=None
         """
         prop_defaults = {
             "tenant_id": 'hawkular',
@@ -69,12 +77,21 @@ class HawkularAlertsClient(HawkularBaseClient):
             "username": None,
             "password": None,
             "authtoken": None,
+            "pool_size": 10,
+            "idle_timeout": 60,
+            "compression_threshold": None,
+            "compression_level": 6,
+            "retry": None,
+            "circuit_breaker": None,
+            "timeout": None,
+            "instrumentation": None,
         }
 
         for (prop, default) in prop_defaults.items():
             setattr(self, prop, opts.get(prop, default))
 
         super(HawkularAlertsClient, self)._setup_path()
+        super(HawkularAlertsClient, self)._setup_transport()
 
         self.triggers = AlertsTriggerClient(self)
 
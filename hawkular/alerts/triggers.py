@@ -14,7 +14,14 @@
    See the License for the specific language governing permissions and
    limitations under the License.
 """
-from hawkular.client import ApiObject
+import hashlib
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from hawkular.client import ApiObject, HawkularError, map_concurrently
 
 class Trigger(ApiObject):
     __slots__ = [
@@ -48,6 +55,11 @@ class FullTrigger(ApiObject):
     __slots__ = [
         'trigger', 'dampenings', 'conditions'
     ]
+    nested_objects = {
+        'trigger': (Trigger, False),
+        'dampenings': (Dampening, True),
+        'conditions': (Condition, True)
+    }
 
     def __init__(self, dictionary=dict()):
         udict = FullTrigger.transform_dict_to_underscore(dictionary)
@@ -65,6 +77,9 @@ class GroupConditionsInfo(ApiObject):
     __slots__ = [
         'conditions', 'data_id_member_map'
     ]
+    nested_objects = {
+        'conditions': (Condition, True)
+    }
 
     def __init__(self, dictionary=dict()):
         ApiObject.__init__(self, dictionary)
@@ -120,21 +135,99 @@ class Severity:
     HIGH = 'HIGH'
     CRITICAL = 'CRITICAL'
 
+class TriggerSyncPlan(object):
+    """
+    Changes needed to bring the triggers of the server in line with the desired triggers, as trigger
+    id lists. Once applied, errors maps the ids of the triggers which could not be changed to the error.
+    """
+    def __init__(self):
+        self.create = []
+        self.update = []
+        self.delete = []
+        self.unchanged = []
+        self.errors = {}
+
+    def changed(self):
+        return bool(self.create or self.update or self.delete)
+
+    def __str__(self):
+        lines = ['+ ' + i for i in self.create]
+        lines.extend('~ ' + i for i in self.update)
+        lines.extend('- ' + i for i in self.delete)
+        lines.append('{0} to create, {1} to update, {2} to delete, {3} unchanged'.format(
+            len(self.create), len(self.update), len(self.delete), len(self.unchanged)))
+        return '\n'.join(lines)
+
+# Assigned by the server, never part of a desired definition
+_SERVER_FIELDS = frozenset(['conditionId', 'dampeningId', 'conditionSetSize', 'conditionSetIndex'])
+
+def _canonical(value):
+    if isinstance(value, dict):
+        return dict((k, _canonical(v)) for k, v in value.items() if v is not None)
+    if isinstance(value, list):
+        return [_canonical(v) for v in value]
+    if isinstance(value, int) and not isinstance(value, bool):
+        # The server returns 90.0 for a threshold of 90
+        return float(value)
+    return value
+
+def _normalize(full):
+    """
+    Canonical form of a decoded FullTrigger: no server assigned fields, nulls or integers and
+    the conditions and dampenings bound to the trigger
+    """
+    full = _canonical(full)
+    trigger = full.get('trigger') or {}
+    normalized = {'trigger': trigger}
+    for key in ('conditions', 'dampenings'):
+        items = []
+        for o in full.get(key) or []:
+            o = dict((k, v) for k, v in o.items() if k not in _SERVER_FIELDS)
+            o['triggerId'] = trigger.get('id')
+            items.append(o)
+        normalized[key] = items
+    return normalized
+
+def _project(current, desired):
+    """
+    Restrict a normalized current trigger to the fields set in the normalized desired one, so the
+    defaults filled in by the server don't count as differences
+    """
+    projected = {'trigger': dict((k, v) for k, v in current['trigger'].items() if k in desired['trigger'])}
+    for key in ('conditions', 'dampenings'):
+        fields = set(k for o in desired[key] for k in o)
+        projected[key] = [dict((k, v) for k, v in o.items() if k in fields) for o in current[key]]
+    return projected
+
+def _content_hash(normalized):
+    """
+    Hash of a normalized FullTrigger which does not depend on key or condition order
+    """
+    def dump(o):
+        return json.dumps(o, sort_keys=True, separators=(',', ':'))
+
+    content = dict(normalized)
+    for key in ('conditions', 'dampenings'):
+        content[key] = sorted(dump(o) for o in normalized[key])
+    return hashlib.sha1(dump(content).encode('utf-8')).hexdigest()
+
 class AlertsTriggerClient(object):
 
     def __init__(self, alerts_client):
         self.__client = alerts_client
-        pass
+        self._import_supported = None
+        self._export_supported = None
 
     def __getattr__(self, name):
         return getattr(self.__client, name)
 
-    def get(self, tags=[], trigger_ids=[]):
+    def get(self, tags=[], trigger_ids=[], lazy=False):
         """
         Get triggers with optional filtering. Querying without parameters returns all the trigger definitions.
 
         :param tags: Fetch triggers with matching tags only. Use * to match all values.
         :param trigger_ids: List of triggerIds to fetch
+        :param lazy: Return TriggerViews which convert the fields only when accessed, see ApiObjectView
         """
         params = {}
         if len(tags) > 0:
@@ -145,6 +238,8 @@ class AlertsTriggerClient(object):
 
         url = self._service_url('triggers', params=params)
         triggers_dict = self._get(url)
+        if lazy:
+            return Trigger.list_to_view_list(triggers_dict)
         return Trigger.list_to_object_list(triggers_dict)
 
     def create(self, trigger):
@@ -155,7 +250,7 @@ class AlertsTriggerClient(object):
         :return: The created trigger
         """
         data = self._serialize_object(trigger)
-        if isinstance(trigger, FullTrigger):
+        if isinstance(trigger, (FullTrigger, FullTrigger.view_class())):
             returned_dict = self._post(self._service_url(['triggers', 'trigger']), data)
             return FullTrigger(returned_dict)
         else:
@@ -174,6 +269,148 @@ class AlertsTriggerClient(object):
         rdict = self._put(self._service_url(['triggers', 'trigger', trigger_id]), data)
         return FullTrigger(rdict)
 
+    def provision(self, full_triggers, chunk_size=100, max_workers=4):
+        """
+        Create or update many full triggers, replacing existing definitions with the same trigger ids.
+
+        The triggers are sent in chunks of chunk_size to the import endpoint of the server, with at
+        most max_workers requests in flight. The triggers of a chunk the server rejects are sent again
+        one at a time to find out which of them failed, as are all triggers if the server has no
+        import endpoint.
+
+        :param full_triggers: List of FullTriggers to be provisioned
+        :param chunk_size: Amount of triggers per import request
+        :param max_workers: Maximum amount of parallel requests
+        :return: dict of trigger id -> None if provisioned, the Exception otherwise
+        """
+        full_triggers = list(full_triggers)
+        results = dict((t.trigger.id, None) for t in full_triggers)
+        single = []
+
+        if self._import_supported is False:
+            single = full_triggers
+        else:
+            chunks = [full_triggers[i:i + chunk_size] for i in range(0, len(full_triggers), chunk_size)]
+            for chunk, (_, error) in zip(chunks, map_concurrently(self._import, chunks, max_workers)):
+                if error is None:
+                    continue
+                if isinstance(error, HawkularError) and error.code in (400, 404, 405):
+                    single.extend(chunk)
+                else:
+                    for t in chunk:
+                        results[t.trigger.id] = error
+
+        for t, (_, error) in zip(single, map_concurrently(self._create_or_update, single, max_workers)):
+            results[t.trigger.id] = error
+
+        return results
+
+    def _import(self, full_triggers):
+        data = self._serialize_object({'triggers': full_triggers})
+        try:
+            # Existing definitions are overwritten, so sending the chunk twice does no harm
+            self._post(self._service_url(['import', 'all']), data, idempotent=True)
+        except HawkularError as e:
+            if e.code in (404, 405):
+                self._import_supported = False
+            raise
+        self._import_supported = True
+
+    def _create_or_update(self, full_trigger):
+        try:
+            return self.update(full_trigger.trigger.id, full_trigger)
+        except HawkularError as e:
+            if e.code != 404:
+                raise
+        return self.create(full_trigger)
+
+    def sync(self, full_triggers, prune_tags=None, dry_run=False, chunk_size=100, max_workers=4):
+        """
+        Make the triggers of the server match full_triggers, changing only what differs.
+
+        The current definitions are fetched in bulk and compared to the desired ones by a content hash of
+        the trigger, its conditions and its dampenings. Fields left unset in a desired definition are not
+        compared, so the defaults filled in by the server don't cause updates. New and changed triggers are
+        sent with provision, unchanged ones are left alone.
+
+        Triggers on the server are only deleted when prune_tags is given: those having all of these tags
+        which are not in full_triggers are deleted. Group member triggers are never deleted.
+
+        :param full_triggers: List of desired FullTriggers
+        :param prune_tags: dict of tags selecting the triggers managed by this call
+        :param dry_run: Only compute the changes without applying them
+        :param chunk_size: Amount of triggers per import request
+        :param max_workers: Maximum amount of parallel requests
+        :return: TriggerSyncPlan with the changes made or, with dry_run, to be made
+        """
+        desired = dict((t.trigger.id, _normalize(json.loads(self._serialize_object(t)))) for t in full_triggers)
+        by_id = dict((t.trigger.id, t) for t in full_triggers)
+        current = self._current_definitions(list(desired), prune_tags is not None, max_workers)
+
+        plan = TriggerSyncPlan()
+        for trigger_id, wanted in desired.items():
+            existing = current.get(trigger_id)
+            if existing is None:
+                plan.create.append(trigger_id)
+            elif _content_hash(wanted) != _content_hash(_project(existing, wanted)):
+                plan.update.append(trigger_id)
+            else:
+                plan.unchanged.append(trigger_id)
+
+        if prune_tags is not None:
+            for trigger_id, existing in current.items():
+                trigger = existing['trigger']
+                tags = trigger.get('tags') or {}
+                if trigger_id not in desired and not trigger.get('memberOf') and \
+                        all(tags.get(k) == v for k, v in prune_tags.items()):
+                    plan.delete.append(trigger_id)
+
+        for ids in (plan.create, plan.update, plan.delete, plan.unchanged):
+            ids.sort()
+
+        if dry_run:
+            return plan
+
+        changes = [by_id[i] for i in plan.create + plan.update]
+        if changes:
+            results = self.provision(changes, chunk_size=chunk_size, max_workers=max_workers)
+            plan.errors.update((i, e) for i, e in results.items() if e is not None)
+
+        for trigger_id, (_, error) in zip(plan.delete, map_concurrently(self.delete, plan.delete, max_workers)):
+            if error is not None:
+                plan.errors[trigger_id] = error
+
+        return plan
+
+    def _current_definitions(self, trigger_ids, all_triggers, max_workers):
+        """
+        Fetch the full definitions of trigger_ids, or of every trigger with all_triggers, as a dict of
+        trigger id -> normalized FullTrigger dict
+        """
+        if self._export_supported is not False:
+            try:
+                definitions = self._get(self._service_url('export'))
+                self._export_supported = True
+                return dict((t['trigger']['id'], _normalize(t)) for t in definitions.get('triggers') or [])
+            except HawkularError as e:
+                if e.code not in (404, 405):
+                    raise
+                self._export_supported = False
+
+        existing = set(t['id'] for t in self._get(self._service_url('triggers')))
+        if not all_triggers:
+            existing.intersection_update(trigger_ids)
+
+        existing = sorted(existing)
+        url = lambda i: self._service_url(['triggers', 'trigger', i])
+        results = map_concurrently(lambda i: self._get(url(i)), existing, max_workers)
+        definitions = {}
+        for trigger_id, (full, error) in zip(existing, results):
+            if error is not None:
+                raise error
+            definitions[trigger_id] = _normalize(full)
+        return definitions
+
     def delete(self, trigger_id):
         """
         Delete an existing standard or group member trigger.
@@ -184,20 +421,21 @@ class AlertsTriggerClient(object):
         """
         self._delete(self._service_url(['triggers', trigger_id]))
 
-    def single(self, trigger_id, full=False):
+    def single(self, trigger_id, full=False, lazy=False):
         """
         Get an existing (full) trigger definition.
 
         :param trigger_id: Trigger definition id to be retrieved.
         :param full: Fetch the full definition, default is False.
+        :param lazy: Return a view which converts the fields only when accessed, see ApiObjectView
         :return: Trigger of FullTrigger depending on the full parameter value.
         """
         if full:
             returned_dict = self._get(self._service_url(['triggers', 'trigger', trigger_id]))
-            return FullTrigger(returned_dict)
+            return FullTrigger.view(returned_dict) if lazy else FullTrigger(returned_dict)
         else:
             returned_dict = self._get(self._service_url(['triggers', trigger_id]))
-            return Trigger(returned_dict)
+            return Trigger.view(returned_dict) if lazy else Trigger(returned_dict)
 
     def create_group(self, trigger):
         """
@@ -209,16 +447,19 @@ class AlertsTriggerClient(object):
         data = self._serialize_object(trigger)
         return Trigger(self._post(self._service_url(['triggers', 'groups']), data))
 
-    def group_members(self, group_id, include_orphans=False):
+    def group_members(self, group_id, include_orphans=False, lazy=False):
         """
         Find all group member trigger definitions
 
         :param group_id: group trigger id
         :param include_orphans: If True, include orphan members
+        :param lazy: Return TriggerViews which convert the fields only when accessed, see ApiObjectView
         :return: list of asociated group members as trigger objects
         """
         params = {'includeOrphans': str(include_orphans).lower()}
         url = self._service_url(['triggers', 'groups', group_id, 'members'], params=params)
+        if lazy:
+            return Trigger.list_to_view_list(self._get(url))
         return Trigger.list_to_object_list(self._get(url))
 
     def update_group(self, group_id, trigger):
@@ -298,14 +539,17 @@ class AlertsTriggerClient(object):
         response = self._put(url, data)
         return Condition.list_to_object_list(response)
 
-    def conditions(self, trigger_id):
+    def conditions(self, trigger_id, lazy=False):
         """
         Get all conditions for a specific trigger.
 
         :param trigger_id: Trigger definition id to be retrieved
+        :param lazy: Return ConditionViews which convert the fields only when accessed, see ApiObjectView
         :return: list of condition objects
         """
         response = self._get(self._service_url(['triggers', trigger_id, 'conditions']))
+        if lazy:
+            return Condition.list_to_view_list(response)
         return  Condition.list_to_object_list(response)
 
     def dampenings(self, trigger_id, trigger_mode=None):
@@ -0,0 +1,148 @@
+"""
+   Copyright 2015-2017 Red Hat, Inc. and/or its affiliates
+   and other contributors.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+import collections
+import copy
+import threading
+import time
+
+
+class TTLCache(object):
+    """
+    Thread-safe cache where entries expire ttl seconds after they were stored and the least
+    recently used entries are evicted when there are more than maxsize of them.
+
+    Keys are tuples. Values are copied on the way in and out, so callers can't modify the
+    cached data.
+    """
+    def __init__(self, ttl=60, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key, loader):
+        """
+        Return the cached value of key, calling loader() to fetch and store it when missing or expired.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                # Reinsert to mark as most recently used
+                self._entries[key] = self._entries.pop(key)
+                self._hits += 1
+                return copy.deepcopy(entry[1])
+            self._misses += 1
+
+        value = loader()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + self.ttl, copy.deepcopy(value))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, prefix=()):
+        """
+        Remove the entries whose key starts with prefix, everything by default.
+        """
+        n = len(prefix)
+        with self._lock:
+            for key in [k for k in self._entries if k[:n] == prefix]:
+                del self._entries[key]
+
+    def stats(self):
+        """
+        Returns a dict with the amount of hits, misses, evictions and cached entries
+        """
+        with self._lock:
+            return {'hits': self._hits,
+                    'misses': self._misses,
+                    'evictions': self._evictions,
+                    'size': len(self._entries)}
+
+
+class BucketCache(object):
+    """
+    Thread-safe store of completed stats buckets. Every series (metric or tag filter, bucket duration
+    and query options) maps bucket start timestamps to the bucket returned by the server, or to None
+    when the server returned nothing for it. Completed buckets never change, so there is no expiration,
+    the least recently used series are evicted when there are more than maxsize of them.
+
+    grace is the amount of seconds a bucket must have been closed before it is considered completed,
+    to leave room for late datapoints.
+    """
+    def __init__(self, maxsize=256, grace=60):
+        self.maxsize = maxsize
+        self.grace = grace
+        self._series = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key, starts):
+        """
+        Returns the cached buckets of the given bucket starts as a dict, stopping at the first one missing
+        """
+        found = {}
+        with self._lock:
+            series = self._series.get(key)
+            if series is not None:
+                self._series[key] = self._series.pop(key)
+                for s in starts:
+                    if s not in series:
+                        break
+                    found[s] = series[s]
+
+            self._hits += len(found)
+            self._misses += len(starts) - len(found)
+
+        return copy.deepcopy(found)
+
+    def put(self, key, buckets):
+        """
+        Store completed buckets
+
+        :param buckets: dict of bucket start -> bucket or None
+        """
+        with self._lock:
+            series = self._series.pop(key, None) or {}
+            series.update(copy.deepcopy(buckets))
+            self._series[key] = series
+            while len(self._series) > self.maxsize:
+                self._series.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def stats(self):
+        """
+        Returns a dict with the amount of bucket hits and misses, cached series and cached buckets
+        """
+        with self._lock:
+            return {'hits': self._hits,
+                    'misses': self._misses,
+                    'series': len(self._series),
+                    'buckets': sum(len(s) for s in self._series.values())}
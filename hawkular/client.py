@@ -18,6 +18,10 @@ from __future__ import unicode_literals
 
 import codecs
 import base64
+import os
+import ssl
+import threading
+import time
 
 try:
     import simplejson as json
@@ -26,23 +30,173 @@ except ImportError:
 
 try:
     # Python 3
-    from urllib.request import Request, urlopen, build_opener, install_opener, HTTPErrorProcessor
+    from urllib.request import Request, HTTPErrorProcessor
     from urllib.error import HTTPError, URLError
     from urllib.parse import quote, urlencode, quote_plus
+    from queue import Queue, Empty
 except ImportError:
     # Fall back to Python 2's urllib2
-    from urllib2 import Request, urlopen, URLError, HTTPError, HTTPErrorProcessor, build_opener, install_opener
+    from urllib2 import Request, URLError, HTTPError, HTTPErrorProcessor
     from urllib import quote, urlencode, quote_plus
+    from Queue import Queue, Empty
+
+from hawkular.transport import HawkularConnectionPool, CircuitOpenError
 
 
 class ApiJsonEncoder(json.JSONEncoder):
     def default(self, obj):
-        if isinstance(obj, ApiObject):
+        if isinstance(obj, (ApiObject, ApiObjectView)):
             return obj.to_json_object()
         else:
             return json.JSONEncoder.default(self, obj)
 
 
+def _encode_default(obj):
+    if isinstance(obj, (ApiObject, ApiObjectView)):
+        return obj.to_json_object()
+    raise TypeError('{0} is not JSON serializable'.format(type(obj).__name__))
+
+# Pick the fastest available JSON encoder once
+try:
+    import orjson
+    JSON_ENCODER = 'orjson'
+except ImportError:
+    try:
+        import ujson
+        # Older ujson releases do not support default
+        ujson.dumps({}, default=_encode_default, escape_forward_slashes=False)
+        JSON_ENCODER = 'ujson'
+    except (ImportError, TypeError):
+        JSON_ENCODER = 'json'
+
+def encode_json(o):
+    """
+    Serialize o (which may contain ApiObjects) to compact JSON. Returns bytes or str, depending on
+    the encoder in use. Payloads the fast encoders refuse, such as integers over 64 bits, are
+    encoded with the standard library.
+    """
+    try:
+        if JSON_ENCODER == 'orjson':
+            return orjson.dumps(o, default=_encode_default, option=orjson.OPT_NON_STR_KEYS)
+        elif JSON_ENCODER == 'ujson':
+            return ujson.dumps(o, default=_encode_default, escape_forward_slashes=False)
+    except (TypeError, OverflowError):
+        pass
+    return json.dumps(o, cls=ApiJsonEncoder, separators=(',', ':'))
+
+
+def iter_json_array(fp, decoder=None, chunk_size=65536):
+    """
+    Incrementally decode a JSON array from the file-like object fp, yielding its elements one by one.
+    Only the element being decoded and one chunk of input are kept in memory. An empty input yields
+    nothing, any other top level value than an array is yielded as a single element.
+
+    :param fp: File-like object returning utf-8 encoded bytes
+    :param decoder: Optional JSONDecoder class
+    :param chunk_size: Amount of bytes read at a time
+    """
+    decoder = (decoder or json.JSONDecoder)()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buf = ''
+    pos = 0
+    eof = False
+    started = False
+
+    while True:
+        need_more = False
+        while pos < len(buf) and buf[pos] in ' \t\r\n':
+            pos += 1
+
+        if pos == len(buf):
+            if eof:
+                if started:
+                    raise ValueError('Unterminated JSON array')
+                return
+            need_more = True
+        elif not started:
+            if buf[pos] != '[':
+                # Not an array, decode the rest of the document as a single value
+                yield decoder.decode(buf[pos:] + text.decode(fp.read(), final=True))
+                return
+            started = True
+            pos += 1
+        elif buf[pos] == ']':
+            return
+        elif buf[pos] == ',':
+            pos += 1
+        else:
+            try:
+                element, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise
+                need_more = True
+            else:
+                # The chunk may end in the middle of a number, only trust values followed by a separator
+                if not eof and (end == len(buf) or buf[end] not in ', \t\r\n]'):
+                    need_more = True
+                else:
+                    pos = end
+                    yield element
+
+        if need_more:
+            chunk = fp.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + text.decode(chunk, final=eof)
+            pos = 0
+
+
+class _ResponseStream(object):
+    """
+    Iterator over the elements of a streamed response. The response is closed, handing the connection
+    back to the pool, and the request is recorded in the instrumentation once the elements are
+    exhausted, decoding fails, close() is called or the iterator is garbage collected.
+    """
+    def __init__(self, res, elements, instrumentation=None, info=None):
+        self._res = res
+        self._elements = elements
+        self._instrumentation = instrumentation
+        self._info = info
+        self._done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+        try:
+            return next(self._elements)
+        except StopIteration:
+            self._finish(None)
+            raise
+        except Exception as e:
+            self._finish(e)
+            raise
+
+    next = __next__
+
+    def close(self):
+        self._finish(None)
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def _finish(self, error):
+        if self._done:
+            return
+        self._done = True
+        self._res.close()
+        info = self._info
+        if info is not None:
+            info.mark('read')
+            info.bytes_in = self._res.bytes_read
+            self._instrumentation.finish(info, error)
+
+
 class HawkularError(HTTPError):
     pass
 
@@ -51,6 +205,10 @@ class HawkularConnectionError(URLError):
     pass
 
 
+class HawkularCircuitOpenError(HawkularConnectionError):
+    pass
+
+
 class HawkularStatusError(ValueError):
     pass
 
@@ -68,44 +226,79 @@ class HawkularHTTPErrorProcessor(HTTPErrorProcessor):
     https_response = http_response
 
 
+# Memoized key conversions of ApiObject, bounded in case of arbitrary keys
+_KEY_CACHE_SIZE = 10000
+_camelcase_keys = {}
+_underscore_keys = {}
+
 class ApiObject(object):
 
     __slots__ = []
 
     defaults = dict()
 
+    # Attributes holding other ApiObjects, name -> (class, is_list), used by the views
+    nested_objects = dict()
+
+    @classmethod
+    def _slot_table(cls):
+        """
+        Returns a tuple of (slot, camelCase name, default) for every slot, built once per class
+        """
+        table = cls.__dict__.get('_slot_table_cache')
+        if table is None:
+            table = tuple((slot, ApiObject._to_camelcase(slot), cls.defaults.get(slot)) for slot in cls.__slots__)
+            setattr(cls, '_slot_table_cache', table)
+        return table
+
     def __init__(self, dictionary=dict()):
         udict = ApiObject.transform_dict_to_underscore(dictionary)
-        for k in self.__slots__:
-            setattr(self, k, udict.get(k,self.defaults.get(k)))
+        get = udict.get
+        for k, _, default in self._slot_table():
+            setattr(self, k, get(k, default))
 
     def to_json_object(self):
         dictionary = {}
-        for attribute in self.__slots__:
-            if hasattr(self,attribute):
-                dictionary[attribute] = getattr(self,attribute)
-        return ApiObject.transform_dict_to_camelcase(dictionary)
+        for attribute, camel, _ in self._slot_table():
+            value = getattr(self, attribute, None)
+            if value is not None:
+                dictionary[camel] = value
+        return dictionary
 
     @staticmethod
     def _to_camelcase(word):
-        s = ''.join(x.capitalize() or '_' for x in word.split('_'))
-        return ''.join([s[0].lower(), s[1:]])
+        camel = _camelcase_keys.get(word)
+        if camel is None:
+            s = ''.join(x.capitalize() or '_' for x in word.split('_'))
+            camel = ''.join([s[0].lower(), s[1:]])
+            if len(_camelcase_keys) < _KEY_CACHE_SIZE:
+                _camelcase_keys[word] = camel
+        return camel
 
     @staticmethod
     def _to_underscore(word):
-        return ''.join(["_" + c.lower() if c.isupper() else c for c in word]).strip('_')
+        underscore = _underscore_keys.get(word)
+        if underscore is None:
+            underscore = ''.join(["_" + c.lower() if c.isupper() else c for c in word]).strip('_')
+            if len(_underscore_keys) < _KEY_CACHE_SIZE:
+                _underscore_keys[word] = underscore
+        return underscore
 
     @staticmethod
     def transform_dict_to_camelcase(dictionary):
         if dictionary is None:
             return dict()
-        return dict((ApiObject._to_camelcase(k), v) for k, v in dictionary.items() if v is not None)
+        keys = _camelcase_keys
+        return dict((keys[k] if k in keys else ApiObject._to_camelcase(k), v)
+                    for k, v in dictionary.items() if v is not None)
 
     @staticmethod
     def transform_dict_to_underscore(dictionary):
         if dictionary is None:
             return dict()
-        return dict((ApiObject._to_underscore(k), v) for k, v in dictionary.items() if v is not None)
+        keys = _underscore_keys
+        return dict((keys[k] if k in keys else ApiObject._to_underscore(k), v)
+                    for k, v in dictionary.items() if v is not None)
 
     @classmethod
     def list_to_object_list(cls, o):
@@ -113,6 +306,198 @@ class ApiObject(object):
             return [cls(ob) for ob in o]
         return []
 
+    @classmethod
+    def view_class(cls):
+        """
+        Returns the ApiObjectView subclass with the attributes of this class, created once per class
+        """
+        view = cls.__dict__.get('_view_class_cache')
+        if view is None:
+            namespace = {'__slots__': (), 'object_class': cls}
+            for slot, camel, default in cls._slot_table():
+                namespace[slot] = ApiObjectView._field(slot, camel, default, cls.nested_objects.get(slot))
+            view = type(str(cls.__name__ + 'View'), (ApiObjectView,), namespace)
+            setattr(cls, '_view_class_cache', view)
+        return view
+
+    @classmethod
+    def view(cls, dictionary):
+        """
+        Wrap a decoded JSON object in a lazy view instead of converting it, see ApiObjectView
+        """
+        return cls.view_class()(dictionary)
+
+    @classmethod
+    def list_to_view_list(cls, o):
+        if o is not None:
+            view = cls.view_class()
+            return [view(ob) for ob in o]
+        return []
+
+
+class ApiObjectView(object):
+    """
+    Lazy alternative to an ApiObject: wraps the decoded JSON dict without copying it and converts a
+    field only when its attribute is read, nested objects become views as well. Assigned attributes
+    are written to the wrapped dict. Create views with the view() and list_to_view_list() class
+    methods of the ApiObject classes, to_object() converts a view to the full object.
+    """
+    __slots__ = ('_raw', '_views')
+
+    object_class = ApiObject
+
+    def __init__(self, dictionary):
+        self._raw = dictionary if dictionary is not None else {}
+        self._views = None
+
+    @staticmethod
+    def _field(name, camel, default, nested):
+        if nested is None:
+            def get(self):
+                value = self._raw.get(camel)
+                if value is None and camel != name:
+                    value = self._raw.get(name)
+                return default if value is None else value
+        else:
+            def get(self):
+                return self._nested(name, camel, nested)
+
+        def set(self, value):
+            self._raw[camel] = value
+            if self._views is not None:
+                self._views.pop(name, None)
+
+        return property(get, set)
+
+    def _value(self, name, camel):
+        value = self._raw.get(camel)
+        if value is None and camel != name:
+            value = self._raw.get(name)
+        return value
+
+    def _nested(self, name, camel, nested):
+        views = self._views
+        if views is not None and name in views:
+            return views[name]
+
+        value = self._value(name, camel)
+        object_class, is_list = nested
+        if is_list:
+            value = object_class.list_to_view_list(value)
+        elif value is not None:
+            value = object_class.view(value)
+
+        if views is None:
+            views = self._views = {}
+        views[name] = value
+        return value
+
+    def to_json_object(self):
+        dictionary = {}
+        for name, camel, _ in self.object_class._slot_table():
+            if self._views is not None and name in self._views:
+                value = self._views[name]
+            else:
+                value = self._value(name, camel)
+            if value is not None:
+                dictionary[camel] = value
+        return dictionary
+
+    def to_object(self):
+        return self.object_class(self._raw)
+
+def map_concurrently(func, items, max_workers):
+    """
+    Call func for every item using at most max_workers threads.
+
+    :return: A list of (result, error) tuples in the same order as items, error is None on success
+    """
+    results = [None] * len(items)
+    queue = Queue()
+    for i in range(len(items)):
+        queue.put(i)
+
+    def worker():
+        while True:
+            try:
+                i = queue.get_nowait()
+            except Empty:
+                return
+            try:
+                results[i] = (func(items[i]), None)
+            except Exception as e:
+                results[i] = (None, e)
+
+    threads = [threading.Thread(target=worker) for _ in range(min(max(max_workers, 1), len(items)))]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    for t in threads:
+        t.join()
+
+    return results
+
+class VersionCache(object):
+    """
+    Process-wide cache of the server versions detected by the clients, keyed by the base url. Entries
+    are used for ttl seconds. With a path the entries are also stored in a small JSON file, so that
+    new processes can skip the detection as well.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+
+    @staticmethod
+    def _load(path):
+        try:
+            with open(path) as f:
+                versions = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+        # Anything else than an object is as unusable as an unreadable file
+        return versions if isinstance(versions, dict) else {}
+
+    def get(self, url, ttl, path=None):
+        """
+        Returns the cached (major, minor) version of the server at url, None if unknown or expired
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._versions.get(url)
+        if (entry is None or now - entry[2] > ttl) and path is not None:
+            entry = self._load(path).get(url)
+            if entry is not None:
+                with self._lock:
+                    self._versions[url] = entry
+
+        if entry is None or now - entry[2] > ttl:
+            return None
+        return entry[0], entry[1]
+
+    def put(self, url, version, path=None):
+        entry = [version[0], version[1], time.time()]
+        with self._lock:
+            self._versions[url] = entry
+
+        if path is not None:
+            versions = self._load(path)
+            versions[url] = entry
+            tmp = '{0}.{1}.tmp'.format(path, os.getpid())
+            try:
+                with open(tmp, 'w') as f:
+                    json.dump(versions, f)
+                os.rename(tmp, path)
+            except (IOError, OSError):
+                # The file is an optimization only
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._versions.clear()
+
+version_cache = VersionCache()
+
+
 class HawkularBaseClient(object):
     """
     Creates new client for Hawkular-Metrics. As tenant_id, give intended tenant_id, even if it's not
@@ -130,7 +515,17 @@ class HawkularBaseClient(object):
                  username=None,
                  password=None,
                  auto_set_legacy_api=True,
-                 authtoken=None):
+                 authtoken=None,
+                 pool_size=10,
+                 idle_timeout=60,
+                 compression_threshold=None,
+                 compression_level=6,
+                 retry=None,
+                 circuit_breaker=None,
+                 timeout=None,
+                 version_cache_file=None,
+                 version_cache_ttl=3600,
+                 instrumentation=None):
         """
         A new instance of HawkularClient is created with the following defaults:
 
@@ -139,6 +534,37 @@ class HawkularBaseClient(object):
         path = hawkular-metrics
         scheme = http
         cafile = None
+        pool_size = 10
+        idle_timeout = 60
+        compression_threshold = None
+        compression_level = 6
+        retry = None
+        circuit_breaker = None
+        timeout = None
+        version_cache_file = None
+        version_cache_ttl = 3600
+        instrumentation = None
+
+        Requests are sent over keep-alive connections, pool_size is the amount of idle connections
+        kept per host and idle_timeout the amount of seconds an idle connection may be reused.
+
+        Request payloads of at least compression_threshold bytes are sent gzip compressed with the
+        given compression_level (1-9), None disables compression. Compressed responses are always accepted.
+
+        retry is a RetryPolicy deciding which failed requests are sent again, None disables retries.
+
+        circuit_breaker is a CircuitBreaker, requests to a failing server then fail fast with
+        HawkularCircuitOpenError until the server recovers. None always sends the requests.
+
+        timeout is the amount of seconds to wait for a connection and for each read, or a (connect, read)
+        tuple. None waits forever.
+
+        With auto_set_legacy_api the server version, which sets legacy_api, is detected on the first
+        request that needs it. Detected versions are cached per server for version_cache_ttl seconds
+        in the process and also in the file version_cache_file, if given.
+
+        instrumentation is an Instrumentation which receives the timings of every request, see
+        hawkular.instrumentation. None disables the instrumentation.
 
         The url that is called by the client is:
 
@@ -154,21 +580,66 @@ class HawkularBaseClient(object):
         self.token = token
         self.username = username
         self.password = password
-        self.legacy_api = False
         self.authtoken = authtoken
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.compression_threshold = compression_threshold
+        self.compression_level = compression_level
+        self.retry = retry
+        self.circuit_breaker = circuit_breaker
+        self.timeout = timeout
+        self.version_cache_file = version_cache_file
+        self.version_cache_ttl = version_cache_ttl
+        self.instrumentation = instrumentation
 
         self._setup_path()
-
-        # Call the server status endpoint to get the version number,
-        # Use the return sematic version to set the value of legacy_api
-        if auto_set_legacy_api:
-            major, minor = self.query_semantic_version()
-            self.legacy_api = (major == 0 and minor < 16)
+        self._setup_transport()
+
+        # The server version is queried from the status endpoint when first needed
+        self._version_lock = threading.Lock()
+        self._version_pending = auto_set_legacy_api
+
+    @property
+    def legacy_api(self):
+        self._detect_version()
+        return getattr(self, '_legacy_api', False)
+
+    @legacy_api.setter
+    def legacy_api(self, value):
+        self._version_pending = False
+        self._legacy_api = value
+
+    @property
+    def server_version(self):
+        self._detect_version()
+        return getattr(self, '_server_version', None)
+
+    @server_version.setter
+    def server_version(self, value):
+        self._version_pending = False
+        self._server_version = value
+
+    def _set_version(self, version):
+        major, minor = version
+        self.server_version = (major, minor)
+        self.legacy_api = (major == 0 and minor < 16)
+
+    def _detect_version(self):
+        if not getattr(self, '_version_pending', False):
+            return
+
+        with self._version_lock:
+            if not self._version_pending:
+                return
+
+            url = self._get_base_url()
+            version = version_cache.get(url, self.version_cache_ttl, self.version_cache_file)
+            if version is None:
+                version = self.query_semantic_version()
+                version_cache.put(url, version, self.version_cache_file)
+            self._set_version(version)
 
     def _setup_path(self):
-        opener = build_opener(HawkularHTTPErrorProcessor())
-        install_opener(opener)
-
         if self.path is None:
             class_name = self.__class__.__name__
             path_components = ''.join(["_" + c.lower() if c.isupper() else c for c in class_name]).split('_')
@@ -176,6 +647,17 @@ class HawkularBaseClient(object):
             self.path = '/'.join(path_components)
         self.path = self.path.strip('/')
 
+    def _setup_transport(self):
+        context = self.context
+        if context is None and self.cafile is not None:
+            context = ssl.create_default_context(cafile=self.cafile)
+
+        self._pool = HawkularConnectionPool(maxsize=self.pool_size, idle_timeout=self.idle_timeout, context=context,
+                                            compression_threshold=self.compression_threshold,
+                                            compression_level=self.compression_level,
+                                            retry=self.retry, circuit_breaker=self.circuit_breaker,
+                                            timeout=self.timeout)
+
     def _get_base_url(self):
         return "{0}://{1}:{2}/{3}/".format(self.scheme, self.host, str(self.port), self.path)
 
@@ -185,52 +667,97 @@ class HawkularBaseClient(object):
     def tenant(self, tenant_id):
         self.tenant_id = tenant_id
 
-    def _http(self, url, method, data=None, decoder=None, parse_json=True):
-        res = None
-        req = Request(url=url)
-        req.add_header('Content-Type', 'application/json')
-        req.add_header('Hawkular-Tenant', self.tenant_id)
-        req.add_header('Host', self.host)
+    def _headers(self):
+        headers = {'Content-Type': 'application/json',
+                   'Hawkular-Tenant': self.tenant_id,
+                   'Host': self.host}
 
         if self.token is not None:
-            req.add_header('Authorization', 'Bearer {0}'.format(self.token))
+            headers['Authorization'] = 'Bearer {0}'.format(self.token)
         elif self.username is not None:
             b64 = base64.b64encode((self.username + ':' + self.password).encode('utf-8'))
-            req.add_header('Authorization', 'Basic {0}'.format(b64.decode()))
+            headers['Authorization'] = 'Basic {0}'.format(b64.decode())
 
         if self.authtoken is not None:
-            req.add_header('Hawkular-Admin-Token', self.authtoken)
+            headers['Hawkular-Admin-Token'] = self.authtoken
 
-        if not isinstance(data, str):
-            data = json.dumps(data, indent=2)
+        return headers
 
-        reader = codecs.getreader('utf-8')
+    def _request(self, url, method, data=None):
+        req = Request(url=url)
+        for header, value in self._headers().items():
+            req.add_header(header, value)
 
         if data:
             try:
                 req.add_data(data)
             except AttributeError:
-                req.data = data.encode('utf-8')
+                req.data = data if isinstance(data, bytes) else data.encode('utf-8')
+
+        req.get_method = lambda: method
+        return req
+
+    def _instrument(self, method, url, data=None):
+        if self.instrumentation is None:
+            return None
+        return self.instrumentation.start(method, url, self._get_base_url(), len(data) if data else 0)
+
+    def _http(self, url, method, data=None, decoder=None, parse_json=True, idempotent=None):
+        res = None
+        error = None
+
+        # Already serialized payloads are text or bytes, json.dumps returns unicode on Python 2
+        if data is not None and not isinstance(data, (type(''), bytes)):
+            data = encode_json(data)
+
+        info = self._instrument(method, url, data)
+
         try:
-            req.get_method = lambda: method
-            res = urlopen(req, context=self.context)
+            req = self._request(url, method, data)
+            res = self._pool.urlopen(req, idempotent, info)
+
+            payload = res.read()
+            if info is not None:
+                info.mark('read')
+                info.bytes_in = res.bytes_read
 
             if parse_json:
                 if res.getcode() == 200:
-                    data = json.load(reader(res), cls=decoder)
+                    data = json.loads(payload.decode('utf-8'), cls=decoder)
                 elif res.getcode() == 204:
                     data = {}
             else:
-                data = reader(res).read()
+                data = payload.decode('utf-8')
 
+            if info is not None:
+                info.mark('decode')
             return data
 
         except Exception as e:
+            error = e
             self._handle_error(e)
 
         finally:
             if res:
                 res.close()
+            if info is not None:
+                self.instrumentation.finish(info, error)
+
+    def _stream(self, url, decoder=None):
+        """
+        GET a JSON array and return an iterator over its elements, which are decoded while the
+        response is read. The connection is released once the iterator is exhausted, closed or
+        garbage collected, also when it was never iterated.
+        """
+        info = self._instrument('GET', url)
+        try:
+            res = self._pool.urlopen(self._request(url, 'GET'), info=info)
+        except Exception as e:
+            if info is not None:
+                self.instrumentation.finish(info, e)
+            self._handle_error(e)
+
+        return _ResponseStream(res, iter_json_array(res, decoder=decoder), self.instrumentation, info)
 
     def _put(self, url, data, parse_json=True):
         return self._http(url, 'PUT', data, parse_json=parse_json)
@@ -238,8 +765,8 @@ class HawkularBaseClient(object):
     def _delete(self, url, parse_json=False):
         return self._http(url, 'DELETE', parse_json=parse_json)
 
-    def _post(self, url, data, parse_json=True):
-        return self._http(url, 'POST', data, parse_json=parse_json)
+    def _post(self, url, data, parse_json=True, idempotent=False):
+        return self._http(url, 'POST', data, parse_json=parse_json, idempotent=idempotent)
 
     def _get(self, url, **url_params):
         params = urlencode(url_params)
@@ -248,6 +775,13 @@ class HawkularBaseClient(object):
 
         return self._http(url, 'GET')
 
+    def _get_stream(self, url, **url_params):
+        params = urlencode(url_params)
+        if len(params) > 0:
+            url = '{0}?{1}'.format(url, params)
+
+        return self._stream(url)
+
     def _service_url(self, path, params=None):
         url_array = [self._get_base_url()]
 
@@ -265,7 +799,7 @@ class HawkularBaseClient(object):
 
     @staticmethod
     def _serialize_object(o):
-        return json.dumps(o, cls=ApiJsonEncoder)
+        return encode_json(o)
 
     def _handle_error(self, e):
         if isinstance(e, HTTPError):
@@ -281,6 +815,10 @@ class HawkularBaseClient(object):
                 ee.msg = err_json
             raise ee
 
+        elif isinstance(e, CircuitOpenError):
+            ee = HawkularCircuitOpenError(e)
+            ee.msg = "Error, not sending event(s) to the failing Hawkular server: " + str(e.reason)
+            raise ee
         elif isinstance(e, URLError):
             # Cast to HawkularMetricsConnectionError
             ee = HawkularConnectionError(e)
@@ -0,0 +1,127 @@
+"""
+   Copyright 2015-2017 Red Hat, Inc. and/or its affiliates
+   and other contributors.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NAN = float('nan')
+
+# Typecode of the int64 columns, Python 2 has no 'q'
+try:
+    array('q')
+    INT64 = 'q'
+except ValueError:
+    INT64 = 'l' if array('l').itemsize == 8 else 'd'
+
+
+def _column(typecode, as_numpy):
+    if as_numpy and numpy is None:
+        raise ImportError('numpy is required for numpy columns, install hawkular-client[numpy]')
+    return array(typecode)
+
+def _finish(column, as_numpy, dtype='float64'):
+    if as_numpy:
+        values = numpy.frombuffer(column, dtype=numpy.float64 if column.typecode == 'd' else numpy.int64)
+        return values.astype(dtype, copy=False)
+    return column
+
+
+class DatapointColumns(object):
+    """
+    Datapoints of a numeric metric as parallel columns: timestamp (milliseconds, int64) and value (float64).
+    The columns are array.array instances or numpy arrays.
+    """
+    def __init__(self, timestamp, value):
+        self.timestamp = timestamp
+        self.value = value
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    @classmethod
+    def from_datapoints(cls, datapoints, as_numpy=False):
+        """
+        Build the columns from an iterable of datapoint dicts
+
+        :param datapoints: Iterable of {'timestamp': .., 'value': ..} dicts
+        :param as_numpy: Return numpy arrays instead of array.array
+        """
+        timestamp = _column(INT64, as_numpy)
+        value = _column('d', as_numpy)
+
+        for d in datapoints:
+            timestamp.append(int(d['timestamp']))
+            value.append(float(d['value']))
+
+        return cls(_finish(timestamp, as_numpy, 'int64'), _finish(value, as_numpy))
+
+
+class BucketColumns(object):
+    """
+    Stats buckets as parallel columns. start, end and samples are int64 columns, min, max, avg, median
+    and sum are float64 columns with NaN for empty buckets. percentiles is a dict of quantile -> float64
+    column. The columns are array.array instances or numpy arrays.
+    """
+    int_fields = ['start', 'end', 'samples']
+    float_fields = ['min', 'max', 'avg', 'median', 'sum']
+
+    def __init__(self, columns, percentiles):
+        for k, v in columns.items():
+            setattr(self, k, v)
+        self.percentiles = percentiles
+
+    def __len__(self):
+        return len(self.start)
+
+    @classmethod
+    def from_buckets(cls, buckets, as_numpy=False):
+        """
+        Build the columns from a list of stats bucket dicts
+
+        :param buckets: Iterable of bucket dicts as returned by query_metric_stats
+        :param as_numpy: Return numpy arrays instead of array.array
+        """
+        columns = dict((f, _column(INT64, as_numpy)) for f in cls.int_fields)
+        columns.update((f, _column('d', as_numpy)) for f in cls.float_fields)
+        percentiles = {}
+
+        for i, b in enumerate(buckets):
+            for f in cls.int_fields:
+                columns[f].append(int(b.get(f, 0)))
+            for f in cls.float_fields:
+                v = b.get(f)
+                columns[f].append(NAN if v is None else float(v))
+
+            seen = set()
+            for p in b.get('percentiles') or []:
+                q = float(p['quantile'])
+                if q not in percentiles:
+                    percentiles[q] = _column('d', as_numpy)
+                    percentiles[q].extend([NAN] * i)
+                percentiles[q].append(float(p['value']))
+                seen.add(q)
+
+            for q in percentiles:
+                if q not in seen:
+                    percentiles[q].append(NAN)
+
+        return cls(dict((f, _finish(c, as_numpy, 'int64' if f in cls.int_fields else 'float64'))
+                        for f, c in columns.items()),
+                   dict((q, _finish(c, as_numpy)) for q, c in percentiles.items()))
@@ -0,0 +1,403 @@
+"""
+   Copyright 2015-2017 Red Hat, Inc. and/or its affiliates
+   and other contributors.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+import array
+import ctypes
+import multiprocessing
+import threading
+import time
+from datetime import datetime
+from multiprocessing.sharedctypes import RawArray
+
+from hawkular.client import HawkularError
+from hawkular.metrics import HawkularMetricsClient, MetricType, datetime_to_time_millis, time_millis
+from hawkular.transport import RetryPolicy, CircuitBreaker
+
+# Positions in _Ring.control
+WRITE, READ, FLUSH_REQUESTED, FLUSHED, CLOSING = range(5)
+
+# Positions in IngestPool worker stats
+WORKER_STATS = ('received', 'buffered', 'flushed', 'dropped', 'batches', 'failures')
+
+# Client attributes given to the clients of the worker processes as is
+_SETTINGS = ('tenant_id', 'host', 'port', 'path', 'scheme', 'cafile', 'token', 'username', 'password',
+             'authtoken', 'pool_size', 'idle_timeout', 'compression_threshold', 'compression_level', 'timeout')
+
+
+def _client_settings(client):
+    """
+    Returns the keyword arguments to create a copy of client in another process
+    """
+    if client.context is not None:
+        raise ValueError('An SSL context can not be shared with worker processes, give cafile instead')
+
+    settings = dict((name, getattr(client, name)) for name in _SETTINGS)
+    # Retry policies and circuit breakers keep per process state, the workers get their own
+    if client.retry is not None:
+        r = client.retry
+        settings['retry'] = dict(max_attempts=r.max_attempts, backoff=r.backoff, max_backoff=r.max_backoff,
+                                 jitter=r.jitter, status_codes=r.status_codes, exceptions=r.exceptions,
+                                 idempotent_methods=r.idempotent_methods)
+    if client.circuit_breaker is not None:
+        c = client.circuit_breaker
+        settings['circuit_breaker'] = dict(failure_threshold=c.failure_threshold, reset_timeout=c.reset_timeout)
+    # Detect the server version once, not in every worker
+    settings['auto_set_legacy_api'] = False
+    settings['legacy_api'] = client.legacy_api
+    return settings
+
+
+def _create_client(settings):
+    settings = dict(settings)
+    legacy_api = settings.pop('legacy_api')
+    if 'retry' in settings:
+        settings['retry'] = RetryPolicy(**settings['retry'])
+    if 'circuit_breaker' in settings:
+        settings['circuit_breaker'] = CircuitBreaker(**settings['circuit_breaker'])
+
+    client = HawkularMetricsClient(**settings)
+    client.legacy_api = legacy_api
+    return client
+
+
+class _Ring(object):
+    """
+    Fixed size queue of (metric index, timestamp, value) records in shared memory with a single
+    writer and a single reader process. Records are written in chunks, the positions in control
+    only grow and are guarded by lock.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.indexes = RawArray(ctypes.c_int, capacity)
+        self.timestamps = RawArray(ctypes.c_double, capacity)
+        self.values = RawArray(ctypes.c_double, capacity)
+        self.control = RawArray(ctypes.c_longlong, 5)
+        self.lock = multiprocessing.Lock()
+        self.readable = multiprocessing.Event()
+        self.writable = multiprocessing.Event()
+
+    def get(self, position):
+        with self.lock:
+            return self.control[position]
+
+    def set(self, position, value):
+        with self.lock:
+            self.control[position] = value
+
+    def add(self, position, amount=1):
+        with self.lock:
+            self.control[position] += amount
+            return self.control[position]
+
+    def write(self, indexes, timestamps, values, alive):
+        """
+        Copy the columns to the ring, waiting for space while alive() returns True
+        """
+        n = len(indexes)
+        while True:
+            self.writable.clear()
+            with self.lock:
+                write = self.control[WRITE]
+                free = self.capacity - (write - self.control[READ])
+            if free >= n:
+                break
+            if not alive():
+                raise HawkularError('Ingest worker process has exited')
+            self.writable.wait(0.1)
+
+        start = write % self.capacity
+        first = min(n, self.capacity - start)
+        for target, column in ((self.indexes, indexes), (self.timestamps, timestamps), (self.values, values)):
+            address, _ = column.buffer_info()
+            size = column.itemsize
+            ctypes.memmove(ctypes.addressof(target) + start * size, address, first * size)
+            if first < n:
+                ctypes.memmove(ctypes.addressof(target), address + first * size, (n - first) * size)
+
+        with self.lock:
+            self.control[WRITE] = write + n
+        self.readable.set()
+
+    def read(self, limit):
+        """
+        Returns up to limit records as (indexes, timestamps, values) lists, None if the ring is empty
+        """
+        self.readable.clear()
+        with self.lock:
+            read = self.control[READ]
+            n = min(self.control[WRITE] - read, limit)
+        if n == 0:
+            return None
+
+        start = read % self.capacity
+        end = start + n
+        if end <= self.capacity:
+            records = (self.indexes[start:end], self.timestamps[start:end], self.values[start:end])
+        else:
+            end -= self.capacity
+            records = tuple(c[start:] + c[:end] for c in (self.indexes, self.timestamps, self.values))
+
+        with self.lock:
+            self.control[READ] = read + n
+        self.writable.set()
+        return records
+
+    def wait(self, timeout):
+        self.readable.wait(timeout)
+
+
+def _run_worker(settings, ring, registrations, stats, batch_size, flush_interval, max_buffer):
+    """
+    Main loop of a worker process: decode the records of the ring into datapoints and send them with a
+    BatchWriter of its own client
+    """
+    client = _create_client(settings)
+    writer = client.batch_writer(batch_size=batch_size, flush_interval=flush_interval, max_buffer=max_buffer)
+    metrics = []
+
+    def publish(received):
+        s = writer.stats()
+        stats[0] += received
+        for i, name in enumerate(WORKER_STATS[1:], 1):
+            stats[i] = s[name]
+
+    while True:
+        requested = ring.get(FLUSH_REQUESTED)
+        closing = ring.get(CLOSING)
+        records = ring.read(batch_size)
+        if records is not None:
+            indexes, timestamps, values = records
+            batch = {}
+            for index, timestamp, value in zip(indexes, timestamps, values):
+                while index >= len(metrics):
+                    # Registered by the parent before the first record using it was written
+                    metrics.append(registrations.get())
+                datapoints = batch.get(index)
+                if datapoints is None:
+                    datapoints = batch[index] = []
+                datapoints.append({'timestamp': int(timestamp), 'value': value})
+
+            data = []
+            for index, datapoints in batch.items():
+                metric_type, metric_id = metrics[index]
+                if metric_type == MetricType.Counter:
+                    for dp in datapoints:
+                        dp['value'] = int(dp['value'])
+                data.append({'type': metric_type, 'id': metric_id, 'data': datapoints})
+            writer.put(data)
+            publish(len(indexes))
+            continue
+
+        if requested > ring.get(FLUSHED):
+            try:
+                writer.flush()
+            except Exception:
+                # Counted in the writer stats, transient failures stay buffered
+                pass
+            publish(0)
+            ring.set(FLUSHED, requested)
+
+        if closing:
+            break
+        ring.wait(flush_interval)
+
+    writer.close()
+    publish(0)
+
+
+class IngestPool(object):
+    """
+    Sends gauge and counter datapoints from worker processes, so that building the requests is not
+    limited to the one core the GIL allows. Create instances with client.ingest_pool().
+
+    Every metric is assigned to one of the processes, which keeps the datapoints of a metric in order.
+    Pushed datapoints are collected as compact (metric, timestamp, value) records and handed to the
+    processes in chunks of chunk_size through ring buffers of capacity records in shared memory. Each
+    process decodes them and sends them with a BatchWriter of its own client, which retries failed
+    batches as described in HawkularMetricsClient.batch_writer. Pushing waits while the ring buffer of
+    the process is full.
+
+    Only timestamps and numeric values are handed over, datapoint tags are not sent. The worker
+    processes are started with the default multiprocessing start method, with spawn the program must
+    guard its entry point with if __name__ == '__main__'.
+    """
+    def __init__(self, client, processes=None, batch_size=1000, flush_interval=1.0, max_buffer=100000,
+                 capacity=65536, chunk_size=1024):
+        if chunk_size > capacity:
+            raise ValueError('chunk_size can not be larger than capacity')
+        if batch_size > max_buffer:
+            raise ValueError('batch_size can not be larger than max_buffer')
+
+        self.processes = processes or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        self._closed = False
+        self._pushed = 0
+        self._metrics = {}
+        self._counts = [0] * self.processes
+        self._chunks = [(array.array('i'), array.array('d'), array.array('d')) for _ in range(self.processes)]
+        self._lock = threading.Lock()
+
+        settings = _client_settings(client)
+        self._workers = []
+        for n in range(self.processes):
+            ring = _Ring(capacity)
+            registrations = multiprocessing.Queue()
+            stats = RawArray(ctypes.c_longlong, len(WORKER_STATS))
+            process = multiprocessing.Process(target=_run_worker, name='hawkular-ingest-{0}'.format(n),
+                                              args=(settings, ring, registrations, stats, batch_size,
+                                                    flush_interval, max_buffer))
+            process.daemon = True
+            self._workers.append((process, ring, registrations, stats))
+
+        for process, _, _, _ in self._workers:
+            process.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def push(self, metric_type, metric_id, value, timestamp=None):
+        """
+        Hand over a single datapoint, see HawkularMetricsClient.push
+        """
+        if timestamp is None:
+            timestamp = time_millis()
+        elif isinstance(timestamp, datetime):
+            timestamp = datetime_to_time_millis(timestamp)
+
+        with self._lock:
+            self._add(metric_type, metric_id, timestamp, value)
+
+    def put(self, data):
+        """
+        Hand over the datapoints of one or more metrics, see HawkularMetricsClient.put
+
+        :param data: A dict or a list of dicts created with create_metric(metric_type, metric_id, datapoints)
+        """
+        if not isinstance(data, list):
+            data = [data]
+
+        with self._lock:
+            for d in data:
+                metric_type = d.get('type')
+                if metric_type is None:
+                    raise HawkularError('Undefined MetricType')
+                for dp in d['data']:
+                    timestamp = dp['timestamp']
+                    if isinstance(timestamp, datetime):
+                        timestamp = datetime_to_time_millis(timestamp)
+                    self._add(metric_type, d['id'], timestamp, dp['value'])
+
+    def _add(self, metric_type, metric_id, timestamp, value):
+        if self._closed:
+            raise ValueError('IngestPool is closed')
+
+        # Convert before appending, the columns must keep the same length
+        timestamp = int(timestamp)
+        value = float(value)
+        key = (metric_type, metric_id)
+        assigned = self._metrics.get(key)
+        if assigned is None:
+            assigned = self._register(key)
+        worker, index = assigned
+
+        indexes, timestamps, values = chunk = self._chunks[worker]
+        indexes.append(index)
+        timestamps.append(timestamp)
+        values.append(value)
+        self._pushed += 1
+        if len(indexes) >= self.chunk_size:
+            self._hand_over(worker, chunk)
+
+    def _register(self, key):
+        if key[0] not in (MetricType.Gauge, MetricType.Counter):
+            raise ValueError('Only gauges and counters can be sent with an IngestPool')
+
+        # Round robin, the amount of metrics per process differs by one at most
+        worker = len(self._metrics) % self.processes
+        index = self._counts[worker]
+        self._counts[worker] += 1
+        self._workers[worker][2].put(key)
+        self._metrics[key] = worker, index
+        return worker, index
+
+    def _hand_over(self, worker, chunk):
+        process, ring, _, _ = self._workers[worker]
+        ring.write(chunk[0], chunk[1], chunk[2], process.is_alive)
+        self._chunks[worker] = (array.array('i'), array.array('d'), array.array('d'))
+
+    def _hand_over_all(self):
+        with self._lock:
+            for worker, chunk in enumerate(self._chunks):
+                if chunk[0]:
+                    self._hand_over(worker, chunk)
+
+    def flush(self, timeout=None):
+        """
+        Hand over the collected datapoints and wait until the worker processes have sent everything
+        they received.
+
+        :param timeout: Maximum seconds to wait, None waits forever
+        :return: True if everything was sent in time
+        """
+        self._hand_over_all()
+        requested = []
+        for process, ring, _, _ in self._workers:
+            requested.append(ring.add(FLUSH_REQUESTED))
+            ring.readable.set()
+
+        deadline = None if timeout is None else time.time() + timeout
+        for (process, ring, _, _), r in zip(self._workers, requested):
+            while ring.get(FLUSHED) < r:
+                if not process.is_alive():
+                    raise HawkularError('Ingest worker process {0} has exited'.format(process.name))
+                if deadline is not None and time.time() > deadline:
+                    return False
+                time.sleep(0.01)
+        return True
+
+    def close(self):
+        """
+        Hand over the remaining datapoints and wait for the worker processes to send them and exit.
+        """
+        if self._closed:
+            return
+
+        self._hand_over_all()
+        self._closed = True
+        for process, ring, _, _ in self._workers:
+            ring.set(CLOSING, 1)
+            ring.readable.set()
+
+        for process, _, registrations, _ in self._workers:
+            process.join()
+            registrations.close()
+
+    def stats(self):
+        """
+        Returns a dict with the amount of datapoints pushed and the totals of the worker statistics:
+        received, buffered, flushed, dropped, batches and failures, which are listed per process in
+        workers.
+        """
+        workers = [dict(zip(WORKER_STATS, stats[:])) for _, _, _, stats in self._workers]
+        with self._lock:
+            totals = {'pushed': self._pushed}
+        for name in WORKER_STATS:
+            totals[name] = sum(w[name] for w in workers)
+        totals['workers'] = workers
+        return totals
@@ -0,0 +1,269 @@
+"""
+   Copyright 2015-2017 Red Hat, Inc. and/or its affiliates
+   and other contributors.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+import threading
+import time
+
+try:
+    # Python 3
+    from urllib.parse import urlsplit, unquote
+except ImportError:
+    from urlparse import urlsplit
+    from urllib import unquote
+
+try:
+    timer = time.perf_counter
+except AttributeError:
+    timer = time.time
+
+# Fixed path segments of the Hawkular Metrics and Alerts REST APIs, the others are ids
+KNOWN_SEGMENTS = frozenset([
+    'hawkular', 'gauges', 'counters', 'availability', 'strings', 'metrics', 'tenants', 'status', 'raw',
+    'stats', 'rate', 'query', 'tags', 'data', 'triggers', 'trigger', 'groups', 'members', 'conditions',
+    'dampenings', 'mode', 'orphan', 'unorphan', 'enabled', 'import', 'export', 'all', 'new', 'old',
+    'delete', 'alerts', 'events', 'actions', 'plugins', 'ack', 'resolve', 'note', 'watch',
+])
+
+# Upper bounds in seconds of the latency histogram buckets, 1 ms to about 65 s
+DEFAULT_BOUNDS = tuple(0.001 * 2 ** i for i in range(17)) + (float('inf'),)
+
+
+def url_template(url, base_url=None, known=KNOWN_SEGMENTS):
+    """
+    Returns the path of url with the id segments replaced by {id} and without the query, so that
+    requests to the same endpoint share a template. The path of base_url is kept as is.
+
+    :param url: Requested url
+    :param base_url: Url of the service, such as http://localhost:8080/hawkular/metrics/
+    :param known: Path segments which are not ids
+    """
+    path = urlsplit(url).path
+    prefix = urlsplit(base_url).path if base_url else '/'
+    if not path.startswith(prefix):
+        prefix = '/'
+
+    segments = [s if unquote(s) in known else '{id}' for s in path[len(prefix):].split('/') if s]
+    return prefix + '/'.join(segments)
+
+
+class RequestInfo(object):
+    """
+    A request as seen by the instrumentation hooks.
+
+    timings maps the phases of the request to seconds:
+
+    - queue: waiting for a free request slot (asyncio clients)
+    - connect: taking a pooled connection or opening a new one, including DNS and TLS
+    - send: writing the request
+    - wait: waiting for the response headers, mostly the time spent in the server
+    - read: reading the response body, for streamed responses the whole iteration
+    - decode: decoding the JSON body
+    - backoff: sleeping between retries
+
+    With retries, the phases of all the attempts are added up.
+    """
+    __slots__ = ['method', 'url', 'template', 'status', 'bytes_out', 'bytes_in', 'error', 'attempts',
+                 'timings', 'started', '_last']
+
+    def __init__(self, method, url, template, bytes_out=0):
+        self.method = method
+        self.url = url
+        self.template = template
+        self.status = None
+        self.bytes_out = bytes_out
+        self.bytes_in = 0
+        self.error = None
+        self.attempts = 0
+        self.timings = {}
+        self.started = timer()
+        self._last = self.started
+
+    def mark(self, phase):
+        """
+        Add the time passed since the previous mark to phase
+        """
+        now = timer()
+        self.timings[phase] = self.timings.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    @property
+    def duration(self):
+        return self._last - self.started
+
+    @property
+    def endpoint(self):
+        return '{0} {1}'.format(self.method, self.template)
+
+
+class _Series(object):
+    """
+    Rolling latency histogram of one endpoint, kept as slots covering slot_length seconds each
+    """
+    def __init__(self, slots, slot_length, bounds):
+        self.slot_length = slot_length
+        self.bounds = bounds
+        self.slots = [None] * slots
+
+    def _slot(self, now):
+        n = int(now // self.slot_length)
+        i = n % len(self.slots)
+        slot = self.slots[i]
+        if slot is None or slot['n'] != n:
+            slot = {'n': n, 'counts': [0] * len(self.bounds), 'count': 0, 'errors': 0, 'sum': 0.0, 'max': 0.0,
+                    'bytes_in': 0, 'bytes_out': 0, 'timings': {}}
+            self.slots[i] = slot
+        return slot
+
+    def record(self, info, now):
+        slot = self._slot(now)
+        duration = info.duration
+        for i, bound in enumerate(self.bounds):
+            if duration <= bound:
+                slot['counts'][i] += 1
+                break
+        slot['count'] += 1
+        slot['errors'] += info.error is not None
+        slot['sum'] += duration
+        slot['max'] = max(slot['max'], duration)
+        slot['bytes_in'] += info.bytes_in
+        slot['bytes_out'] += info.bytes_out
+        for phase, seconds in info.timings.items():
+            slot['timings'][phase] = slot['timings'].get(phase, 0.0) + seconds
+
+    def snapshot(self, now):
+        oldest = int(now // self.slot_length) - len(self.slots)
+        live = [s for s in self.slots if s is not None and s['n'] > oldest]
+        count = sum(s['count'] for s in live)
+        if count == 0:
+            return None
+
+        counts = [sum(s['counts'][i] for s in live) for i in range(len(self.bounds))]
+        timings = {}
+        for s in live:
+            for phase, seconds in s['timings'].items():
+                timings[phase] = timings.get(phase, 0.0) + seconds
+
+        snapshot = {'count': count,
+                    'errors': sum(s['errors'] for s in live),
+                    'sum': sum(s['sum'] for s in live),
+                    'max': max(s['max'] for s in live),
+                    'bytes_in': sum(s['bytes_in'] for s in live),
+                    'bytes_out': sum(s['bytes_out'] for s in live),
+                    'buckets': list(zip(self.bounds, counts)),
+                    'phases': dict((phase, seconds / count) for phase, seconds in timings.items())}
+        snapshot['mean'] = snapshot['sum'] / count
+
+        for name, q in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+            # Upper bound of the bucket holding the quantile, the max for the last one
+            seen = 0
+            for bound, c in snapshot['buckets']:
+                seen += c
+                if seen >= q * count:
+                    snapshot[name] = min(bound, snapshot['max'])
+                    break
+        return snapshot
+
+
+class Instrumentation(object):
+    """
+    Collects per request timings of the clients it is given to with the instrumentation parameter.
+
+    Hooks added with add_pre_hook are called with a RequestInfo before the request is sent, hooks added
+    with add_post_hook once the response has been read or the request failed, with status, bytes,
+    error and timings filled in. Exceptions raised by hooks are counted in hook_errors and otherwise
+    ignored.
+
+    Every request is also recorded in a rolling latency histogram of its endpoint, the method and the
+    url_template of the url, covering the last window seconds. snapshot() returns them as plain dicts.
+    At most max_endpoints endpoints are tracked, the requests to others are recorded under 'other'.
+    """
+    def __init__(self, window=60, slots=6, bounds=DEFAULT_BOUNDS, max_endpoints=1000):
+        self.window = window
+        self.slots = slots
+        self.bounds = bounds
+        self.max_endpoints = max_endpoints
+        self.pre_hooks = []
+        self.post_hooks = []
+        self.hook_errors = 0
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def add_pre_hook(self, hook):
+        self.pre_hooks.append(hook)
+
+    def add_post_hook(self, hook):
+        self.post_hooks.append(hook)
+
+    def template(self, url, base_url=None):
+        """
+        Returns the template of url used to group requests by endpoint, override to group differently
+        """
+        return url_template(url, base_url)
+
+    def _call(self, hooks, info):
+        for hook in hooks:
+            try:
+                hook(info)
+            except Exception:
+                self.hook_errors += 1
+
+    def start(self, method, url, base_url=None, bytes_out=0):
+        """
+        Returns the RequestInfo of a request about to be sent, after calling the pre hooks
+        """
+        info = RequestInfo(method, url, self.template(url, base_url), bytes_out)
+        self._call(self.pre_hooks, info)
+        return info
+
+    def finish(self, info, error=None):
+        """
+        Record a completed request and call the post hooks
+        """
+        if error is not None:
+            info.error = error
+            if info.status is None:
+                info.status = getattr(error, 'code', None)
+        info._last = timer()
+
+        now = time.time()
+        with self._lock:
+            series = self._series.get(info.endpoint)
+            if series is None:
+                key = info.endpoint if len(self._series) < self.max_endpoints else 'other'
+                series = self._series.get(key)
+                if series is None:
+                    series = _Series(self.slots, float(self.window) / self.slots, self.bounds)
+                    self._series[key] = series
+            series.record(info, now)
+
+        self._call(self.post_hooks, info)
+
+    def snapshot(self):
+        """
+        Returns the latency statistics of the last window seconds as a dict of endpoint -> dict with:
+
+        count, errors, bytes_in, bytes_out, sum, mean, max and the p50, p90 and p99 estimates in
+        seconds, buckets as a list of (upper bound in seconds, count) tuples and phases with the mean
+        seconds spent in each phase of a request
+        """
+        now = time.time()
+        with self._lock:
+            snapshots = ((endpoint, series.snapshot(now)) for endpoint, series in self._series.items())
+            return dict((endpoint, s) for endpoint, s in snapshots if s is not None)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
@@ -16,16 +16,19 @@
 """
 from __future__ import unicode_literals
 
+import re
 import time
 import collections
+import threading
+import weakref
 from datetime import datetime, timedelta
 
-try:
-    import simplejson as json
-except ImportError:
-    import json
-
-from hawkular.client import HawkularBaseClient, HawkularError
+from hawkular.client import HawkularBaseClient, HawkularError, HawkularConnectionError, map_concurrently
+from hawkular.columnar import DatapointColumns, BucketColumns
+from hawkular.cache import TTLCache, BucketCache
+from hawkular.spool import DiskSpool, SpoolReplayer
+from hawkular.telemetry import ClientTelemetry, latency_source
+from hawkular.instrumentation import Instrumentation
 
 class MetricType:
     Gauge = 'gauges'
@@ -57,6 +60,27 @@ class HawkularMetricsClient(HawkularBaseClient):
     """
     epoch = datetime.utcfromtimestamp(0)
 
+    # First server versions with the multiple ids query endpoints
+    multi_raw_query_version = (0, 20)
+    multi_stats_query_version = (0, 23)
+
+    # Read-through cache of definitions and tags, see enable_cache()
+    definition_cache = None
+
+    # Completed stats buckets, see enable_stats_cache()
+    stats_cache = None
+
+    # Undelivered datapoints, see enable_spool()
+    spool = None
+    _replayer = None
+
+    # Health figures piggybacked on put, see enable_telemetry()
+    telemetry = None
+    _writers = None
+
+    def _supports(self, version):
+        return self.server_version is not None and self.server_version >= version
+
     def _get_url(self, metric_type=None):
         if metric_type is None:
             metric_type = MetricType._Metrics
@@ -84,6 +108,60 @@ class HawkularMetricsClient(HawkularBaseClient):
     def _get_single_id_url(self, previous_url, id):
         return previous_url + '/{0}'.format(HawkularBaseClient.quote(id))
 
+    @staticmethod
+    def _time_options(query_options, start=None, end=None, bucketDuration=None):
+        if start is not None:
+            if type(start) is datetime:
+                query_options['start'] = datetime_to_time_millis(start)
+            else:
+                query_options['start'] = start
+
+        if end is not None:
+            if type(end) is datetime:
+                query_options['end'] = datetime_to_time_millis(end)
+            else:
+                query_options['end'] = end
+
+        if bucketDuration is not None:
+            if type(bucketDuration) is timedelta:
+                query_options['bucketDuration'] = timedelta_to_duration(bucketDuration)
+            else:
+                query_options['bucketDuration'] = bucketDuration
+
+        return query_options
+
+    @staticmethod
+    def _split_by_type(data):
+        if not isinstance(data, list):
+            data = [data]
+
+        r = collections.defaultdict(list)
+
+        for d in data:
+            metric_type = d.pop('type', None)
+            if metric_type is None:
+                raise HawkularError('Undefined MetricType')
+            r[metric_type].append(d)
+
+        return r
+
+    @staticmethod
+    def _filter_key(value):
+        if isinstance(value, dict):
+            return tuple(sorted((k, HawkularMetricsClient._filter_key(v)) for k, v in value.items()))
+        if isinstance(value, (list, tuple)):
+            return tuple(HawkularMetricsClient._filter_key(v) for v in value)
+        return value
+
+    def _cached(self, loader, *key):
+        if self.definition_cache is None:
+            return loader()
+        return self.definition_cache.get((self.tenant_id,) + self._filter_key(key), loader)
+
+    def _invalidate_definitions(self, tenant_id=None):
+        if self.definition_cache is not None:
+            self.definition_cache.invalidate((tenant_id or self.tenant_id,))
+
     @staticmethod
     def _transform_tags(**tags):
         return ','.join("%s:%s" % (key,val) for (key,val) in tags.items())
@@ -102,31 +180,183 @@ class HawkularMetricsClient(HawkularBaseClient):
     def tenant(self, tenant_id):
         self.tenant_id = tenant_id
 
+    def enable_cache(self, ttl=60, maxsize=1024):
+        """
+        Cache the results of query_metric_definition, query_metric_definitions, query_metric_tags and
+        query_tag_values per tenant, type and filter. create_metric_definition, update_metric_tags and
+        delete_metric_tags invalidate the cached entries of the tenant. Definitions created implicitly
+        by writing datapoints with put or push are visible only after the ttl has passed.
+
+        :param ttl: Seconds a cached result is used before being fetched again
+        :param maxsize: Maximum amount of cached results, least recently used are evicted first
+        :return: TTLCache, use its stats() for the hit and miss counters
+        """
+        self.definition_cache = TTLCache(ttl=ttl, maxsize=maxsize)
+        return self.definition_cache
+
+    def disable_cache(self):
+        self.definition_cache = None
+
+    def enable_stats_cache(self, maxsize=256, grace=60):
+        """
+        Cache completed buckets of query_metric_stats calls with a start and a bucketDuration, so that
+        repeated queries of the same metric or tag filter fetch only the buckets which are missing or
+        still open. When the cache is used the start is aligned down to a multiple of bucketDuration.
+
+        :param maxsize: Maximum amount of cached series, least recently used are evicted first
+        :param grace: Seconds after its end a bucket is still considered open, for late datapoints
+        :return: BucketCache, use its stats() for the hit and miss counters
+        """
+        self.stats_cache = BucketCache(maxsize=maxsize, grace=grace)
+        return self.stats_cache
+
+    def disable_stats_cache(self):
+        self.stats_cache = None
+
+    def enable_spool(self, directory, segment_size=16 * 1024 * 1024, max_size=1024 * 1024 * 1024,
+                     fsync_interval=1.0, retry_interval=1.0, max_retry_interval=60.0):
+        """
+        Write the datapoints put can't deliver because of connection problems or server errors to a
+        DiskSpool in directory instead of raising the error. While the spool has undelivered datapoints,
+        new ones are appended to it as well to keep them in order, and a background thread sends them
+        once the server accepts them again. Spooled datapoints survive restarts of the process.
+
+        :param directory: Directory of the spool segments, created if missing
+        :param segment_size: Maximum size of a single segment file in bytes
+        :param max_size: Maximum size of all the segments in bytes, the oldest segments are dropped first
+        :param fsync_interval: Maximum seconds between syncs to the disk, 0 syncs every batch
+        :param retry_interval: Seconds between delivery attempts, doubled up to max_retry_interval on failures
+        :return: DiskSpool, use its stats() for the spooled and replayed counters
+        """
+        self.disable_spool()
+        self.spool = DiskSpool(directory, segment_size=segment_size, max_size=max_size,
+                               fsync_interval=fsync_interval)
+        self._replayer = SpoolReplayer(self.spool, self._send_spooled, is_transient_error,
+                                       retry_interval=retry_interval, max_retry_interval=max_retry_interval)
+        return self.spool
+
+    def disable_spool(self):
+        """
+        Stop the background delivery and close the spool, undelivered datapoints stay on disk
+        """
+        if self._replayer is not None:
+            self._replayer.close()
+            self.spool.close()
+        self.spool = self._replayer = None
+
+    def replay_spool(self):
+        """
+        Send the spooled datapoints now instead of waiting for the background thread
+
+        :return: True if everything was delivered
+        """
+        return self._replayer is None or self._replayer.replay()
+
+    def enable_telemetry(self, prefix=None, interval=60):
+        """
+        Report the health of the client as gauges with ids starting with prefix, by default
+        hawkular.client.{hostname}. The figures are added to the next put which sends gauges once
+        interval seconds have passed since the previous report, no requests are sent for them alone.
+
+        Reported are the requests, datapoints and errors of put, the stats of the batch writers, the
+        retry policy, the circuit breaker, the spool and the caches in use, and the request counts and
+        latencies per endpoint. An Instrumentation is set up for the latencies if the client has none.
+
+        :param prefix: Start of the reported metric ids
+        :param interval: Minimum seconds between reports
+        :return: ClientTelemetry, add_source() adds more figures to the reports
+        """
+        if self.instrumentation is None:
+            self.instrumentation = Instrumentation(window=max(interval, 60))
+
+        telemetry = ClientTelemetry(prefix, interval)
+        telemetry.add_source('batch', self._writer_stats)
+        telemetry.add_source('retry', lambda: self.retry and self.retry.stats())
+        telemetry.add_source('circuit', lambda: self.circuit_breaker and self.circuit_breaker.stats())
+        telemetry.add_source('spool', lambda: self.spool and self.spool.stats())
+        telemetry.add_source('cache', lambda: self.definition_cache and self.definition_cache.stats())
+        telemetry.add_source('stats_cache', lambda: self.stats_cache and self.stats_cache.stats())
+        telemetry.add_source('request', latency_source(self.instrumentation, '/{0}/'.format(self.path)))
+        self.telemetry = telemetry
+        return telemetry
+
+    def disable_telemetry(self):
+        self.telemetry = None
+
+    def _writer_stats(self):
+        if not self._writers:
+            return None
+        totals = collections.Counter()
+        for writer in list(self._writers):
+            totals.update(writer.stats())
+        return dict(totals)
+
+    def _add_telemetry(self, metrics_by_type):
+        # Only riding along with gauges keeps the reports from costing a request of their own
+        gauges = metrics_by_type.get(MetricType.Gauge)
+        if gauges and self.telemetry.due():
+            gauges.extend(self.telemetry.report(time_millis()))
+
+    def _send_spooled(self, record):
+        metric_type, metrics = record
+        self._post(self._get_metrics_raw_url(self._get_url(metric_type)), metrics, parse_json=False, idempotent=True)
+
+    def _put_type(self, metric_type, metrics):
+        spool = self.spool
+        if spool is not None and not spool.empty():
+            spool.append([metric_type, metrics])
+            return
+
+        telemetry = self.telemetry
+        try:
+            # Writing the same datapoints again overwrites them, safe to retry
+            self._post(self._get_metrics_raw_url(self._get_url(metric_type)), metrics, parse_json=False, idempotent=True)
+        except Exception as e:
+            if telemetry is not None:
+                telemetry.count('put_errors')
+            if spool is None or not is_transient_error(e):
+                raise
+            spool.append([metric_type, metrics])
+        else:
+            if telemetry is not None:
+                telemetry.count('put_requests')
+                telemetry.count('put_datapoints', sum(len(m.get('data', [])) for m in metrics))
+
     """
     Instance methods
     """
 
-    def put(self, data):
+    def put(self, data, concurrent=False, max_workers=4):
         """
         Send multiple different metric_ids to the server in a single batch. Metrics can be a mixture
-        of types.
+        of types, each type is sent with its own request.
+
+        With concurrent=True the requests of different types are sent in parallel and every type is
+        attempted even if some of them fail. A summary is returned instead of raising the first error:
+        a dict of metric_type -> {'metrics': int, 'datapoints': int, 'error': Exception or None}
+
+        With a spool enabled, datapoints which can't be delivered right now are written to it instead
+        of failing, see enable_spool.
 
         :param data: A dict or a list of dicts created with create_metric(metric_type, metric_id, datapoints)
+        :param concurrent: Send the per-type requests in parallel and return a summary
+        :param max_workers: Maximum amount of parallel requests when concurrent is True
         """
-        if not isinstance(data, list):
-            data = [data]
+        r = self._split_by_type(data)
+        if self.telemetry is not None:
+            self._add_telemetry(r)
 
-        r = collections.defaultdict(list)
+        if concurrent:
+            types = list(r)
+            results = map_concurrently(lambda l: self._put_type(l, r[l]), types, max_workers)
 
-        for d in data:
-            metric_type = d.pop('type', None)
-            if metric_type is None:
-                raise HawkularError('Undefined MetricType')
-            r[metric_type].append(d)
+            return dict((l, {'metrics': len(r[l]),
+                             'datapoints': sum(len(d.get('data', [])) for d in r[l]),
+                             'error': error}) for l, (_, error) in zip(types, results))
 
         # This isn't transactional, but .. ouh well. One can always repost everything.
         for l in r:
-            self._post(self._get_metrics_raw_url(self._get_url(l)), r[l],parse_json=False)
+            self._put_type(l, r[l])
 
     def push(self, metric_type, metric_id, value, timestamp=None):
         """
@@ -146,6 +376,64 @@ class HawkularMetricsClient(HawkularBaseClient):
         item = create_metric(metric_type, metric_id, create_datapoint(value, timestamp))
         self.put(item)
 
+    def aggregator(self, window=10, summary='avg', extra_stats=(), counters='sum', grace=1.0, writer=None):
+        """
+        Create an Aggregator which rolls up pushed gauge and counter samples into one datapoint per
+        metric every window seconds before sending them, see hawkular.aggregation.Aggregator.
+
+        :param window: Length of the aggregation windows in seconds
+        :param summary: Statistic of a window sent with the id of the gauge: min, max, avg, sum, count or last
+        :param extra_stats: Statistics sent as separate gauges with the ids {id}.{stat}
+        :param counters: 'sum' if the pushed counter values are increments, 'last' if they are totals
+        :param grace: Seconds to wait for late samples after the end of a window
+        :param writer: BatchWriter to send the aggregates with, by default they are sent with put
+        :return: A started Aggregator, remember to close() it
+        """
+        # Imported here, hawkular.aggregation depends on this module
+        from hawkular.aggregation import Aggregator
+        return Aggregator(writer if writer is not None else self, window=window, summary=summary,
+                          extra_stats=extra_stats, counters=counters, grace=grace)
+
+    def ingest_pool(self, processes=None, batch_size=1000, flush_interval=1.0, max_buffer=100000, capacity=65536,
+                    chunk_size=1024):
+        """
+        Create an IngestPool which sends pushed gauge and counter datapoints from worker processes with
+        clients of their own, see hawkular.ingest.IngestPool. The workers use the settings of this client,
+        except for an SSL context, which can't be shared, and the instrumentation and telemetry.
+
+        :param processes: Amount of worker processes, by default the amount of CPUs
+        :param batch_size: Amount of datapoints a worker sends per request
+        :param flush_interval: Maximum amount of seconds a worker keeps datapoints before sending them
+        :param max_buffer: Maximum amount of datapoints a worker keeps in memory
+        :param capacity: Amount of records of the shared memory ring buffer of each worker
+        :param chunk_size: Amount of records collected for a worker before they are handed over
+        :return: A started IngestPool, remember to close() it
+        """
+        # Imported here, hawkular.ingest depends on this module
+        from hawkular.ingest import IngestPool
+        return IngestPool(self, processes=processes, batch_size=batch_size, flush_interval=flush_interval,
+                          max_buffer=max_buffer, capacity=capacity, chunk_size=chunk_size)
+
+    def batch_writer(self, batch_size=1000, flush_interval=5.0, max_buffer=100000, block=True, block_timeout=None):
+        """
+        Create a buffered writer which collects pushed datapoints in memory and sends them with put
+        when batch_size datapoints are buffered or flush_interval seconds have passed, whichever comes first.
+
+        :param batch_size: Amount of buffered datapoints which triggers a flush
+        :param flush_interval: Maximum amount of seconds between flushes
+        :param max_buffer: Maximum amount of datapoints kept in memory
+        :param block: If True, pushing to a full buffer waits for space, otherwise the datapoints are dropped
+        :param block_timeout: Maximum seconds to wait for space before dropping, None waits forever
+        :return: A started BatchWriter, remember to close() it
+        """
+        writer = BatchWriter(self, batch_size=batch_size, flush_interval=flush_interval, max_buffer=max_buffer,
+                             block=block, block_timeout=block_timeout)
+        # Tracked for the telemetry reports
+        if self._writers is None:
+            self._writers = weakref.WeakSet()
+        self._writers.add(writer)
+        return writer
+
     def query_metric(self, metric_type, metric_id, start=None, end=None, **query_options):
         """
         Query for metrics datapoints from the server.
@@ -156,23 +444,105 @@ class HawkularMetricsClient(HawkularBaseClient):
         :param end: Milliseconds since epoch or datetime instance
         :param query_options: For possible query_options, see the Hawkular-Metrics documentation.
         """
-        if start is not None:
-            if type(start) is datetime:
-                query_options['start'] = datetime_to_time_millis(start)
-            else:
-                query_options['start'] = start
-
-        if end is not None:
-            if type(end) is datetime:
-                query_options['end'] = datetime_to_time_millis(end)
-            else:
-                query_options['end'] = end
+        self._time_options(query_options, start, end)
 
         return self._get(
             self._get_metrics_raw_url(
                 self._get_metrics_single_url(metric_type, metric_id)),
             **query_options)
 
+    def iter_metric(self, metric_type, metric_id, start=None, end=None, **query_options):
+        """
+        Query for metrics datapoints from the server and iterate over them while the response is
+        being read. Unlike query_metric, memory use does not grow with the size of the result.
+        The iterator should be exhausted or closed to release the connection.
+
+        :param metric_type: MetricType to be matched (required)
+        :param metric_id: Exact string matching metric id
+        :param start: Milliseconds since epoch or datetime instance
+        :param end: Milliseconds since epoch or datetime instance
+        :param query_options: For possible query_options, see the Hawkular-Metrics documentation.
+        :return: Iterator of datapoint dicts
+        """
+        self._time_options(query_options, start, end)
+
+        return self._get_stream(
+            self._get_metrics_raw_url(
+                self._get_metrics_single_url(metric_type, metric_id)),
+            **query_options)
+
+    def iter_metric_chunked(self, metric_type, metric_id, start, end=None, window=None, limit=None, max_workers=1, **query_options):
+        """
+        Read the datapoints of a long time range with several smaller queries and iterate over the
+        results as one stream. The range is split into sub-windows of the given duration and / or read
+        in pages of limit datapoints, continuing from the last timestamp of the previous page.
+
+        With max_workers=1 the sub-windows are streamed one after another. With more workers, up to
+        max_workers sub-windows are fetched in parallel and kept in memory until their turn comes.
+
+        Datapoints are returned in ascending order unless order='DESC' is given as a query option.
+
+        :param metric_type: MetricType to be matched (required)
+        :param metric_id: Exact string matching metric id
+        :param start: Milliseconds since epoch or datetime instance
+        :param end: Milliseconds since epoch or datetime instance, defaults to current time
+        :param window: Duration of a sub-window as timedelta or milliseconds, None reads the range in one window
+        :param limit: Maximum amount of datapoints fetched per request, None fetches each window at once
+        :param max_workers: Amount of sub-windows fetched in parallel
+        :param query_options: For possible query_options, see the Hawkular-Metrics documentation.
+        """
+        start = int(datetime_to_time_millis(start)) if type(start) is datetime else int(start)
+        end = time_millis() if end is None else end
+        end = int(datetime_to_time_millis(end)) if type(end) is datetime else int(end)
+
+        if window is None:
+            window = end - start
+        elif type(window) is timedelta:
+            window = int(window.total_seconds() * 1000)
+
+        order = query_options.setdefault('order', 'ASC').upper()
+
+        windows = [(s, min(s + window, end)) for s in range(start, end, max(window, 1))]
+        if order == 'DESC':
+            windows.reverse()
+
+        if max_workers <= 1:
+            for w in windows:
+                for datapoint in self._iter_window(metric_type, metric_id, w, limit, order, query_options):
+                    yield datapoint
+            return
+
+        fetch = lambda w: list(self._iter_window(metric_type, metric_id, w, limit, order, query_options))
+        for i in range(0, len(windows), max_workers):
+            for datapoints, error in map_concurrently(fetch, windows[i:i + max_workers], max_workers):
+                if error is not None:
+                    raise error
+                for datapoint in datapoints:
+                    yield datapoint
+
+    def _iter_window(self, metric_type, metric_id, window, limit, order, query_options):
+        start, end = window
+        while start < end:
+            options = dict(query_options)
+            if limit is not None:
+                options['limit'] = limit
+
+            count = 0
+            last = None
+            for datapoint in self.iter_metric(metric_type, metric_id, start, end, **options):
+                count += 1
+                last = datapoint
+                yield datapoint
+
+            if limit is None or count < limit:
+                return
+
+            # Continue after the last timestamp of the page, end is exclusive
+            if order == 'DESC':
+                end = int(last['timestamp'])
+            else:
+                start = int(last['timestamp']) + 1
+
     def query_metric_stats(self, metric_type, metric_id=None, start=None, end=None, bucketDuration=None, **query_options):
         """
         Query for metric aggregates from the server. This is called buckets in the Hawkular-Metrics documentation.
@@ -184,23 +554,7 @@ class HawkularMetricsClient(HawkularBaseClient):
         :param bucketDuration: The timedelta or duration of buckets. Can be a string presentation or timedelta object
         :param query_options: For possible query_options, see the Hawkular-Metrics documentation.
         """
-        if start is not None:
-            if type(start) is datetime:
-                query_options['start'] = datetime_to_time_millis(start)
-            else:
-                query_options['start'] = start
-
-        if end is not None:
-            if type(end) is datetime:
-                query_options['end'] = datetime_to_time_millis(end)
-            else:
-                query_options['end'] = end
-
-        if bucketDuration is not None:
-            if type(bucketDuration) is timedelta:
-                query_options['bucketDuration'] = timedelta_to_duration(bucketDuration)
-            else:
-                query_options['bucketDuration'] = bucketDuration
+        self._time_options(query_options, start, end, bucketDuration)
 
         if metric_id is not None:
             url = self._get_metrics_stats_url(self._get_metrics_single_url(metric_type, metric_id))
@@ -209,8 +563,152 @@ class HawkularMetricsClient(HawkularBaseClient):
                 raise HawkularError('Tags are required when querying without metric_id')
             url = self._get_metrics_stats_url(self._get_url(metric_type))
 
+        if self.stats_cache is not None:
+            duration = duration_to_millis(query_options.get('bucketDuration'))
+            if duration and 'start' in query_options and 'buckets' not in query_options:
+                return self._query_cached_stats(url, duration, query_options)
+
         return self._get(url, **query_options)
 
+    def _query_cached_stats(self, url, duration, query_options):
+        now = time_millis()
+        start = int(float(query_options.pop('start')))
+        end = int(float(query_options.pop('end', now)))
+        start -= start % duration
+
+        starts = list(range(start, end, duration))
+        completed_before = min(end, now - int(self.stats_cache.grace * 1000))
+        key = (self.tenant_id, url, duration, self._filter_key(query_options))
+
+        cached = self.stats_cache.get(key, [s for s in starts if s + duration <= completed_before])
+        buckets = [cached[s] for s in starts if s in cached and cached[s] is not None]
+
+        fetch_start = start + len(cached) * duration
+        if fetch_start >= end:
+            return buckets
+
+        fetched = self._get(url, start=fetch_start, end=end, **query_options) or []
+        completed = dict((s, None) for s in starts if s >= fetch_start and s + duration <= completed_before)
+        for b in fetched:
+            if b.get('start') in completed:
+                completed[b['start']] = b
+        self.stats_cache.put(key, completed)
+
+        return buckets + fetched
+
+    def query_metric_columns(self, metric_type, metric_id, start=None, end=None, as_numpy=False, **query_options):
+        """
+        Query for numeric datapoints and return them as columns instead of a list of dicts. The response
+        is decoded while it is read, see iter_metric.
+
+        :param metric_type: MetricType to be matched (required), a numeric type
+        :param metric_id: Exact string matching metric id
+        :param start: Milliseconds since epoch or datetime instance
+        :param end: Milliseconds since epoch or datetime instance
+        :param as_numpy: Return numpy arrays instead of array.array columns, requires numpy
+        :param query_options: For possible query_options, see the Hawkular-Metrics documentation.
+        :return: DatapointColumns with timestamp and value columns
+        """
+        return DatapointColumns.from_datapoints(
+            self.iter_metric(metric_type, metric_id, start, end, **query_options), as_numpy)
+
+    def query_metric_stats_columns(self, metric_type, metric_id=None, start=None, end=None, bucketDuration=None,
+                                   as_numpy=False, **query_options):
+        """
+        Query for metric aggregates and return them as columns, see query_metric_stats.
+
+        :param as_numpy: Return numpy arrays instead of array.array columns, requires numpy
+        :return: BucketColumns with start, end, samples, min, max, avg, median, sum and percentiles columns
+        """
+        return BucketColumns.from_buckets(
+            self.query_metric_stats(metric_type, metric_id, start, end, bucketDuration, **query_options), as_numpy)
+
+    def query_metrics(self, metrics, start=None, end=None, max_workers=8, **query_options):
+        """
+        Query the datapoints of several metrics with a shared time range.
+
+        When the server supports it, the ids of each metric type are fetched with a single request,
+        otherwise the metrics are queried in parallel using at most max_workers threads.
+
+        :param metrics: List of (metric_type, metric_id) tuples
+        :param start: Milliseconds since epoch or datetime instance
+        :param end: Milliseconds since epoch or datetime instance
+        :param max_workers: Maximum amount of parallel requests
+        :param query_options: For possible query_options, see the Hawkular-Metrics documentation.
+        :return: A dict of metric_id -> {'data': list of datapoints or None, 'error': Exception or None}
+        """
+        self._time_options(query_options, start, end)
+
+        def multi_query(metric_type, ids):
+            body = dict(query_options, ids=ids)
+            response = self._post(self._get_metrics_raw_url(self._get_url(metric_type)) + '/query', body, idempotent=True)
+            return dict((m['id'], m['data']) for m in response)
+
+        bulk = self._supports(self.multi_raw_query_version) and \
+            set(query_options) <= set(['start', 'end', 'limit', 'order', 'fromEarliest'])
+
+        return self._query_many(metrics, bulk, multi_query,
+                                lambda m: self.query_metric(m[0], m[1], **query_options), max_workers)
+
+    def query_metrics_stats(self, metrics, start=None, end=None, bucketDuration=None, max_workers=8, **query_options):
+        """
+        Query the aggregates of several metrics with a shared time range and bucket definition.
+
+        When the server supports it, gauges and counters are fetched with a single request, other metrics
+        are queried in parallel using at most max_workers threads.
+
+        :param metrics: List of (metric_type, metric_id) tuples
+        :param start: Milliseconds since epoch or datetime instance
+        :param end: Milliseconds since epoch or datetime instance
+        :param bucketDuration: The timedelta or duration of buckets. Can be a string presentation or timedelta object
+        :param max_workers: Maximum amount of parallel requests
+        :param query_options: For possible query_options, see the Hawkular-Metrics documentation.
+        :return: A dict of metric_id -> {'data': list of buckets or None, 'error': Exception or None}
+        """
+        self._time_options(query_options, start, end, bucketDuration)
+
+        def multi_query(metric_type, ids):
+            short = MetricType.short(metric_type)
+            body = dict(query_options, metrics={short: ids})
+            response = self._post(self._get_metrics_stats_url(self._get_url()) + '/query', body, idempotent=True)
+            return response.get(short, {})
+
+        bulk = self._supports(self.multi_stats_query_version) and \
+            set(query_options) <= set(['start', 'end', 'buckets', 'bucketDuration', 'percentiles', 'fromEarliest'])
+
+        return self._query_many(metrics, bulk, multi_query,
+                                lambda m: self.query_metric_stats(m[0], m[1], **query_options), max_workers,
+                                bulk_types=[MetricType.Gauge, MetricType.Counter])
+
+    def _query_many(self, metrics, bulk, multi_query, single_query, max_workers, bulk_types=None):
+        results = {}
+        pending = []
+
+        if bulk:
+            by_type = collections.OrderedDict()
+            for metric_type, metric_id in metrics:
+                if bulk_types is None or metric_type in bulk_types:
+                    by_type.setdefault(metric_type, []).append(metric_id)
+                else:
+                    pending.append((metric_type, metric_id))
+
+            types = list(by_type.items())
+            for (metric_type, ids), (response, error) in zip(types, map_concurrently(
+                    lambda t: multi_query(t[0], t[1]), types, max_workers)):
+                if error is not None:
+                    # Fall back to querying the ids one by one, which also reports the errors per id
+                    pending.extend((metric_type, metric_id) for metric_id in ids)
+                    continue
+                for metric_id in ids:
+                    results[metric_id] = {'data': response.get(metric_id, []), 'error': None}
+        else:
+            pending = list(metrics)
+
+        for (_, metric_id), (data, error) in zip(pending, map_concurrently(single_query, pending, max_workers)):
+            results[metric_id] = {'data': data, 'error': error}
+
+        return results
+
     def query_metric_definition(self, metric_type, metric_id):
         """
         Query definition of a single metric id.
@@ -218,7 +716,8 @@ class HawkularMetricsClient(HawkularBaseClient):
         :param metric_type: MetricType to be matched (required)
         :param metric_id: Exact string matching metric id
         """
-        return self._get(self._get_metrics_single_url(metric_type, metric_id))
+        return self._cached(lambda: self._get(self._get_metrics_single_url(metric_type, metric_id)),
+                            'definition', metric_type, metric_id)
 
     def query_metric_definitions(self, metric_type=None, id_filter=None, **tags):
         """
@@ -239,7 +738,7 @@ class HawkularMetricsClient(HawkularBaseClient):
         if len(tags) > 0:
             params['tags'] = self._transform_tags(**tags)
 
-        return self._get(self._get_url(), **params)
+        return self._cached(lambda: self._get(self._get_url(), **params), 'definitions', params)
 
     def query_tag_values(self, metric_type=None, **tags):
         """
@@ -250,7 +749,8 @@ class HawkularMetricsClient(HawkularBaseClient):
         """
         tagql = self._transform_tags(**tags)
 
-        return self._get(self._get_metrics_tags_url(self._get_url(metric_type)) + '/{}'.format(tagql))
+        return self._cached(lambda: self._get(self._get_metrics_tags_url(self._get_url(metric_type)) + '/{}'.format(tagql)),
+                            'tag_values', metric_type, tagql)
 
     def create_metric_definition(self, metric_type, metric_id, **tags):
         """
@@ -271,13 +771,14 @@ class HawkularMetricsClient(HawkularBaseClient):
             if len(tags) > 0:
                 item['tags'] = tags
 
-        json_data = json.dumps(item, indent=2)
         try:
-            self._post(self._get_url(metric_type), json_data)
+            self._post(self._get_url(metric_type), item)
         except HawkularError as e:
             if e.code == 409:
                 return False
             raise e
+        finally:
+            self._invalidate_definitions()
 
         return True
 
@@ -288,8 +789,8 @@ class HawkularMetricsClient(HawkularBaseClient):
         :param metric_type: MetricType to be matched (required)
         :param metric_id: Exact string matching metric id
         """
-        definition = self._get(self._get_metrics_tags_url(self._get_metrics_single_url(metric_type, metric_id)))
-        return definition
+        return self._cached(lambda: self._get(self._get_metrics_tags_url(self._get_metrics_single_url(metric_type, metric_id))),
+                            'tags', metric_type, metric_id)
 
     def update_metric_tags(self, metric_type, metric_id, **tags):
         """
@@ -299,7 +800,10 @@ class HawkularMetricsClient(HawkularBaseClient):
         :param metric_id: Exact string matching metric id
         :param tags: Updated key/value tag values of the metric
         """
-        self._put(self._get_metrics_tags_url(self._get_metrics_single_url(metric_type, metric_id)), tags, parse_json=False)
+        try:
+            self._put(self._get_metrics_tags_url(self._get_metrics_single_url(metric_type, metric_id)), tags, parse_json=False)
+        finally:
+            self._invalidate_definitions()
 
     def delete_metric_tags(self, metric_type, metric_id, **deleted_tags):
         """
@@ -312,7 +816,10 @@ class HawkularMetricsClient(HawkularBaseClient):
         tags = self._transform_tags(**deleted_tags)
         tags_url = self._get_metrics_tags_url(self._get_metrics_single_url(metric_type, metric_id)) + '/{0}'.format(tags)
 
-        self._delete(tags_url)
+        try:
+            self._delete(tags_url)
+        finally:
+            self._invalidate_definitions()
 
     """
     Tenant related queries
@@ -335,7 +842,7 @@ class HawkularMetricsClient(HawkularBaseClient):
         if retentions is not None:
             item['retentions'] = retentions
 
-        self._post(self._get_tenants_url(), json.dumps(item, indent=2))
+        self._post(self._get_tenants_url(), item)
 
     def delete_tenant(self, tenant_id):
         """
@@ -343,10 +850,214 @@ class HawkularMetricsClient(HawkularBaseClient):
         :param tenant_id: Tenant id to be sent for deletion process
         """
         self._delete(self._get_single_id_url(self._get_tenants_url(), tenant_id))
+        self._invalidate_definitions(tenant_id)
+
+class BatchWriter(object):
+    """
+    Buffers datapoints in memory, grouped by metric type and id, and sends them in batches with
+    HawkularMetricsClient.put from a background thread. Create instances with client.batch_writer().
+
+    Batches which fail because of connection problems or server errors are put back to the buffer and
+    retried on the next flush, other failures drop the batch. Datapoints that do not fit the buffer are
+    dropped and counted, see stats().
+    """
+    def __init__(self, client, batch_size=1000, flush_interval=5.0, max_buffer=100000, block=True, block_timeout=None):
+        self.client = client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.block = block
+        self.block_timeout = block_timeout
+        self.last_error = None
+
+        self._buffer = collections.OrderedDict()
+        self._buffered = 0
+        self._flushed = 0
+        self._dropped = 0
+        self._batches = 0
+        self._failures = 0
+        self._closed = False
+
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+        self._thread = threading.Thread(target=self._run, name='hawkular-batch-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def push(self, metric_type, metric_id, value, timestamp=None):
+        """
+        Buffer a single datapoint, see HawkularMetricsClient.push
+
+        :return: True if the datapoint was buffered, False if it was dropped
+        """
+        return self._add(metric_type, metric_id, [create_datapoint(value, timestamp)])
+
+    def put(self, data):
+        """
+        Buffer datapoints of one or more metrics, see HawkularMetricsClient.put
+
+        :param data: A dict or a list of dicts created with create_metric(metric_type, metric_id, datapoints)
+        :return: True if all the datapoints were buffered, False if some were dropped
+        """
+        if not isinstance(data, list):
+            data = [data]
+
+        accepted = True
+        for d in data:
+            metric_type = d.get('type')
+            if metric_type is None:
+                raise HawkularError('Undefined MetricType')
+            accepted = self._add(metric_type, d['id'], d['data']) and accepted
+        return accepted
+
+    def _add(self, metric_type, metric_id, datapoints):
+        if self._closed:
+            raise ValueError('BatchWriter is closed')
+
+        size = len(datapoints)
+        if size > self.max_buffer:
+            # Would never fit the buffer at once, add it in parts
+            accepted = True
+            for i in range(0, size, self.max_buffer):
+                accepted = self._add(metric_type, metric_id, datapoints[i:i + self.max_buffer]) and accepted
+            return accepted
+
+        with self._not_full:
+            if self._buffered + size > self.max_buffer and self.block:
+                deadline = None if self.block_timeout is None else time.time() + self.block_timeout
+                while self._buffered + size > self.max_buffer and not self._closed:
+                    self._wakeup.set()
+                    if deadline is None:
+                        self._not_full.wait(self.flush_interval)
+                    else:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            break
+                        self._not_full.wait(remaining)
+
+            if self._buffered + size > self.max_buffer:
+                self._dropped += size
+                return False
+
+            self._buffer.setdefault((metric_type, metric_id), []).extend(datapoints)
+            self._buffered += size
+            full = self._buffered >= self.batch_size
+
+        if full:
+            self._wakeup.set()
+        return True
+
+    def _requeue(self, batch, size):
+        with self._lock:
+            pending = self._buffer
+            self._buffer = collections.OrderedDict()
+            for key, datapoints in batch:
+                self._buffer[key] = datapoints
+
+            for key, datapoints in pending.items():
+                self._buffer.setdefault(key, []).extend(datapoints)
+
+            self._buffered += size
+
+            # Whatever doesn't fit anymore is dropped, oldest metrics first
+            while self._buffered > self.max_buffer and self._buffer:
+                _, datapoints = self._buffer.popitem(last=False)
+                self._buffered -= len(datapoints)
+                self._dropped += len(datapoints)
+
+    def flush(self):
+        """
+        Send everything that is currently buffered.
+
+        :return: Amount of datapoints sent
+        """
+        return self._flush(raise_errors=True)
+
+    def _flush(self, raise_errors):
+        with self._flush_lock:
+            with self._not_full:
+                batch = list(self._buffer.items())
+                size = self._buffered
+                self._buffer = collections.OrderedDict()
+                self._buffered = 0
+                self._not_full.notify_all()
+
+            if size == 0:
+                return 0
+
+            try:
+                self.client.put([create_metric(t, i, d) for (t, i), d in batch])
+            except Exception as e:
+                self.last_error = e
+                with self._lock:
+                    self._failures += 1
+
+                if is_transient_error(e):
+                    self._requeue(batch, size)
+                else:
+                    with self._lock:
+                        self._dropped += size
+
+                if raise_errors:
+                    raise
+                return 0
+
+            with self._lock:
+                self._flushed += size
+                self._batches += 1
+            return size
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if not self._closed:
+                self._flush(raise_errors=False)
+
+    def close(self):
+        """
+        Stop the background thread and flush the remaining datapoints.
+        """
+        if self._closed:
+            return
+
+        self._closed = True
+        self._wakeup.set()
+        with self._not_full:
+            self._not_full.notify_all()
+        self._thread.join()
+        self.flush()
+
+    def stats(self):
+        """
+        Returns a dict with the amount of datapoints currently buffered, flushed and dropped as well as the
+        amount of sent batches and failed flushes.
+        """
+        with self._lock:
+            return {'buffered': self._buffered,
+                    'flushed': self._flushed,
+                    'dropped': self._dropped,
+                    'batches': self._batches,
+                    'failures': self._failures}
 
 """
 Static methods
 """
+def is_transient_error(e):
+    """
+    Returns True for errors after which sending the same request later may succeed
+    """
+    return isinstance(e, HawkularConnectionError) or (isinstance(e, HawkularError) and e.code >= 500)
+
 def time_millis():
     """
     Returns current milliseconds since epoch
@@ -356,6 +1067,20 @@ def time_millis():
 def timedelta_to_duration(td):
     return '{}s'.format(int(td.total_seconds()))
 
+_duration_units = {'ms': 1, 's': 1000, 'mn': 60000, 'min': 60000, 'h': 3600000, 'd': 86400000}
+
+def duration_to_millis(duration):
+    """
+    Returns the length of a Hawkular-Metrics duration string or timedelta in milliseconds, None if it can't be parsed
+    """
+    if isinstance(duration, timedelta):
+        return int(duration.total_seconds() * 1000)
+
+    match = re.match(r'^(\d+)(ms|s|mn|min|h|d)$', duration or '')
+    if match is None:
+        return None
+    return int(match.group(1)) * _duration_units[match.group(2)]
+
 def datetime_to_time_millis(dt):
     return '{:.0f}'.format((dt - HawkularMetricsClient.epoch).total_seconds() * 1000)
 
@@ -0,0 +1,296 @@
+"""
+   Copyright 2015-2017 Red Hat, Inc. and/or its affiliates
+   and other contributors.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+import os
+import threading
+import time
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from hawkular.client import encode_json
+
+
+class DiskSpool(object):
+    """
+    Append-only on-disk queue of JSON records, stored one record per line in numbered segment files
+    of at most segment_size bytes. Records are read back in order with peek() and commit(), fully
+    consumed segments are deleted and the read position is kept in a cursor file, so a restarted
+    process continues where the previous one stopped.
+
+    Writes are flushed to the operating system immediately and synced to the disk at most every
+    fsync_interval seconds, 0 syncs every record and None leaves it to the operating system. When the
+    segments take more than max_size bytes the oldest ones are deleted, unread records included.
+    """
+    prefix = 'spool-'
+    suffix = '.jsonl'
+
+    def __init__(self, directory, segment_size=16 * 1024 * 1024, max_size=1024 * 1024 * 1024, fsync_interval=1.0):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_size = max_size
+        self.fsync_interval = fsync_interval
+
+        self._lock = threading.RLock()
+        self._sizes = {}
+        self._writer = None
+        self._write_seq = None
+        self._reader = None
+        self._read_seq = None
+        self._pending = None
+        self._synced = True
+        self._last_sync = time.time()
+        self._counters = {'appended': 0, 'replayed': 0, 'corrupted': 0, 'dropped_segments': 0, 'dropped_bytes': 0}
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        for name in os.listdir(directory):
+            if name.startswith(self.prefix) and name.endswith(self.suffix):
+                seq = int(name[len(self.prefix):-len(self.suffix)])
+                self._sizes[seq] = os.path.getsize(self._path(seq))
+
+        self._restore_cursor()
+
+    def _path(self, seq):
+        return os.path.join(self.directory, '{0}{1:012d}{2}'.format(self.prefix, seq, self.suffix))
+
+    def _cursor_path(self):
+        return os.path.join(self.directory, 'cursor')
+
+    def _restore_cursor(self):
+        try:
+            with open(self._cursor_path()) as f:
+                seq, offset = map(int, f.read().split())
+        except (IOError, OSError, ValueError):
+            return
+
+        for old in [s for s in self._sizes if s < seq]:
+            self._delete(old)
+        if seq in self._sizes:
+            self._open_reader(seq, offset)
+
+    def _save_cursor(self):
+        if self._reader is None:
+            return
+        # A damaged cursor only causes records to be replayed again
+        with open(self._cursor_path(), 'w') as f:
+            f.write('{0} {1}'.format(self._read_seq, self._reader.tell()))
+
+    def _open_reader(self, seq, offset=0):
+        if self._reader is not None:
+            self._reader.close()
+        self._reader = open(self._path(seq), 'rb')
+        self._reader.seek(offset)
+        self._read_seq = seq
+        self._pending = None
+
+    def _delete(self, seq):
+        if seq == self._read_seq:
+            self._reader.close()
+            self._reader, self._read_seq, self._pending = None, None, None
+        if seq == self._write_seq:
+            self._writer.close()
+            self._writer, self._write_seq = None, None
+        self._sizes.pop(seq, None)
+        try:
+            os.remove(self._path(seq))
+        except OSError:
+            pass
+
+    def _roll(self):
+        if self._writer is not None:
+            self._sync()
+            self._writer.close()
+        # Never append to a segment of a previous process, it may end with a torn write
+        self._write_seq = max(self._sizes) + 1 if self._sizes else 0
+        self._writer = open(self._path(self._write_seq), 'ab')
+        self._sizes[self._write_seq] = 0
+
+    def _sync(self):
+        if self._writer is not None and not self._synced:
+            os.fsync(self._writer.fileno())
+        self._synced = True
+        self._last_sync = time.time()
+
+    def append(self, record):
+        """
+        Append a JSON serializable record to the spool
+        """
+        line = encode_json(record)
+        if not isinstance(line, bytes):
+            line = line.encode('utf-8')
+        line += b'\n'
+
+        with self._lock:
+            if self._writer is None or self._sizes[self._write_seq] + len(line) > self.segment_size:
+                self._roll()
+
+            self._writer.write(line)
+            self._writer.flush()
+            self._sizes[self._write_seq] += len(line)
+            self._counters['appended'] += 1
+            self._synced = False
+
+            if self.fsync_interval is not None and time.time() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+            # Oldest segments go first, the one being written is always kept
+            while sum(self._sizes.values()) > self.max_size and len(self._sizes) > 1:
+                oldest = min(self._sizes)
+                self._counters['dropped_segments'] += 1
+                self._counters['dropped_bytes'] += self._sizes[oldest]
+                self._delete(oldest)
+
+    def sync(self):
+        """
+        Sync the appended records to the disk if the fsync_interval has passed
+        """
+        with self._lock:
+            if self.fsync_interval is not None and time.time() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def peek(self):
+        """
+        Returns the oldest record which has not been committed, None if the spool is empty
+        """
+        with self._lock:
+            while self._pending is None:
+                if self._reader is None:
+                    if not self._sizes:
+                        return None
+                    self._open_reader(min(self._sizes))
+
+                position = self._reader.tell()
+                line = self._reader.readline()
+                if line.endswith(b'\n'):
+                    try:
+                        self._pending = json.loads(line.decode('utf-8'))
+                    except ValueError:
+                        self._counters['corrupted'] += 1
+                    continue
+
+                if self._read_seq == self._write_seq:
+                    # Everything written so far has been read
+                    self._reader.seek(position)
+                    return None
+
+                # End of an older segment, a partial last line is what remains of a torn write
+                if line:
+                    self._counters['corrupted'] += 1
+                self._delete(self._read_seq)
+
+            return self._pending
+
+    def commit(self):
+        """
+        Mark the record returned by peek() as consumed
+        """
+        with self._lock:
+            if self._pending is None:
+                return
+            self._pending = None
+            self._counters['replayed'] += 1
+            self._save_cursor()
+
+    def empty(self):
+        return self.peek() is None
+
+    def close(self):
+        with self._lock:
+            self._sync()
+            if self._writer is not None:
+                self._writer.close()
+                self._writer, self._write_seq = None, None
+            if self._reader is not None:
+                self._reader.close()
+                self._reader, self._read_seq, self._pending = None, None, None
+
+    def stats(self):
+        """
+        Returns a dict with the amount of segments and bytes on disk and the amount of records appended,
+        replayed and found corrupted, as well as the segments and bytes dropped because of max_size
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['segments'] = len(self._sizes)
+            stats['bytes'] = sum(self._sizes.values())
+            return stats
+
+
+class SpoolReplayer(object):
+    """
+    Background thread sending the records of a DiskSpool in order with send(record). When sending fails
+    with an error for which is_transient(error) is True, the record is tried again after retry_interval
+    seconds, doubling up to max_retry_interval while the failures continue. Other errors drop the record.
+    """
+    def __init__(self, spool, send, is_transient, retry_interval=1.0, max_retry_interval=60.0):
+        self.spool = spool
+        self.send = send
+        self.is_transient = is_transient
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.last_error = None
+        self.dropped = 0
+
+        self._closed = False
+        self._replay_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='hawkular-spool-replayer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def replay(self):
+        """
+        Send spooled records until the spool is empty or sending fails
+
+        :return: True if the spool was drained
+        """
+        with self._replay_lock:
+            while not self._closed:
+                record = self.spool.peek()
+                if record is None:
+                    return True
+
+                try:
+                    self.send(record)
+                except Exception as e:
+                    self.last_error = e
+                    if self.is_transient(e):
+                        return False
+                    self.dropped += 1
+
+                self.spool.commit()
+            return False
+
+    def _run(self):
+        interval = self.retry_interval
+        while not self._closed:
+            self.spool.sync()
+            if self.replay():
+                interval = self.retry_interval
+                self._wakeup.wait(self.retry_interval)
+            else:
+                self._wakeup.wait(interval)
+                interval = min(interval * 2, self.max_retry_interval)
+            self._wakeup.clear()
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join()
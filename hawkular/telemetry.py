@@ -0,0 +1,107 @@
+"""
+   Copyright 2015-2017 Red Hat, Inc. and/or its affiliates
+   and other contributors.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+import re
+import socket
+import threading
+import time
+
+
+def default_prefix():
+    return 'hawkular.client.' + socket.gethostname()
+
+
+class ClientTelemetry(object):
+    """
+    Health figures of a client, reported as gauges with ids starting with prefix at most every
+    interval seconds.
+
+    The figures are read from sources, callables returning a dict of name -> number or None when
+    they have nothing to report, registered with add_source(name, source). The values of a source
+    are reported as {prefix}.{name}.{key}. Counters kept with count() are reported under the
+    source name 'client'.
+
+    Counters are reported as running totals, so a lost report is made up for by the next one.
+    """
+    def __init__(self, prefix=None, interval=60):
+        self.prefix = prefix if prefix is not None else default_prefix()
+        self.interval = interval
+        self._sources = []
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._next_report = 0
+        self.add_source('client', self.counters)
+
+    def add_source(self, name, source):
+        self._sources.append((name, source))
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def collect(self):
+        """
+        Returns the current figures of all the sources as a dict of metric id -> value
+        """
+        values = {}
+        for name, source in self._sources:
+            stats = source()
+            for key, value in (stats or {}).items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    values['{0}.{1}.{2}'.format(self.prefix, name, key)] = value
+        return values
+
+    def due(self):
+        """
+        Claims the next report, returns True at most once per interval
+        """
+        now = time.time()
+        with self._lock:
+            if now < self._next_report:
+                return False
+            self._next_report = now + self.interval
+            return True
+
+    def report(self, timestamp):
+        """
+        Returns the figures as metric dicts without type, each with a single datapoint at timestamp
+        """
+        return [{'id': metric_id, 'data': [{'timestamp': timestamp, 'value': float(value)}]}
+                for metric_id, value in sorted(self.collect().items())]
+
+
+def latency_source(instrumentation, base_url_path):
+    """
+    Returns a source reporting the request count, errors and p50, p99 and max latency in milliseconds of
+    every endpoint in the instrumentation snapshot, named by the endpoint path below base_url_path
+    """
+    def source():
+        values = {}
+        for endpoint, s in instrumentation.snapshot().items():
+            method, _, template = endpoint.partition(' ')
+            if template.startswith(base_url_path):
+                template = template[len(base_url_path):]
+            name = '.'.join([method.lower()] + [re.sub(r'[^\w-]', '_', p) for p in template.split('/') if p])
+            values[name + '.count'] = s['count']
+            values[name + '.errors'] = s['errors']
+            for key in ('p50', 'p99', 'max'):
+                values['{0}.{1}_ms'.format(name, key)] = s[key] * 1000
+        return values
+    return source
@@ -0,0 +1,519 @@
+"""
+   Copyright 2015-2017 Red Hat, Inc. and/or its affiliates
+   and other contributors.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+from __future__ import unicode_literals
+
+import collections
+import errno
+import io
+import random
+import socket
+import threading
+import time
+import zlib
+
+try:
+    # Python 3
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException
+    from urllib.error import HTTPError, URLError
+    from urllib.parse import urlsplit
+except ImportError:
+    # Fall back to Python 2's httplib
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException
+    from urllib2 import HTTPError, URLError
+    from urlparse import urlsplit
+
+
+if str is bytes:
+    def native_str(value):
+        """
+        httplib joins the request line and headers with the body, unicode would fail on a binary body
+        """
+        return value.encode('latin-1') if isinstance(value, type('')) else value
+else:
+    def native_str(value):
+        return value
+
+
+def gzip_compress(data, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class RetryPolicy(object):
+    """
+    Decides which failed requests are sent again and how long to wait before each attempt.
+
+    A request is tried at most max_attempts times. Responses with one of the status_codes and
+    connection errors (URLError, including timeouts) are retried, but only for idempotent requests:
+    the idempotent_methods, or requests explicitly marked as idempotent such as writing datapoints.
+    Refused connections are retried for every request as nothing was sent.
+
+    The wait before attempt n is a random value between 0 and backoff * 2 ** (n - 2) seconds, capped
+    at max_backoff ("full jitter", spreads the retries of many clients). Without jitter the upper
+    bound itself is used. A Retry-After header of the response is respected up to max_backoff.
+    """
+    def __init__(self,
+                 max_attempts=3,
+                 backoff=0.1,
+                 max_backoff=5.0,
+                 jitter=True,
+                 status_codes=(502, 503, 504),
+                 exceptions=(URLError,),
+                 idempotent_methods=('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.status_codes = status_codes
+        self.exceptions = exceptions
+        self.idempotent_methods = idempotent_methods
+        self._lock = threading.Lock()
+        self._counters = {'retries': 0, 'recovered': 0, 'exhausted': 0}
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def is_retryable(self, method, error, idempotent=None):
+        if idempotent is None:
+            idempotent = method.upper() in self.idempotent_methods
+
+        if isinstance(error, CircuitOpenError):
+            return False
+        if isinstance(error, HTTPError):
+            return idempotent and error.code in self.status_codes
+        if isinstance(error, URLError) and getattr(error.reason, 'errno', None) == errno.ECONNREFUSED:
+            return True
+        return idempotent and isinstance(error, self.exceptions)
+
+    def should_retry(self, method, error, attempt, idempotent=None):
+        """
+        Returns True if another attempt should be made after the given failed attempt (counting from 1)
+        """
+        if not self.is_retryable(method, error, idempotent):
+            return False
+        if attempt >= self.max_attempts:
+            self._count('exhausted')
+            return False
+        self._count('retries')
+        return True
+
+    def succeeded(self, attempt):
+        if attempt > 1:
+            self._count('recovered')
+
+    def delay(self, attempt, error=None):
+        """
+        Seconds to wait before the attempt following the given failed attempt
+        """
+        delay = min(self.max_backoff, self.backoff * (2 ** (attempt - 1)))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+
+        retry_after = None
+        if isinstance(error, HTTPError) and error.hdrs is not None:
+            retry_after = error.hdrs.get('Retry-After')
+        try:
+            delay = max(delay, min(self.max_backoff, float(retry_after)))
+        except (TypeError, ValueError):
+            pass
+
+        return delay
+
+    def stats(self):
+        """
+        Returns a dict with the amount of retries, requests which succeeded after a retry and
+        requests which failed after max_attempts
+        """
+        with self._lock:
+            return dict(self._counters)
+
+
+class CircuitOpenError(URLError):
+    """
+    Raised without sending the request while the circuit of the endpoint is open
+    """
+    pass
+
+
+def endpoint_key(url):
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    return scheme, parts.hostname, parts.port or (443 if scheme == 'https' else 80)
+
+
+class CircuitBreaker(object):
+    """
+    Per endpoint (scheme, host, port) circuit breaker. After failure_threshold consecutive failures,
+    connection errors, timeouts or responses with status 500 or higher, the circuit opens and requests
+    to the endpoint fail immediately with CircuitOpenError. After reset_timeout seconds the circuit is
+    half-open: a single probe request is let through, closing the circuit if it succeeds and opening it
+    again if it fails.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        # key -> [state, consecutive failures, opened at, probe in flight]
+        self._circuits = {}
+        self._counters = {'opened': 0, 'rejected': 0}
+
+    def _circuit(self, key):
+        circuit = self._circuits.get(key)
+        if circuit is None:
+            circuit = self._circuits[key] = [self.CLOSED, 0, 0, False]
+        return circuit
+
+    @staticmethod
+    def is_failure(error):
+        if isinstance(error, HTTPError):
+            return error.code >= 500
+        return not isinstance(error, CircuitOpenError)
+
+    def before_request(self, key):
+        """
+        Raises CircuitOpenError if no request may be sent to the endpoint right now
+        """
+        with self._lock:
+            circuit = self._circuit(key)
+            if circuit[0] == self.OPEN and time.time() - circuit[2] >= self.reset_timeout:
+                circuit[0] = self.HALF_OPEN
+                circuit[3] = False
+
+            if circuit[0] == self.CLOSED:
+                return
+            if circuit[0] == self.HALF_OPEN and not circuit[3]:
+                circuit[3] = True
+                return
+
+            self._counters['rejected'] += 1
+
+        raise CircuitOpenError('Circuit open for {0}://{1}:{2}'.format(*key))
+
+    def record(self, key, error=None):
+        """
+        Record the outcome of a request sent to the endpoint, error is None for successful requests
+        """
+        failed = error is not None and self.is_failure(error)
+        with self._lock:
+            circuit = self._circuit(key)
+            circuit[3] = False
+            if not failed:
+                circuit[0], circuit[1] = self.CLOSED, 0
+                return
+
+            circuit[1] += 1
+            if circuit[0] == self.HALF_OPEN or (circuit[0] == self.CLOSED and circuit[1] >= self.failure_threshold):
+                circuit[0], circuit[2] = self.OPEN, time.time()
+                self._counters['opened'] += 1
+
+    def state(self, scheme, host, port):
+        with self._lock:
+            circuit = self._circuits.get((scheme, host, port))
+            if circuit is None:
+                return self.CLOSED
+            if circuit[0] == self.OPEN and time.time() - circuit[2] >= self.reset_timeout:
+                return self.HALF_OPEN
+            return circuit[0]
+
+    def stats(self):
+        """
+        Returns a dict with the amount of times a circuit was opened and requests rejected while open
+        """
+        with self._lock:
+            return dict(self._counters)
+
+
+class PooledResponse(object):
+    """
+    File-like wrapper around a response read from a pooled connection. Closing the
+    response hands the connection back to the pool if the body was fully consumed
+    and the server did not ask to close it, otherwise the connection is discarded.
+
+    gzip encoded bodies are decompressed while reading.
+    """
+    def __init__(self, pool, key, conn, response, url):
+        self.bytes_read = 0
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self.url = url
+        self.code = response.status
+        self.msg = response.reason
+        self.headers = response.msg
+
+        self._decompressor = None
+        self._buffer = b''
+        if (response.getheader('Content-Encoding') or '').lower() == 'gzip':
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def getcode(self):
+        return self.code
+
+    def info(self):
+        return self.headers
+
+    def geturl(self):
+        return self.url
+
+    def _read(self, amt=None):
+        data = self._response.read() if amt is None else self._response.read(amt)
+        self.bytes_read += len(data)
+        return data
+
+    def read(self, amt=None):
+        if self._decompressor is None and not self._buffer:
+            return self._read(amt)
+
+        if amt is None:
+            data, self._buffer = self._buffer, b''
+            if self._decompressor is not None:
+                data += self._decompressor.decompress(self._read()) + self._decompressor.flush()
+                self._decompressor = None
+            return data
+
+        while len(self._buffer) < amt and self._decompressor is not None:
+            chunk = self._read(amt)
+            if chunk:
+                self._buffer += self._decompressor.decompress(chunk)
+            else:
+                self._buffer += self._decompressor.flush()
+                self._decompressor = None
+
+        data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        return data
+
+    def close(self):
+        if self._conn is None:
+            return
+
+        conn, self._conn = self._conn, None
+        if self._response.isclosed() and not self._response.will_close:
+            self._pool._release(self._key, conn)
+        else:
+            self._response.close()
+            conn.close()
+
+
+class HawkularConnectionPool(object):
+    """
+    Thread-safe pool of keep-alive HTTP(S) connections, keyed by (scheme, host, port).
+
+    Each host keeps at most maxsize idle connections around for reuse, connections
+    idle for longer than idle_timeout seconds are closed instead of reused. More than
+    maxsize requests can be in flight at the same time, the surplus connections are
+    simply closed once their response has been read.
+
+    Request bodies of at least compression_threshold bytes are gzip compressed with
+    compression_level, None disables request compression. gzip encoded responses are
+    always accepted and transparently decompressed.
+
+    Failed requests are sent again as decided by the RetryPolicy retry, None disables retries.
+    Requests to endpoints whose circuit is open in the CircuitBreaker circuit_breaker fail
+    without being sent.
+
+    timeout is either the amount of seconds to wait for the connection and for each read, or a
+    (connect, read) tuple. None waits forever.
+    """
+    accepted_codes = [200, 201, 204]
+
+    def __init__(self, maxsize=10, idle_timeout=60, context=None, compression_threshold=None, compression_level=6,
+                 retry=None, circuit_breaker=None, timeout=None):
+        self.retry = retry
+        self.circuit_breaker = circuit_breaker
+        self.connect_timeout, self.read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.context = context
+        self.compression_threshold = compression_threshold
+        self.compression_level = compression_level
+        self._lock = threading.Lock()
+        self._idle = collections.defaultdict(collections.deque)
+
+    def _new_connection(self, key):
+        scheme, host, port = key
+        options = {}
+        if self.connect_timeout is not None:
+            options['timeout'] = self.connect_timeout
+        if scheme == 'https':
+            return HTTPSConnection(host, port, context=self.context, **options)
+        return HTTPConnection(host, port, **options)
+
+    def _connect(self, conn):
+        conn.connect()
+        if self.read_timeout != self.connect_timeout:
+            conn.sock.settimeout(self.read_timeout)
+
+    def _acquire(self, key):
+        """
+        Returns a tuple (connection, reused). Expired idle connections are closed on the way.
+        """
+        expired = []
+        conn = None
+        now = time.time()
+
+        with self._lock:
+            idle = self._idle[key]
+            while idle:
+                c, last_used = idle.pop()
+                if self.idle_timeout is not None and now - last_used > self.idle_timeout:
+                    expired.append(c)
+                else:
+                    conn = c
+                    break
+
+            # Everything older than the one we picked is expired as well
+            while idle and self.idle_timeout is not None and now - idle[0][1] > self.idle_timeout:
+                expired.append(idle.popleft()[0])
+
+        for c in expired:
+            c.close()
+
+        if conn is not None:
+            return conn, True
+        return self._new_connection(key), False
+
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._idle[key]
+            if len(idle) < self.maxsize:
+                idle.append((conn, time.time()))
+                return
+        conn.close()
+
+    def idle_connections(self, scheme, host, port):
+        with self._lock:
+            return len(self._idle[(scheme, host, port)])
+
+    def clear(self):
+        """
+        Close all the idle connections
+        """
+        with self._lock:
+            idle, self._idle = self._idle, collections.defaultdict(collections.deque)
+
+        for connections in idle.values():
+            for conn, _ in connections:
+                conn.close()
+
+    def urlopen(self, req, idempotent=None, info=None):
+        """
+        Send a urllib Request over a pooled connection. Behaves like urlopen: HTTPError is raised
+        for response codes other than accepted_codes and the returned response must be closed by
+        the caller to release the connection.
+
+        :param req: urllib Request to be sent
+        :param idempotent: Whether the request can be safely retried, None decides by the method
+        :param info: RequestInfo receiving the timings, status and sent bytes, see hawkular.instrumentation
+        :return: PooledResponse
+        """
+        key = endpoint_key(req.get_full_url())
+        attempt = 1
+        while True:
+            try:
+                res = self._send(req, key, info)
+            except URLError as e:
+                if self.retry is None or not self.retry.should_retry(req.get_method(), e, attempt, idempotent):
+                    raise
+                time.sleep(self.retry.delay(attempt, e))
+                if info is not None:
+                    info.mark('backoff')
+                attempt += 1
+                continue
+
+            if self.retry is not None:
+                self.retry.succeeded(attempt)
+            return res
+
+    def _send(self, req, key, info=None):
+        if self.circuit_breaker is None:
+            return self._urlopen(req, key, info)
+
+        self.circuit_breaker.before_request(key)
+        try:
+            res = self._urlopen(req, key, info)
+        except Exception as e:
+            self.circuit_breaker.record(key, e)
+            raise
+        self.circuit_breaker.record(key)
+        return res
+
+    def _urlopen(self, req, key, info=None):
+        url = req.get_full_url()
+        parts = urlsplit(url)
+
+        path = parts.path or '/'
+        if parts.query:
+            path = '{0}?{1}'.format(path, parts.query)
+
+        try:
+            body = req.data
+        except AttributeError:
+            body = req.get_data()
+
+        headers = dict(req.header_items())
+        headers.setdefault('Accept-Encoding', 'gzip')
+
+        if body and self.compression_threshold is not None and len(body) >= self.compression_threshold:
+            body = gzip_compress(body, self.compression_level)
+            headers['Content-Encoding'] = 'gzip'
+
+        method = native_str(req.get_method())
+        path = native_str(path)
+        headers = dict((native_str(k), native_str(v)) for k, v in headers.items())
+
+        if info is not None:
+            info.attempts += 1
+            info.bytes_out = len(body) if body else 0
+
+        while True:
+            conn, reused = self._acquire(key)
+            try:
+                if not reused:
+                    self._connect(conn)
+                if info is not None:
+                    info.mark('connect')
+                conn.request(method, path, body, headers)
+                if info is not None:
+                    info.mark('send')
+                response = conn.getresponse()
+                if info is not None:
+                    info.mark('wait')
+                break
+            except (socket.error, HTTPException) as e:
+                conn.close()
+                # The server may have closed a keep-alive connection while it was idle,
+                # try again with another one. Failing on a fresh connection or timing out is final.
+                if reused and not isinstance(e, socket.timeout):
+                    continue
+                raise URLError(e)
+
+        res = PooledResponse(self, key, conn, response, url)
+        if info is not None:
+            info.status = res.code
+        if res.code not in self.accepted_codes:
+            # Error payloads are small, read them now so the connection can be released
+            payload = res.read()
+            res.close()
+            raise HTTPError(url, res.code, res.msg, res.headers, io.BytesIO(payload))
+
+        return res
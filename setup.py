@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-from distutils.core import setup
+from setuptools import setup
 from os import path
 from setuptools.command.install import install
 
@@ -32,5 +32,8 @@ setup(name='hawkular-client',
           'Programming Language :: Python :: 3',
           'Topic :: System :: Monitoring',
       ],
-      packages=['hawkular']
+      packages=['hawkular'],
+      extras_require={
+          'numpy': ['numpy'],
+      },
       )
@@ -0,0 +1,130 @@
+"""
+   Copyright 2015-2017 Red Hat, Inc. and/or its affiliates
+   and other contributors.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+import json
+import threading
+
+try:
+    # Python 3
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlsplit, parse_qs
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlsplit, parse_qs
+
+
+class Request(object):
+    def __init__(self, method, path, query, headers, body, client_address):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+        self.client_address = client_address
+
+    def json(self):
+        return json.loads(self.body.decode('utf-8'))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _dispatch(self):
+        parts = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length > 0 else b''
+        request = Request(self.command, parts.path, parse_qs(parts.query), self.headers, body,
+                          self.client_address)
+        self.server.fake.requests.append(request)
+
+        status, payload, headers = self.server.fake.respond(request)
+        if payload is None:
+            payload = b''
+        elif not isinstance(payload, bytes):
+            payload = json.dumps(payload).encode('utf-8')
+
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _dispatch
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeServer(object):
+    """
+    Local HTTP/1.1 server with canned responses for the tests that can't rely on a running Hawkular.
+
+    Responses are registered per (method, path), either as a static (status, payload) or as a
+    callable receiving the Request and returning (status, payload[, headers]). Every received
+    request is recorded in the requests list.
+    """
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def route(self, method, path, status=200, payload=None, handler=None):
+        if handler is None:
+            handler = lambda request: (status, payload)
+        self.routes[(method, path)] = handler
+
+    def respond(self, request):
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            return 404, {'errorMsg': 'No route for ' + request.path}, None
+
+        response = handler(request)
+        if len(response) == 2:
+            return response[0], response[1], None
+        return response
+
+    def connections(self):
+        return len(set(r.client_address for r in self.requests))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,196 @@
+"""
+   Copyright 2015-2017 Red Hat, Inc. and/or its affiliates
+   and other contributors.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+import sys
+import threading
+import unittest
+
+from hawkular.client import HawkularError, HawkularConnectionError, HawkularStatusError
+from hawkular.instrumentation import Instrumentation
+from hawkular.metrics import MetricType, create_metric, create_datapoint
+from tests.server import FakeServer
+
+if sys.version_info >= (3, 5):
+    import asyncio
+    from hawkular.aio import AsyncHawkularMetricsClient, AsyncHawkularAlertsClient
+    from hawkular.alerts import Trigger, Condition
+
+
+@unittest.skipIf(sys.version_info < (3, 5), 'asyncio clients require Python 3.5')
+class AsyncClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.server.route('GET', '/hawkular/metrics/status', payload={'Implementation-Version': '0.15.0'})
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.server.stop()
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def test_query_and_put(self):
+        self.server.route('GET', '/hawkular/metrics/gauges/g.1/data', payload=[{'timestamp': 1, 'value': 1.5}])
+        self.server.route('POST', '/hawkular/metrics/gauges/data')
+        self.server.route('POST', '/hawkular/metrics/counters/data')
+
+        async def scenario():
+            async with AsyncHawkularMetricsClient('test', port=self.server.port) as client:
+                data = await client.query_metric(MetricType.Gauge, 'g.1', start=0, end=10)
+                await client.put([create_metric(MetricType.Gauge, 'g.1', create_datapoint(1.0, 5)),
+                                  create_metric(MetricType.Counter, 'c.1', create_datapoint(1, 5))])
+                return client.legacy_api, data
+
+        legacy_api, data = self.run_async(scenario())
+        self.assertTrue(legacy_api)
+        self.assertEqual([{'timestamp': 1, 'value': 1.5}], data)
+
+        query = [r for r in self.server.requests if r.path == '/hawkular/metrics/gauges/g.1/data'][0]
+        self.assertEqual({'start': ['0'], 'end': ['10']}, query.query)
+        self.assertEqual('test', query.headers['Hawkular-Tenant'])
+        self.assertEqual(1, len([r for r in self.server.requests if r.path == '/hawkular/metrics/status']))
+
+    def test_concurrent_requests_reuse_connections(self):
+        self.server.route('GET', '/hawkular/metrics/tenants', payload=[{'id': 'test'}])
+        client = AsyncHawkularMetricsClient('test', port=self.server.port, limit=5)
+
+        async def scenario():
+            results = await asyncio.gather(*[client.query_tenants() for _ in range(50)])
+            await client.close()
+            return results
+
+        results = self.run_async(scenario())
+        self.assertEqual([[{'id': 'test'}]] * 50, results)
+        self.assertTrue(self.server.connections() <= 5)
+
+    def test_triggers_and_errors(self):
+        self.server.route('POST', '/hawkular/alerts/triggers', payload={'id': 'id_1', 'name': 'test', 'eventType': 'ALERT'})
+        self.server.route('GET', '/hawkular/alerts/triggers/id_2', status=404, payload={'errorMsg': 'Trigger not found'})
+        client = AsyncHawkularAlertsClient(tenant_id='test', port=self.server.port)
+
+        trigger = Trigger()
+        trigger.id = 'id_1'
+        trigger.name = 'test'
+        created = self.run_async(client.triggers.create(trigger))
+        self.assertEqual('id_1', created.id)
+        self.assertEqual('ALERT', created.event_type)
+
+        with self.assertRaises(HawkularError) as ctx:
+            self.run_async(client.triggers.single('id_2'))
+        self.assertEqual('Trigger not found', ctx.exception.msg)
+        self.run_async(client.close())
+
+    def test_error_types(self):
+        self.server.route('GET', '/hawkular/metrics/tenants', payload=b'[{"id": ')
+        instrumentation = Instrumentation()
+        finished = []
+        instrumentation.add_post_hook(finished.append)
+
+        async def truncated(reader, writer):
+            await reader.readuntil(b'\r\n\r\n')
+            writer.write(b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n5\r\n[{"id\r\n')
+            writer.close()
+
+        async def scenario():
+            client = AsyncHawkularMetricsClient('test', port=self.server.port, auto_set_legacy_api=False,
+                                                instrumentation=instrumentation)
+            with self.assertRaises(HawkularStatusError):
+                await client.query_tenants()
+
+            server = await asyncio.start_server(truncated, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            broken = AsyncHawkularMetricsClient('test', port=port, auto_set_legacy_api=False)
+            with self.assertRaises(HawkularConnectionError):
+                await broken.query_tenants()
+
+            server.close()
+            await server.wait_closed()
+            await client.close()
+            await broken.close()
+
+        self.run_async(scenario())
+        self.assertEqual(1, len(finished))
+        self.assertIsInstance(finished[0].error, ValueError)
+
+    def test_lazy_views(self):
+        self.server.route('GET', '/hawkular/alerts/triggers/t1/conditions',
+                          payload=[{'triggerId': 't1', 'type': 'THRESHOLD', 'dataId': 'd1', 'threshold': 5.0}])
+        self.server.route('GET', '/hawkular/alerts/triggers/groups/g1/members',
+                          payload=[{'id': 'm1', 'name': 'member', 'memberOf': 'g1'}])
+        client = AsyncHawkularAlertsClient(tenant_id='test', port=self.server.port)
+
+        async def scenario():
+            conditions = await client.triggers.conditions('t1', lazy=True)
+            members = await client.triggers.group_members('g1', include_orphans=True, lazy=True)
+            eager = await client.triggers.conditions('t1')
+            await client.close()
+            return conditions, members, eager
+
+        conditions, members, eager = self.run_async(scenario())
+        self.assertIsInstance(conditions[0], Condition.view_class())
+        self.assertEqual('d1', conditions[0].data_id)
+        self.assertIsInstance(members[0], Trigger.view_class())
+        self.assertEqual('g1', members[0].member_of)
+        self.assertIsInstance(eager[0], Condition)
+        self.assertEqual({'includeOrphans': ['true']}, self.server.requests[1].query)
+
+    def test_instrumentation(self):
+        self.server.route('GET', '/hawkular/metrics/gauges/g.1/data', payload=[{'timestamp': 1, 'value': 1.5}])
+        instrumentation = Instrumentation()
+        finished = []
+        instrumentation.add_post_hook(finished.append)
+
+        async def scenario():
+            async with AsyncHawkularMetricsClient('test', port=self.server.port,
+                                                  instrumentation=instrumentation) as client:
+                await client.query_metric(MetricType.Gauge, 'g.1')
+                with self.assertRaises(HawkularError):
+                    await client.query_metric(MetricType.Gauge, 'g.2')
+
+        self.run_async(scenario())
+        self.assertEqual(['GET /hawkular/metrics/status', 'GET /hawkular/metrics/gauges/{id}/data',
+                          'GET /hawkular/metrics/gauges/{id}/data'], [i.endpoint for i in finished])
+        self.assertEqual([200, 200, 404], [i.status for i in finished])
+        self.assertEqual(['connect', 'decode', 'queue', 'read', 'send', 'wait'], sorted(finished[1].timings))
+        self.assertEqual(2, instrumentation.snapshot()['GET /hawkular/metrics/gauges/{id}/data']['count'])
+
+    def test_cancelled_request_closes_connection(self):
+        released = threading.Event()
+        self.server.route('GET', '/hawkular/metrics/tenants',
+                          handler=lambda r: released.wait(5) and (200, []))
+        client = AsyncHawkularMetricsClient('test', port=self.server.port, auto_set_legacy_api=False)
+        writers = []
+        acquire = client._pool._acquire
+
+        async def tracking_acquire(key):
+            reader, writer, reused = await acquire(key)
+            writers.append(writer)
+            return reader, writer, reused
+        client._pool._acquire = tracking_acquire
+
+        async def scenario():
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(client.query_tenants(), 0.2)
+            released.set()
+            await client.close()
+
+        self.run_async(scenario())
+        self.assertEqual(1, len(writers))
+        self.assertTrue(writers[0].is_closing())
+
+if __name__ == '__main__':
+    unittest.main()
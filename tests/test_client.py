@@ -0,0 +1,644 @@
+"""
+   Copyright 2015-2017 Red Hat, Inc. and/or its affiliates
+   and other contributors.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+from __future__ import unicode_literals
+
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+try:
+    # Python 3
+    import urllib.request as urllib_request
+except ImportError:
+    import urllib2 as urllib_request
+
+from hawkular.client import HawkularError, HawkularConnectionError, HawkularCircuitOpenError, encode_json, iter_json_array
+from hawkular.client import ApiObject, version_cache
+from hawkular.alerts import HawkularAlertsClient, Trigger, FullTrigger
+from hawkular.metrics import HawkularMetricsClient, MetricType, create_metric, create_datapoint
+from hawkular.transport import RetryPolicy, CircuitBreaker, gzip_compress
+from hawkular.instrumentation import Instrumentation, url_template
+from tests.server import FakeServer
+
+
+class TransportTestCase(unittest.TestCase):
+    """
+    Tests for the HTTP transport, run against a local fake server.
+    """
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.server.route('GET', '/hawkular/metrics/tenants', payload=[{'id': 'a'}])
+
+    def tearDown(self):
+        self.server.stop()
+
+    def client(self, **opts):
+        return HawkularMetricsClient(tenant_id='test', port=self.server.port, auto_set_legacy_api=False, **opts)
+
+    def test_connection_reuse(self):
+        c = self.client()
+        for _ in range(5):
+            self.assertEqual([{'id': 'a'}], c.query_tenants())
+
+        self.assertEqual(5, len(self.server.requests))
+        self.assertEqual(1, self.server.connections())
+        self.assertEqual(1, c._pool.idle_connections('http', 'localhost', self.server.port))
+
+    def test_idle_timeout_eviction(self):
+        c = self.client(idle_timeout=0.01)
+        for _ in range(3):
+            c.query_tenants()
+            time.sleep(0.05)
+
+        self.assertEqual(3, self.server.connections())
+
+    def test_threaded_reuse(self):
+        c = self.client(pool_size=2)
+        results = []
+
+        def worker():
+            for _ in range(10):
+                results.append(c.query_tenants())
+
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(60, len(results))
+        self.assertTrue(all(r == [{'id': 'a'}] for r in results))
+        self.assertTrue(c._pool.idle_connections('http', 'localhost', self.server.port) <= 2)
+
+    def test_error_releases_connection(self):
+        c = self.client()
+        with self.assertRaises(HawkularError) as ctx:
+            c.query_metric_definitions()
+
+        self.assertEqual(404, ctx.exception.code)
+        self.assertEqual('No route for /hawkular/metrics/metrics', ctx.exception.msg)
+        c.query_tenants()
+        self.assertEqual(1, self.server.connections())
+
+    def test_request_compression(self):
+        self.server.route('POST', '/hawkular/metrics/gauges/raw')
+        c = self.client(compression_threshold=200, compression_level=9)
+        c.push(MetricType.Gauge, 'small', 1.0, 1)
+        big = create_metric(MetricType.Gauge, 'big', [create_datapoint(float(i), i) for i in range(100)])
+        c.put(dict(big))
+
+        small_req, big_req = self.server.requests
+        self.assertIsNone(small_req.headers.get('Content-Encoding'))
+        self.assertEqual('gzip', big_req.headers['Content-Encoding'])
+        payload = gzip.GzipFile(fileobj=io.BytesIO(big_req.body)).read()
+        self.assertTrue(len(big_req.body) < len(payload))
+        self.assertEqual([{'id': 'big', 'data': big['data']}], json.loads(payload.decode('utf-8')))
+
+    def test_response_decompression(self):
+        payload = gzip_compress(json.dumps([{'id': 'a'}] * 1000).encode('utf-8'))
+        self.server.route('GET', '/hawkular/metrics/tenants',
+                          handler=lambda r: (200, payload, {'Content-Encoding': 'gzip'}))
+        c = self.client()
+        self.assertEqual([{'id': 'a'}] * 1000, c.query_tenants())
+        self.assertEqual('gzip', self.server.requests[0].headers['Accept-Encoding'])
+        self.assertEqual(1, c._pool.idle_connections('http', 'localhost', self.server.port))
+
+    def test_global_opener_untouched(self):
+        opener = urllib_request.build_opener()
+        urllib_request.install_opener(opener)
+        try:
+            self.client()
+            self.assertIs(opener, urllib_request._opener)
+        finally:
+            urllib_request.install_opener(None)
+
+    def test_get_has_no_body(self):
+        self.client().query_tenants()
+        self.assertEqual(b'', self.server.requests[0].body)
+
+
+class RetryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def client(self, **opts):
+        return HawkularMetricsClient(tenant_id='test', port=self.server.port, auto_set_legacy_api=False, **opts)
+
+    def flaky(self, failures, status=503, headers=None):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            if len(calls) <= failures:
+                return status, {'errorMsg': 'unavailable'}, headers
+            return 200, {}
+
+        return handler
+
+    def retrying_client(self, **opts):
+        return self.client(retry=RetryPolicy(backoff=0.001, **opts))
+
+    def test_retry_recovers(self):
+        self.server.route('GET', '/hawkular/metrics/tenants', handler=self.flaky(2))
+        c = self.retrying_client(max_attempts=3)
+        self.assertEqual({}, c.query_tenants())
+        self.assertEqual(3, len(self.server.requests))
+        self.assertEqual({'retries': 2, 'recovered': 1, 'exhausted': 0}, c.retry.stats())
+
+    def test_retry_exhausted(self):
+        self.server.route('GET', '/hawkular/metrics/tenants', handler=self.flaky(5))
+        c = self.retrying_client(max_attempts=2)
+        with self.assertRaises(HawkularError) as ctx:
+            c.query_tenants()
+        self.assertEqual(503, ctx.exception.code)
+        self.assertEqual(2, len(self.server.requests))
+        self.assertEqual({'retries': 1, 'recovered': 0, 'exhausted': 1}, c.retry.stats())
+
+    def test_not_retryable_status(self):
+        self.server.route('GET', '/hawkular/metrics/tenants', handler=self.flaky(1, status=400))
+        c = self.retrying_client()
+        self.assertRaises(HawkularError, c.query_tenants)
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_post_retried_only_when_idempotent(self):
+        self.server.route('POST', '/hawkular/metrics/gauges', handler=self.flaky(1))
+        self.server.route('POST', '/hawkular/metrics/gauges/raw', handler=self.flaky(1))
+        c = self.retrying_client()
+
+        self.assertRaises(HawkularError, c.create_metric_definition, MetricType.Gauge, 'g.1')
+        self.assertEqual(1, len(self.server.requests))
+
+        c.push(MetricType.Gauge, 'g.1', 1.0, 1)
+        self.assertEqual(3, len(self.server.requests))
+
+    def test_closed_without_response(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            if len(calls) == 1:
+                # Closes the connection without a status line, BadStatusLine on Python 2
+                raise ValueError('dropped')
+            return 200, {}
+
+        self.server.route('POST', '/hawkular/metrics/gauges/raw', handler=handler)
+        self.assertRaises(HawkularConnectionError, self.client().push, MetricType.Gauge, 'g.1', 1.0, 1)
+
+        del calls[:]
+        c = self.retrying_client()
+        c.push(MetricType.Gauge, 'g.1', 1.0, 1)
+        self.assertEqual({'retries': 1, 'recovered': 1, 'exhausted': 0}, c.retry.stats())
+
+    def test_connection_refused_is_retried(self):
+        port = self.server.port
+        self.server.stop()
+        c = HawkularMetricsClient(tenant_id='test', port=port, auto_set_legacy_api=False,
+                                  retry=RetryPolicy(max_attempts=3, backoff=0.001))
+        self.assertRaises(HawkularConnectionError, c.create_metric_definition, MetricType.Gauge, 'g.1')
+        self.assertEqual({'retries': 2, 'recovered': 0, 'exhausted': 1}, c.retry.stats())
+        self.server = FakeServer().start()
+
+    def test_delay(self):
+        policy = RetryPolicy(backoff=1, max_backoff=3, jitter=False)
+        self.assertEqual([1, 2, 3, 3], [policy.delay(a) for a in range(1, 5)])
+
+        policy.jitter = True
+        self.assertTrue(all(0 <= policy.delay(4) <= 3 for _ in range(100)))
+
+    def test_retry_after(self):
+        self.server.route('GET', '/hawkular/metrics/tenants', handler=self.flaky(1, headers={'Retry-After': '0.2'}))
+        c = self.retrying_client()
+        started = time.time()
+        c.query_tenants()
+        self.assertTrue(time.time() - started >= 0.2)
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.status = 503
+        self.server.route('GET', '/hawkular/metrics/tenants', handler=lambda r: (self.status, []))
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+        self.client = HawkularMetricsClient(tenant_id='test', port=self.server.port, auto_set_legacy_api=False,
+                                            circuit_breaker=self.breaker)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def state(self):
+        return self.breaker.state('http', 'localhost', self.server.port)
+
+    def test_open_after_failures(self):
+        for _ in range(2):
+            self.assertRaises(HawkularError, self.client.query_tenants)
+        self.assertEqual(CircuitBreaker.OPEN, self.state())
+
+        self.assertRaises(HawkularCircuitOpenError, self.client.query_tenants)
+        self.assertEqual(2, len(self.server.requests))
+        self.assertEqual({'opened': 1, 'rejected': 1}, self.breaker.stats())
+
+    def test_half_open_probe(self):
+        for _ in range(2):
+            self.assertRaises(HawkularError, self.client.query_tenants)
+
+        time.sleep(0.15)
+        self.assertEqual(CircuitBreaker.HALF_OPEN, self.state())
+        self.assertRaises(HawkularError, self.client.query_tenants)
+        self.assertEqual(CircuitBreaker.OPEN, self.state())
+
+        time.sleep(0.15)
+        self.status = 200
+        self.assertEqual([], self.client.query_tenants())
+        self.assertEqual(CircuitBreaker.CLOSED, self.state())
+        self.assertEqual(4, len(self.server.requests))
+
+    def test_client_errors_do_not_count(self):
+        self.status = 404
+        for _ in range(3):
+            self.assertRaises(HawkularError, self.client.query_tenants)
+        self.assertEqual(CircuitBreaker.CLOSED, self.state())
+
+    def test_connection_errors_count(self):
+        port = self.server.port
+        self.server.stop()
+        for _ in range(2):
+            self.assertRaises(HawkularConnectionError, self.client.query_tenants)
+        self.assertRaises(HawkularCircuitOpenError, self.client.query_tenants)
+        self.assertEqual(CircuitBreaker.OPEN, self.breaker.state('http', 'localhost', port))
+        self.server = FakeServer().start()
+
+    def test_batch_writer_keeps_datapoints_while_open(self):
+        self.server.route('POST', '/hawkular/metrics/gauges/raw', status=503)
+        with self.client.batch_writer(flush_interval=60) as w:
+            w.push(MetricType.Gauge, 'g.1', 1.0, 1)
+            for _ in range(2):
+                self.assertRaises(HawkularError, w.flush)
+            self.assertRaises(HawkularCircuitOpenError, w.flush)
+            self.assertEqual(1, w.stats()['buffered'])
+            self.assertEqual(2, len(self.server.requests))
+            self.server.route('POST', '/hawkular/metrics/gauges/raw', status=200)
+            time.sleep(0.15)
+            self.assertEqual(1, w.flush())
+
+    def test_read_timeout(self):
+        def slow(request):
+            time.sleep(0.5)
+            return 200, []
+
+        self.server.route('GET', '/hawkular/metrics/tenants', handler=slow)
+        client = HawkularMetricsClient(tenant_id='test', port=self.server.port, auto_set_legacy_api=False,
+                                       timeout=(1, 0.1))
+        started = time.time()
+        self.assertRaises(HawkularConnectionError, client.query_tenants)
+        self.assertTrue(time.time() - started < 0.4)
+
+
+class VersionDetectionTestCase(unittest.TestCase):
+    def setUp(self):
+        version_cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.server = FakeServer().start()
+        self.server.route('GET', '/hawkular/metrics/status', payload={'Implementation-Version': '0.15.0'})
+        self.server.route('GET', '/hawkular/metrics/gauges/g.1/data', payload=[])
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+        version_cache.clear()
+
+    def client(self, **opts):
+        return HawkularMetricsClient(tenant_id='test', port=self.server.port, **opts)
+
+    def status_requests(self):
+        return len([r for r in self.server.requests if r.path == '/hawkular/metrics/status'])
+
+    def test_construction_does_no_io(self):
+        self.client()
+        HawkularMetricsClient(tenant_id='test', port=1)
+        self.assertEqual(0, len(self.server.requests))
+
+    def test_detected_on_first_use(self):
+        c = self.client()
+        self.assertEqual([], c.query_metric(MetricType.Gauge, 'g.1'))
+        self.assertTrue(c.legacy_api)
+        self.assertEqual((0, 15), c.server_version)
+        c.query_metric(MetricType.Gauge, 'g.1')
+        self.assertEqual(1, self.status_requests())
+
+    def test_explicit_legacy_api_skips_detection(self):
+        c = self.client()
+        c.legacy_api = False
+        self.assertFalse(c.legacy_api)
+        self.assertEqual(0, self.status_requests())
+
+    def test_version_cached_per_server(self):
+        self.assertTrue(self.client().legacy_api)
+        self.assertTrue(self.client().legacy_api)
+        self.assertEqual(1, self.status_requests())
+
+        self.assertTrue(self.client(version_cache_ttl=0).legacy_api)
+        self.assertEqual(2, self.status_requests())
+
+    def test_version_cache_file(self):
+        path = os.path.join(self.directory, 'versions.json')
+        self.assertTrue(self.client(version_cache_file=path).legacy_api)
+
+        # A new process only has the file
+        version_cache.clear()
+        self.assertTrue(self.client(version_cache_file=path).legacy_api)
+        self.assertEqual(1, self.status_requests())
+
+    def test_version_cache_file_not_an_object(self):
+        path = os.path.join(self.directory, 'versions.json')
+        for content in ('[]', 'null'):
+            with open(path, 'w') as f:
+                f.write(content)
+            version_cache.clear()
+            self.assertTrue(self.client(version_cache_file=path).legacy_api)
+
+        # Replaced by a valid cache
+        version_cache.clear()
+        self.assertTrue(self.client(version_cache_file=path).legacy_api)
+        self.assertEqual(2, self.status_requests())
+
+    def test_failed_detection_is_retried(self):
+        self.server.route('GET', '/hawkular/metrics/status', status=503)
+        c = self.client()
+        self.assertRaises(HawkularError, c.query_metric, MetricType.Gauge, 'g.1')
+
+        self.server.route('GET', '/hawkular/metrics/status', payload={'Implementation-Version': '0.15.0'})
+        self.assertEqual([], c.query_metric(MetricType.Gauge, 'g.1'))
+
+
+class ApiObjectTestCase(unittest.TestCase):
+    def test_key_conversion(self):
+        for _ in range(2):
+            # Second round comes from the memoized tables
+            self.assertEqual('eventType', ApiObject._to_camelcase('event_type'))
+            self.assertEqual('data2Id', ApiObject._to_camelcase('data2_id'))
+            self.assertEqual('event_type', ApiObject._to_underscore('eventType'))
+            self.assertEqual('event_type', ApiObject._to_underscore('event_type'))
+            self.assertEqual('implementation-_version', ApiObject._to_underscore('Implementation-Version'))
+
+    def test_decode_and_encode(self):
+        d = {'trigger': {'id': 't', 'eventType': 'ALERT', 'autoDisable': False, 'description': None},
+             'conditions': [{'triggerId': 't', 'data2Id': 'd', 'threshold': 1.5}]}
+        full = FullTrigger(d)
+        self.assertEqual('ALERT', full.trigger.event_type)
+        self.assertIsNone(full.trigger.description)
+        self.assertEqual('d', full.conditions[0].data2_id)
+        self.assertEqual([], full.dampenings)
+
+        self.assertEqual({'id': 't', 'eventType': 'ALERT', 'autoDisable': False}, full.trigger.to_json_object())
+        self.assertEqual({'triggerId': 't', 'data2Id': 'd', 'threshold': 1.5}, full.conditions[0].to_json_object())
+
+        # Underscore keys are accepted as well
+        self.assertEqual('ALERT', Trigger({'event_type': 'ALERT'}).event_type)
+
+    def test_views(self):
+        d = {'trigger': {'id': 't', 'eventType': 'ALERT', 'tenantId': 'ignored'},
+             'conditions': [{'triggerId': 't', 'data2Id': 'd'}]}
+        view = FullTrigger.view(d)
+        self.assertEqual('ALERT', view.trigger.event_type)
+        self.assertIsNone(view.trigger.description)
+        self.assertIs(view.conditions, view.conditions)
+        self.assertEqual('d', view.conditions[0].data2_id)
+        self.assertEqual([], view.dampenings)
+
+        # Writes go to the wrapped dict
+        view.trigger.enabled = False
+        view.conditions[0].threshold = 2.0
+        self.assertEqual({'triggerId': 't', 'data2Id': 'd', 'threshold': 2.0}, d['conditions'][0])
+        self.assertEqual({'trigger': {'id': 't', 'eventType': 'ALERT', 'enabled': False},
+                          'dampenings': [],
+                          'conditions': [{'triggerId': 't', 'data2Id': 'd', 'threshold': 2.0}]},
+                         json.loads(encode_json(view)))
+
+        full = view.to_object()
+        self.assertIsInstance(full, FullTrigger)
+        self.assertFalse(full.trigger.enabled)
+        self.assertRaises(AttributeError, setattr, view, 'unknown', 1)
+
+    def test_lazy_trigger_client(self):
+        with FakeServer() as server:
+            server.route('GET', '/hawkular/alerts/triggers', payload=[{'id': 'a', 'enabled': True}, {'id': 'b'}])
+            client = HawkularAlertsClient(port=server.port)
+            triggers = client.triggers.get(lazy=True)
+            self.assertEqual([('a', True), ('b', None)], [(t.id, t.enabled) for t in triggers])
+            self.assertEqual('TriggerView', type(triggers[0]).__name__)
+
+
+class ProvisionTestCase(unittest.TestCase):
+    @staticmethod
+    def full_trigger(trigger_id):
+        return FullTrigger({'trigger': {'id': trigger_id, 'name': trigger_id, 'enabled': True}})
+
+    @staticmethod
+    def route_single(server, existing):
+        server.route('POST', '/hawkular/alerts/triggers/trigger',
+                     handler=lambda r: (400, {'errorMsg': 'Invalid'}) if r.json()['trigger']['id'] == 'bad'
+                     else (200, r.json()))
+        for i in range(10):
+            trigger_id = 't{0}'.format(i)
+            server.route('PUT', '/hawkular/alerts/triggers/trigger/' + trigger_id,
+                         handler=lambda r, t=trigger_id: (200, r.json()) if t in existing else (404, {'errorMsg': 'Not found'}))
+
+    def test_import_chunks(self):
+        with FakeServer() as server:
+            def do_import(request):
+                ids = [t['trigger']['id'] for t in request.json()['triggers']]
+                if 'bad' in ids:
+                    return 400, {'errorMsg': 'Invalid trigger'}
+                return 200, request.json()
+
+            server.route('POST', '/hawkular/alerts/import/all', handler=do_import)
+            self.route_single(server, existing={'t4'})
+
+            client = HawkularAlertsClient(port=server.port)
+            triggers = [self.full_trigger('t{0}'.format(i)) for i in range(6)]
+            triggers.insert(3, self.full_trigger('bad'))
+            results = client.triggers.provision(triggers, chunk_size=3, max_workers=2)
+
+            self.assertEqual(7, len(results))
+            self.assertIsInstance(results.pop('bad'), HawkularError)
+            self.assertEqual([None] * 6, list(results.values()))
+
+            imports = [r for r in server.requests if r.path.endswith('/import/all')]
+            self.assertEqual(3, len(imports))
+            # Only the rejected chunk [bad, t3, t4] was sent again one trigger at a time
+            singles = sorted((r.method, r.path.rsplit('/', 1)[-1]) for r in server.requests if r not in imports)
+            self.assertEqual([('POST', 'trigger'), ('POST', 'trigger'), ('PUT', 'bad'), ('PUT', 't3'), ('PUT', 't4')],
+                             singles)
+
+    def test_without_import_endpoint(self):
+        with FakeServer() as server:
+            self.route_single(server, existing={'t1'})
+            client = HawkularAlertsClient(port=server.port)
+
+            results = client.triggers.provision([self.full_trigger('t0'), self.full_trigger('t1')])
+            self.assertEqual({'t0': None, 't1': None}, results)
+
+            del server.requests[:]
+            results = client.triggers.provision([self.full_trigger('t2')])
+            self.assertEqual({'t2': None}, results)
+            self.assertEqual(['PUT', 'POST'], [r.method for r in server.requests])
+
+    def test_sync(self):
+        def trigger(trigger_id, threshold, **fields):
+            trigger = dict({'id': trigger_id, 'name': trigger_id, 'tags': {'team': 'a'}}, **fields)
+            return {'trigger': trigger,
+                    'conditions': [{'triggerMode': 'FIRING', 'type': 'THRESHOLD', 'dataId': trigger_id,
+                                    'operator': 'GT', 'threshold': threshold}]}
+
+        def on_server(full, condition_id):
+            full['trigger'].update({'type': 'STANDARD', 'severity': 'MEDIUM', 'enabled': False})
+            full['conditions'][0].update({'triggerId': full['trigger']['id'], 'conditionId': condition_id,
+                                          'conditionSetSize': 1, 'conditionSetIndex': 1})
+            full['dampenings'] = []
+            return full
+
+        with FakeServer() as server:
+            server.route('GET', '/hawkular/alerts/export', payload={'actions': [], 'triggers': [
+                on_server(trigger('same', 90.0), 'c1'),
+                on_server(trigger('changed', 80.0), 'c2'),
+                on_server(trigger('gone', 10.0), 'c3'),
+                on_server(trigger('member', 10.0, memberOf='group'), 'c4'),
+                on_server(dict(trigger('other', 10.0), trigger={'id': 'other', 'tags': {'team': 'b'}}), 'c5'),
+            ]})
+            server.route('POST', '/hawkular/alerts/import/all', handler=lambda r: (200, r.json()))
+            server.route('DELETE', '/hawkular/alerts/triggers/gone', status=200)
+
+            client = HawkularAlertsClient(port=server.port)
+            desired = [FullTrigger(trigger('same', 90)), FullTrigger(trigger('changed', 85)),
+                       FullTrigger(trigger('new', 1))]
+
+            plan = client.triggers.sync(desired, prune_tags={'team': 'a'}, dry_run=True)
+            self.assertEqual((['new'], ['changed'], ['gone'], ['same']),
+                             (plan.create, plan.update, plan.delete, plan.unchanged))
+            self.assertEqual(['GET'], [r.method for r in server.requests])
+            self.assertTrue(str(plan).endswith('1 to create, 1 to update, 1 to delete, 1 unchanged'))
+
+            del server.requests[:]
+            plan = client.triggers.sync(desired, prune_tags={'team': 'a'})
+            self.assertEqual({}, plan.errors)
+            imported = server.requests[1].json()['triggers']
+            self.assertEqual(['changed', 'new'], sorted(t['trigger']['id'] for t in imported))
+            self.assertEqual('/hawkular/alerts/triggers/gone', server.requests[2].path)
+
+            del server.requests[:]
+            plan = client.triggers.sync(desired[:1])
+            self.assertFalse(plan.changed())
+            self.assertEqual(1, len(server.requests))
+
+
+class InstrumentationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_url_template(self):
+        base = 'http://localhost:8080/hawkular/metrics/'
+        self.assertEqual('/hawkular/metrics/gauges/{id}/raw',
+                         url_template(base + 'gauges/my.gauge%2F1/raw?start=1', base))
+        self.assertEqual('/hawkular/metrics/gauges/tags/{id}', url_template(base + 'gauges/tags/host:a', base))
+        self.assertEqual('/hawkular/alerts/triggers/trigger/{id}',
+                         url_template('http://localhost:8080/hawkular/alerts/triggers/trigger/t1'))
+
+    def test_hooks_and_snapshot(self):
+        self.server.route('GET', '/hawkular/metrics/gauges/a/raw', payload=[{'timestamp': 1, 'value': 1.0}])
+        self.server.route('GET', '/hawkular/metrics/gauges/b/raw', payload=[])
+        instrumentation = Instrumentation()
+        before, after = [], []
+        instrumentation.add_pre_hook(lambda info: before.append((info.method, info.template, info.status)))
+        instrumentation.add_post_hook(after.append)
+        instrumentation.add_post_hook(lambda info: 1 / 0)
+
+        c = HawkularMetricsClient(tenant_id='test', port=self.server.port, auto_set_legacy_api=False,
+                                  instrumentation=instrumentation)
+        c.query_metric(MetricType.Gauge, 'a')
+        c.query_metric(MetricType.Gauge, 'b')
+        self.assertRaises(HawkularError, c.query_metric, MetricType.Gauge, 'c')
+
+        self.assertEqual([('GET', '/hawkular/metrics/gauges/{id}/raw', None)] * 3, before)
+        self.assertEqual([200, 200, 404], [info.status for info in after])
+        self.assertEqual(404, after[2].error.code)
+        self.assertEqual(['connect', 'decode', 'read', 'send', 'wait'], sorted(after[0].timings))
+        self.assertTrue(after[0].bytes_in > 0)
+        self.assertEqual(3, instrumentation.hook_errors)
+
+        snapshot = instrumentation.snapshot()
+        endpoint = snapshot['GET /hawkular/metrics/gauges/{id}/raw']
+        self.assertEqual(3, endpoint['count'])
+        self.assertEqual(1, endpoint['errors'])
+        self.assertEqual(3, sum(count for _, count in endpoint['buckets']))
+        self.assertTrue(0 < endpoint['p50'] <= endpoint['p99'] <= endpoint['max'])
+        self.assertTrue(endpoint['phases']['wait'] > 0)
+
+    def test_streams_and_window(self):
+        self.server.route('GET', '/hawkular/metrics/gauges/a/raw', payload=[{'timestamp': 1, 'value': 1.0}] * 100)
+        instrumentation = Instrumentation(window=0.2, slots=2)
+        c = HawkularMetricsClient(tenant_id='test', port=self.server.port, auto_set_legacy_api=False,
+                                  instrumentation=instrumentation)
+
+        stream = c.iter_metric(MetricType.Gauge, 'a')
+        self.assertEqual({}, instrumentation.snapshot())
+        self.assertEqual(100, len(list(stream)))
+        self.assertEqual(1, instrumentation.snapshot()['GET /hawkular/metrics/gauges/{id}/raw']['count'])
+
+        time.sleep(0.3)
+        self.assertEqual({}, instrumentation.snapshot())
+
+
+class EncodingTestCase(unittest.TestCase):
+    def test_iter_json_array(self):
+        data = [{'timestamp': 1, 'value': 1.25, 'tags': {'unit': '\u20ac'}}, 2.5, 'x', None, [1, [2]], -3]
+        raw = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        for chunk_size in [1, 2, 7, 65536]:
+            self.assertEqual(data, list(iter_json_array(io.BytesIO(raw), chunk_size=chunk_size)))
+
+        self.assertEqual([], list(iter_json_array(io.BytesIO(b''))))
+        self.assertEqual([{'a': 1}], list(iter_json_array(io.BytesIO(b'{"a": 1}'))))
+        self.assertRaises(ValueError, list, iter_json_array(io.BytesIO(b'[1, 2'), chunk_size=2))
+
+    def test_compact_encoding(self):
+        t = Trigger()
+        t.id = 'a/b'
+        t.enabled = True
+        encoded = encode_json([{'id': 'x', 'data': [{'timestamp': 1, 'value': 1.5}]}, t, 2 ** 70])
+        if isinstance(encoded, bytes):
+            encoded = encoded.decode('utf-8')
+
+        # Key order is not fixed on Python 2
+        self.assertNotIn(', ', encoded)
+        self.assertNotIn(': ', encoded)
+        self.assertEqual([{'id': 'x', 'data': [{'timestamp': 1, 'value': 1.5}]}, {'id': 'a/b', 'enabled': True},
+                          1180591620717411303424], json.loads(encoded))
+
+
+if __name__ == '__main__':
+    unittest.main()
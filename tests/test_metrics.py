@@ -16,11 +16,16 @@
 """
 from __future__ import unicode_literals
 
+import gc
 import unittest
 import uuid
 from  hawkular.metrics import *
 import os
 import base64
+import math
+import shutil
+import tempfile
+import time
 from datetime import datetime, timedelta
 from tests import base
 
@@ -32,6 +37,13 @@ except ImportError:
     # from unittest.mock import patch, MagicMock
 
 from tests import base
+from tests.server import FakeServer
+from hawkular.spool import DiskSpool
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 class TestMetricFunctionsBase(unittest.TestCase):
@@ -65,27 +77,632 @@ class TenantTestCase(TestMetricFunctionsBase):
 
 class MetricsMockUpCase(unittest.TestCase):
 
-    @mock.patch('hawkular.client.urlopen', autospec=True)
+    @mock.patch('hawkular.transport.HawkularConnectionPool.urlopen', autospec=True)
     @mock.patch('hawkular.client.HawkularBaseClient.query_status')
     def test_verify(self, m_query_status, m_urlopen):
         m_query_status.return_value = {'Implementation-Version': '0.23.0'}
         c = HawkularMetricsClient(tenant_id='aa', username='a', password='b')
 
         c.query_tenants()
-        req = m_urlopen.call_args[0][0]
+        req = m_urlopen.call_args[0][1]
         authr = req.get_header('Authorization')
         self.assertEqual('Basic', authr[:5])
         self.assertEqual('YTpi', authr[6:])
 
         c = HawkularMetricsClient(tenant_id='aa', token='AABBCCDD', authtoken='EEFFGGHH')
         c.query_tenants()
-        req = m_urlopen.call_args[0][0]
+        req = m_urlopen.call_args[0][1]
 
         self.assertEqual('Bearer AABBCCDD', req.get_header('Authorization'))
         # Incorrect capitalization due to urllib2
         self.assertEqual('EEFFGGHH', req.get_header('Hawkular-admin-token'))
 
 
+class FakeServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.client = HawkularMetricsClient(tenant_id='test', port=self.server.port, auto_set_legacy_api=False)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def posted(self, path):
+        return [r.json() for r in self.server.requests if r.method == 'POST' and r.path == path]
+
+
+class BatchWriterTestCase(FakeServerTestCase):
+    def setUp(self):
+        super(BatchWriterTestCase, self).setUp()
+        self.server.route('POST', '/hawkular/metrics/gauges/raw')
+        self.server.route('POST', '/hawkular/metrics/counters/raw')
+
+    def test_flush_groups_by_type_and_id(self):
+        with self.client.batch_writer(flush_interval=60) as w:
+            w.push(MetricType.Gauge, 'g.1', 1.0, 1000)
+            w.push(MetricType.Counter, 'c.1', 1, 1000)
+            w.push(MetricType.Gauge, 'g.1', 2.0, 2000)
+            w.put(create_metric(MetricType.Gauge, 'g.2', create_datapoint(3.0, 1000)))
+            self.assertEqual(4, w.flush())
+            self.assertEqual({'buffered': 0, 'flushed': 4, 'dropped': 0, 'batches': 1, 'failures': 0}, w.stats())
+
+        gauges = self.posted('/hawkular/metrics/gauges/raw')
+        self.assertEqual(1, len(gauges))
+        self.assertEqual([{'id': 'g.1', 'data': [{'timestamp': 1000, 'value': 1.0, 'tags': {}},
+                                                 {'timestamp': 2000, 'value': 2.0, 'tags': {}}]},
+                          {'id': 'g.2', 'data': [{'timestamp': 1000, 'value': 3.0, 'tags': {}}]}], gauges[0])
+        self.assertEqual(1, len(self.posted('/hawkular/metrics/counters/raw')))
+
+    def test_size_threshold_flushes(self):
+        w = self.client.batch_writer(batch_size=3, flush_interval=60)
+        for i in range(3):
+            w.push(MetricType.Gauge, 'g.1', float(i))
+
+        for _ in range(100):
+            if self.server.requests:
+                break
+            time.sleep(0.01)
+        self.assertEqual(3, len(self.posted('/hawkular/metrics/gauges/raw')[0][0]['data']))
+        w.close()
+
+    def test_full_buffer_drops(self):
+        w = self.client.batch_writer(flush_interval=60, max_buffer=2, block=False)
+        self.assertTrue(w.push(MetricType.Gauge, 'g.1', 1.0))
+        self.assertTrue(w.push(MetricType.Gauge, 'g.1', 2.0))
+        self.assertFalse(w.push(MetricType.Gauge, 'g.1', 3.0))
+        self.assertEqual(1, w.stats()['dropped'])
+        w.close()
+        self.assertEqual(2, w.stats()['flushed'])
+
+    def test_failed_flush_is_retried(self):
+        self.server.route('POST', '/hawkular/metrics/gauges/raw', status=503, payload={'errorMsg': 'down'})
+        w = self.client.batch_writer(flush_interval=60)
+        w.push(MetricType.Gauge, 'g.1', 1.0)
+        self.assertRaises(HawkularError, w.flush)
+        self.assertEqual(1, w.stats()['buffered'])
+
+        self.server.route('POST', '/hawkular/metrics/gauges/raw')
+        self.assertEqual(1, w.flush())
+        w.close()
+
+    def test_put_larger_than_buffer(self):
+        with self.client.batch_writer(max_buffer=5, flush_interval=60) as w:
+            self.assertTrue(w.put(create_metric(MetricType.Gauge, 'g.1',
+                                                [create_datapoint(float(i), 1000 + i) for i in range(12)])))
+
+        self.assertEqual(12, w.stats()['flushed'])
+        sent = [dp['timestamp'] for p in self.posted('/hawkular/metrics/gauges/raw') for d in p for dp in d['data']]
+        self.assertEqual([1000 + i for i in range(12)], sent)
+
+
+class ConcurrentPutTestCase(FakeServerTestCase):
+    def test_concurrent_put_summary(self):
+        def slow(request):
+            time.sleep(0.3)
+            return 200, None
+
+        self.server.route('POST', '/hawkular/metrics/gauges/raw', handler=slow)
+        self.server.route('POST', '/hawkular/metrics/availability/raw', handler=slow)
+        self.server.route('POST', '/hawkular/metrics/counters/raw', status=500, payload={'errorMsg': 'failed'})
+
+        data = [create_metric(MetricType.Gauge, 'g.1', [create_datapoint(1.0), create_datapoint(2.0)]),
+                create_metric(MetricType.Gauge, 'g.2', create_datapoint(1.0)),
+                create_metric(MetricType.Availability, 'a.1', create_datapoint(Availability.Up)),
+                create_metric(MetricType.Counter, 'c.1', create_datapoint(1))]
+
+        start = time.time()
+        summary = self.client.put(data, concurrent=True)
+        self.assertTrue(time.time() - start < 0.55)
+
+        self.assertEqual({'metrics': 2, 'datapoints': 3, 'error': None}, summary[MetricType.Gauge])
+        self.assertIsNone(summary[MetricType.Availability]['error'])
+        self.assertEqual(500, summary[MetricType.Counter]['error'].code)
+
+
+class StreamingQueryTestCase(FakeServerTestCase):
+    def test_iter_metric(self):
+        datapoints = [{'timestamp': t, 'value': t * 0.5} for t in range(10000)]
+        self.server.route('GET', '/hawkular/metrics/gauges/g.1/raw', payload=datapoints)
+
+        it = self.client.iter_metric(MetricType.Gauge, 'g.1', start=0, end=10000, order='ASC')
+        self.assertEqual(datapoints, list(it))
+        self.assertEqual({'start': ['0'], 'end': ['10000'], 'order': ['ASC']}, self.server.requests[0].query)
+        self.assertEqual(1, self.client._pool.idle_connections('http', 'localhost', self.server.port))
+
+    def raw_query_route(self, datapoints):
+        def handler(request):
+            start = int(request.query['start'][0])
+            end = int(request.query['end'][0])
+            matched = [d for d in datapoints if start <= d['timestamp'] < end]
+            matched.sort(key=lambda d: d['timestamp'], reverse=request.query['order'][0] == 'DESC')
+            if 'limit' in request.query:
+                matched = matched[:int(request.query['limit'][0])]
+            return 200, matched
+
+        self.server.route('GET', '/hawkular/metrics/gauges/g.1/raw', handler=handler)
+
+    def test_iter_metric_chunked_windows(self):
+        datapoints = [{'timestamp': t, 'value': 1.0} for t in range(0, 1000, 10)]
+        self.raw_query_route(datapoints)
+
+        result = list(self.client.iter_metric_chunked(MetricType.Gauge, 'g.1', 0, 1000, window=timedelta(milliseconds=300)))
+        self.assertEqual(datapoints, result)
+        self.assertEqual(['0', '300', '600', '900'], [r.query['start'][0] for r in self.server.requests])
+
+        self.server.requests = []
+        result = list(self.client.iter_metric_chunked(MetricType.Gauge, 'g.1', 0, 1000, window=300, max_workers=3, order='DESC'))
+        self.assertEqual(list(reversed(datapoints)), result)
+        self.assertEqual(4, len(self.server.requests))
+
+    def test_iter_metric_chunked_limit(self):
+        datapoints = [{'timestamp': t, 'value': 1.0} for t in range(0, 1000, 10)]
+        self.raw_query_route(datapoints)
+
+        result = list(self.client.iter_metric_chunked(MetricType.Gauge, 'g.1', 0, 1000, limit=30))
+        self.assertEqual(datapoints, result)
+        self.assertEqual(4, len(self.server.requests))
+        self.assertEqual('291', self.server.requests[1].query['start'][0])
+
+    def test_unconsumed_stream_releases_connection(self):
+        self.server.route('GET', '/hawkular/metrics/gauges/g.1/raw', payload=[{'timestamp': 1, 'value': 1.0}])
+
+        it = self.client.iter_metric(MetricType.Gauge, 'g.1')
+        res = it._res
+        it.close()
+        self.assertIsNone(res._conn)
+        self.assertEqual([], list(it))
+
+        it = self.client.iter_metric(MetricType.Gauge, 'g.1')
+        res = it._res
+        del it
+        gc.collect()
+        self.assertIsNone(res._conn)
+
+    def test_iter_metric_no_content(self):
+        self.server.route('GET', '/hawkular/metrics/gauges/g.1/raw', status=204)
+        self.assertEqual([], list(self.client.iter_metric(MetricType.Gauge, 'g.1')))
+
+
+class MultiMetricQueryTestCase(FakeServerTestCase):
+    def test_query_metrics_per_id(self):
+        self.server.route('GET', '/hawkular/metrics/gauges/g.1/raw', payload=[{'timestamp': 1, 'value': 1.0}])
+        self.server.route('GET', '/hawkular/metrics/counters/c.1/raw', payload=[{'timestamp': 1, 'value': 2}])
+
+        result = self.client.query_metrics([(MetricType.Gauge, 'g.1'), (MetricType.Counter, 'c.1'),
+                                            (MetricType.Gauge, 'missing')], start=0, end=10)
+
+        self.assertEqual({'data': [{'timestamp': 1, 'value': 1.0}], 'error': None}, result['g.1'])
+        self.assertEqual([{'timestamp': 1, 'value': 2}], result['c.1']['data'])
+        self.assertEqual(404, result['missing']['error'].code)
+        self.assertEqual(3, len(self.server.requests))
+
+    def test_query_metrics_multi_id_endpoint(self):
+        self.client.server_version = (0, 28)
+
+        def handler(request):
+            body = request.json()
+            return 200, [{'id': i, 'data': [{'timestamp': body['start'], 'value': 1.0}]} for i in body['ids']]
+
+        self.server.route('POST', '/hawkular/metrics/gauges/raw/query', handler=handler)
+        result = self.client.query_metrics([(MetricType.Gauge, 'g.1'), (MetricType.Gauge, 'g.2')], start=5, end=10)
+
+        self.assertEqual(1, len(self.server.requests))
+        self.assertEqual({'ids': ['g.1', 'g.2'], 'start': 5, 'end': 10}, self.server.requests[0].json())
+        self.assertEqual([{'timestamp': 5, 'value': 1.0}], result['g.2']['data'])
+
+    def test_query_metrics_stats_multi_id_endpoint(self):
+        self.client.server_version = (0, 28)
+        buckets = [{'start': 0, 'end': 10, 'avg': 1.0}]
+        self.server.route('POST', '/hawkular/metrics/metrics/stats/query',
+                          handler=lambda r: (200, {'gauge': dict((i, buckets) for i in r.json()['metrics']['gauge'])}))
+        self.server.route('GET', '/hawkular/metrics/availability/a.1/stats', payload=[{'start': 0, 'end': 10}])
+
+        result = self.client.query_metrics_stats([(MetricType.Gauge, 'g.1'), (MetricType.Availability, 'a.1')],
+                                                 start=0, end=10, buckets=1)
+        self.assertEqual(buckets, result['g.1']['data'])
+        self.assertEqual([{'start': 0, 'end': 10}], result['a.1']['data'])
+        self.assertEqual({'metrics': {'gauge': ['g.1']}, 'start': 0, 'end': 10, 'buckets': 1},
+                         [r for r in self.server.requests if r.method == 'POST'][0].json())
+
+
+class ColumnarQueryTestCase(FakeServerTestCase):
+    def test_query_metric_columns(self):
+        self.server.route('GET', '/hawkular/metrics/gauges/g.1/raw',
+                          payload=[{'timestamp': 1462363124102, 'value': 4.24}, {'timestamp': 1462363032249, 'value': 4}])
+
+        columns = self.client.query_metric_columns(MetricType.Gauge, 'g.1')
+        self.assertEqual(2, len(columns))
+        self.assertEqual([1462363124102, 1462363032249], list(columns.timestamp))
+        self.assertEqual([4.24, 4.0], list(columns.value))
+
+    def test_query_metric_stats_columns(self):
+        self.server.route('GET', '/hawkular/metrics/gauges/g.1/stats', payload=[
+            {'start': 0, 'end': 10, 'empty': True},
+            {'start': 10, 'end': 20, 'empty': False, 'min': 1.0, 'max': 3.0, 'avg': 2.0, 'median': 2.0, 'sum': 4.0,
+             'samples': 2, 'percentiles': [{'quantile': 0.9, 'value': 2.8}]}])
+
+        columns = self.client.query_metric_stats_columns(MetricType.Gauge, 'g.1', buckets=2)
+        self.assertEqual([0, 10], list(columns.start))
+        self.assertEqual([0, 2], list(columns.samples))
+        self.assertTrue(math.isnan(columns.avg[0]))
+        self.assertEqual(2.0, columns.avg[1])
+        self.assertTrue(math.isnan(columns.percentiles[0.9][0]))
+        self.assertEqual(2.8, columns.percentiles[0.9][1])
+
+    def test_timestamp_column(self):
+        columns = DatapointColumns.from_datapoints([{'timestamp': 2 ** 53, 'value': 1}, {'timestamp': '1000', 'value': 2}])
+        self.assertEqual(8, columns.timestamp.itemsize)
+        self.assertEqual([2 ** 53, 1000], list(columns.timestamp))
+        self.assertEqual([1.0, 2.0], list(columns.value))
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_query_metric_columns_numpy(self):
+        self.server.route('GET', '/hawkular/metrics/gauges/g.1/raw', payload=[{'timestamp': 1, 'value': 4.24}])
+
+        columns = self.client.query_metric_columns(MetricType.Gauge, 'g.1', as_numpy=True)
+        self.assertEqual(numpy.int64, columns.timestamp.dtype)
+        self.assertEqual(4.24, columns.value.sum())
+
+
+class DefinitionCacheTestCase(FakeServerTestCase):
+    def setUp(self):
+        super(DefinitionCacheTestCase, self).setUp()
+        self.server.route('GET', '/hawkular/metrics/metrics', payload=[{'id': 'g.1', 'type': 'gauge'}])
+        self.server.route('GET', '/hawkular/metrics/gauges/g.1/tags', payload={'env': 'test'})
+        self.server.route('PUT', '/hawkular/metrics/gauges/g.1/tags')
+        self.server.route('POST', '/hawkular/metrics/gauges', status=201, payload={})
+        self.cache = self.client.enable_cache(ttl=60, maxsize=2)
+
+    def gets(self):
+        return len([r for r in self.server.requests if r.method == 'GET'])
+
+    def test_read_through(self):
+        for _ in range(3):
+            self.assertEqual([{'id': 'g.1', 'type': 'gauge'}], self.client.query_metric_definitions(MetricType.Gauge, env='test'))
+        self.assertEqual(1, self.gets())
+
+        # Different filter is a different entry
+        self.client.query_metric_definitions(MetricType.Gauge, env='prod')
+        self.assertEqual(2, self.gets())
+        self.assertEqual({'hits': 2, 'misses': 2, 'evictions': 0, 'size': 2}, self.cache.stats())
+
+    def test_cached_results_are_copies(self):
+        self.client.query_metric_tags(MetricType.Gauge, 'g.1')['env'] = 'changed'
+        self.assertEqual({'env': 'test'}, self.client.query_metric_tags(MetricType.Gauge, 'g.1'))
+
+    def test_writes_invalidate(self):
+        self.client.query_metric_tags(MetricType.Gauge, 'g.1')
+        self.client.update_metric_tags(MetricType.Gauge, 'g.1', env='prod')
+        self.client.query_metric_tags(MetricType.Gauge, 'g.1')
+        self.client.create_metric_definition(MetricType.Gauge, 'g.2')
+        self.client.query_metric_tags(MetricType.Gauge, 'g.1')
+        self.assertEqual(3, self.gets())
+
+    def test_ttl_and_lru_eviction(self):
+        self.client.query_metric_definitions(env='a')
+        self.client.query_metric_definitions(env='b')
+        self.client.query_metric_definitions(env='a')
+        self.client.query_metric_definitions(env='c')
+        self.assertEqual(1, self.cache.stats()['evictions'])
+
+        # 'b' was the least recently used
+        self.client.query_metric_definitions(env='a')
+        self.assertEqual(3, self.gets())
+        self.client.query_metric_definitions(env='b')
+        self.assertEqual(4, self.gets())
+
+        self.cache.ttl = 0
+        self.client.query_metric_definitions(env='x')
+        self.client.query_metric_definitions(env='x')
+        self.assertEqual(6, self.gets())
+
+    def test_tenants_are_separate(self):
+        self.client.query_metric_tags(MetricType.Gauge, 'g.1')
+        self.client.tenant('other')
+        self.client.query_metric_tags(MetricType.Gauge, 'g.1')
+        self.assertEqual(2, self.gets())
+
+class StatsCacheTestCase(FakeServerTestCase):
+    def setUp(self):
+        super(StatsCacheTestCase, self).setUp()
+        self.server.route('GET', '/hawkular/metrics/gauges/g.1/stats', handler=self.stats)
+        self.cache = self.client.enable_stats_cache(grace=0)
+
+    def stats(self, request):
+        start = int(request.query['start'][0])
+        end = int(request.query['end'][0])
+        return 200, [{'start': s, 'end': s + 10, 'samples': 1, 'avg': float(s)} for s in range(start, end, 10)]
+
+    def fetched(self):
+        return [(int(r.query['start'][0]), int(r.query['end'][0])) for r in self.server.requests]
+
+    def test_completed_buckets_are_not_fetched_again(self):
+        first = self.client.query_metric_stats(MetricType.Gauge, 'g.1', start=5, end=100, bucketDuration='10ms')
+        self.assertEqual(list(range(0, 100, 10)), [b['start'] for b in first])
+
+        second = self.client.query_metric_stats(MetricType.Gauge, 'g.1', start=0, end=130, bucketDuration='10ms')
+        self.assertEqual(list(range(0, 130, 10)), [b['start'] for b in second])
+        self.assertEqual([(0, 100), (100, 130)], self.fetched())
+
+        self.client.query_metric_stats(MetricType.Gauge, 'g.1', start=20, end=130, bucketDuration='10ms')
+        self.assertEqual(2, len(self.server.requests))
+        self.assertEqual({'hits': 21, 'misses': 13, 'series': 1, 'buckets': 13}, self.cache.stats())
+
+    def test_open_buckets_are_fetched(self):
+        end = time_millis() + 60000
+        start = end - 10 * 60000
+        self.client.query_metric_stats(MetricType.Gauge, 'g.1', start=start, end=end, bucketDuration='1mn')
+        self.client.query_metric_stats(MetricType.Gauge, 'g.1', start=start, end=end, bucketDuration='1mn')
+
+        # Only the bucket which is still open is fetched again
+        self.assertEqual(2, len(self.server.requests))
+        self.assertEqual(end, self.fetched()[1][1])
+        self.assertTrue(end - self.fetched()[1][0] <= 2 * 60000)
+
+    def test_options_are_separate_series(self):
+        self.client.query_metric_stats(MetricType.Gauge, 'g.1', start=0, end=100, bucketDuration='10ms')
+        self.client.query_metric_stats(MetricType.Gauge, 'g.1', start=0, end=100, bucketDuration='20ms')
+        self.client.query_metric_stats(MetricType.Gauge, 'g.1', start=0, end=100, bucketDuration='10ms', percentiles='90')
+        self.assertEqual(3, len(self.server.requests))
+
+    def test_uncacheable_queries_pass_through(self):
+        self.client.query_metric_stats(MetricType.Gauge, 'g.1', start=0, end=100, buckets=10)
+        self.client.query_metric_stats(MetricType.Gauge, 'g.1', start=0, end=100, buckets=10)
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_duration_to_millis(self):
+        self.assertEqual(3600000, duration_to_millis('1h'))
+        self.assertEqual(120000, duration_to_millis('2mn'))
+        self.assertEqual(90000, duration_to_millis(timedelta(seconds=90)))
+        self.assertIsNone(duration_to_millis('soon'))
+
+class SpoolTestCase(FakeServerTestCase):
+    def setUp(self):
+        super(SpoolTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.status = 503
+        self.server.route('POST', '/hawkular/metrics/gauges/raw', handler=lambda r: (self.status, None))
+
+    def tearDown(self):
+        self.client.disable_spool()
+        shutil.rmtree(self.directory)
+        super(SpoolTestCase, self).tearDown()
+
+    def sent(self):
+        return [d['data'][0]['value'] for p in self.posted('/hawkular/metrics/gauges/raw') for d in p]
+
+    def test_spool_and_replay_in_order(self):
+        spool = self.client.enable_spool(self.directory, retry_interval=60)
+        self.client.push(MetricType.Gauge, 'g.1', 1.0, 1)
+        self.client.push(MetricType.Gauge, 'g.1', 2.0, 2)
+        self.assertEqual(1, len(self.server.requests))
+        self.assertFalse(self.client.replay_spool())
+
+        self.status = 200
+        self.assertTrue(self.client.replay_spool())
+        self.client.push(MetricType.Gauge, 'g.1', 3.0, 3)
+        self.assertEqual([1.0, 2.0, 3.0], self.sent()[-3:])
+        self.assertEqual(2, spool.stats()['appended'])
+        self.assertEqual(2, spool.stats()['replayed'])
+
+    def test_background_replay(self):
+        self.client.enable_spool(self.directory, retry_interval=0.05)
+        self.client.push(MetricType.Gauge, 'g.1', 1.0, 1)
+        self.status = 200
+        for _ in range(100):
+            if self.client.spool.empty():
+                break
+            time.sleep(0.05)
+        self.assertTrue(self.client.spool.empty())
+        self.assertEqual([1.0, 1.0], self.sent())
+
+    def test_client_errors_are_raised(self):
+        self.client.enable_spool(self.directory, retry_interval=60)
+        self.status = 400
+        self.assertRaises(HawkularError, self.client.push, MetricType.Gauge, 'g.1', 1.0, 1)
+        self.assertTrue(self.client.spool.empty())
+
+    def test_spool_survives_restart(self):
+        spool = DiskSpool(self.directory)
+        for i in range(3):
+            spool.append([MetricType.Gauge, i])
+        self.assertEqual([MetricType.Gauge, 0], spool.peek())
+        spool.commit()
+        spool.close()
+
+        # Torn write at the end of the segment
+        with open(os.path.join(self.directory, 'spool-000000000000.jsonl'), 'ab') as f:
+            f.write(b'["gauges", 3')
+
+        spool = DiskSpool(self.directory)
+        spool.append([MetricType.Gauge, 4])
+        self.assertEqual([1, 2, 4], [r[1] for r in self.drain(spool)])
+        self.assertEqual(1, spool.stats()['corrupted'])
+        spool.close()
+
+    def test_oldest_segments_are_dropped(self):
+        spool = DiskSpool(self.directory, segment_size=100, max_size=250)
+        for i in range(20):
+            spool.append({'value': '{0:020d}'.format(i)})
+
+        stats = spool.stats()
+        self.assertTrue(stats['bytes'] <= 250)
+        self.assertTrue(stats['dropped_segments'] > 0)
+        records = self.drain(spool)
+        self.assertTrue(len(records) < 20)
+        self.assertEqual('{0:020d}'.format(19), records[-1]['value'])
+        spool.close()
+
+    def drain(self, spool):
+        records = []
+        while not spool.empty():
+            records.append(spool.peek())
+            spool.commit()
+        return records
+
+
+class TelemetryTestCase(FakeServerTestCase):
+    def setUp(self):
+        super(TelemetryTestCase, self).setUp()
+        self.server.route('POST', '/hawkular/metrics/gauges/raw')
+        self.server.route('POST', '/hawkular/metrics/counters/raw')
+
+    def reported(self):
+        return dict((d['id'], d['data'][0]['value']) for p in self.posted('/hawkular/metrics/gauges/raw')
+                    for d in p if d['id'].startswith('app.'))
+
+    def test_piggybacked_on_gauges(self):
+        telemetry = self.client.enable_telemetry(prefix='app', interval=60)
+        telemetry.add_source('custom', lambda: {'answer': 42, 'name': 'ignored'})
+
+        self.client.push(MetricType.Counter, 'c.1', 1, 1)
+        self.assertEqual({}, self.reported())
+
+        self.client.push(MetricType.Gauge, 'g.1', 1.0, 1)
+        self.client.push(MetricType.Gauge, 'g.1', 2.0, 2)
+        self.assertEqual(3, len(self.server.requests))
+
+        reported = self.reported()
+        self.assertEqual(1.0, reported['app.client.put_requests'])
+        self.assertEqual(1.0, reported['app.client.put_datapoints'])
+        self.assertEqual(42.0, reported['app.custom.answer'])
+        self.assertEqual(1.0, reported['app.request.post.counters.raw.count'])
+        self.assertTrue('app.request.post.counters.raw.p99_ms' in reported)
+        # Only once per interval
+        self.assertEqual(1, len([p for p in self.posted('/hawkular/metrics/gauges/raw')
+                                 if any(d['id'].startswith('app.') for d in p)]))
+
+    def test_batch_writer_and_errors(self):
+        telemetry = self.client.enable_telemetry(prefix='app', interval=0)
+        with self.client.batch_writer(flush_interval=60) as w:
+            w.push(MetricType.Gauge, 'g.1', 1.0, 1)
+            w.flush()
+            self.server.route('POST', '/hawkular/metrics/gauges/raw', status=400)
+            self.assertRaises(HawkularError, self.client.push, MetricType.Gauge, 'g.1', 1.0, 1)
+
+        self.assertEqual(1, telemetry.counters()['put_errors'])
+        self.assertEqual(1, telemetry.collect()['app.batch.flushed'])
+        self.assertEqual(1.0, self.reported()['app.client.put_requests'])
+
+        self.client.disable_telemetry()
+        self.server.route('POST', '/hawkular/metrics/gauges/raw')
+        self.client.push(MetricType.Gauge, 'g.1', 1.0, 1)
+        self.assertEqual(['g.1'], [d['id'] for d in self.posted('/hawkular/metrics/gauges/raw')[-1]])
+
+class AggregatorTestCase(FakeServerTestCase):
+    def setUp(self):
+        super(AggregatorTestCase, self).setUp()
+        for metric_type in ('gauges', 'counters', 'availability'):
+            self.server.route('POST', '/hawkular/metrics/{0}/raw'.format(metric_type))
+
+    def sent(self, metric_type):
+        sent = {}
+        for p in self.posted('/hawkular/metrics/{0}/raw'.format(metric_type)):
+            for d in p:
+                sent.setdefault(d['id'], []).extend((dp['timestamp'], dp['value']) for dp in d['data'])
+        return sent
+
+    def test_gauges_and_counters(self):
+        with self.client.aggregator(window=10, extra_stats=('min', 'max', 'count')) as a:
+            for i, value in enumerate([1.0, 5.0, 3.0]):
+                a.push(MetricType.Gauge, 'g.1', value, 20000 + i * 1000)
+            a.push(MetricType.Gauge, 'g.1', 7.0, 30000)
+            for i, increment in enumerate([1, 2, 3, 4]):
+                a.push(MetricType.Counter, 'c.1', increment, 20000 + i * 4000)
+            a.push(MetricType.Availability, 'a.1', 'up', 25000)
+            self.assertEqual(8 + 2 + 1, a.flush())
+            self.assertEqual(0, a.stats()['metrics'])
+
+            a.push(MetricType.Gauge, 'g.1', 9.0, 29000)
+            self.assertEqual(1, a.stats()['late'])
+
+        gauges = self.sent('gauges')
+        self.assertEqual([(20000, 3.0), (30000, 7.0)], gauges['g.1'])
+        self.assertEqual([(20000, 1.0), (30000, 7.0)], gauges['g.1.min'])
+        self.assertEqual([(20000, 5.0), (30000, 7.0)], gauges['g.1.max'])
+        self.assertEqual([(20000, 3), (30000, 1)], gauges['g.1.count'])
+        # Increments of 20000-29999 and 30000-39999 added to a running total
+        self.assertEqual([(20000, 6), (30000, 10)], self.sent('counters')['c.1'])
+        self.assertEqual([(25000, 'up')], self.sent('availability')['a.1'])
+
+    def test_open_windows_sent_on_close(self):
+        a = self.client.aggregator(window=60, summary='last', counters='last')
+        now = time_millis()
+        a.push(MetricType.Gauge, 'g.1', 1.0, now)
+        a.push(MetricType.Gauge, 'g.1', 2.0, now)
+        a.push(MetricType.Counter, 'c.1', 100, now)
+        a.push(MetricType.Counter, 'c.1', 150, now + 1)
+        self.assertEqual(0, a.flush())
+        self.assertEqual(2, a.flush(everything=True))
+        a.close()
+
+        start = now - now % 60000
+        self.assertEqual([(start, 2.0)], self.sent('gauges')['g.1'])
+        self.assertEqual([(start, 150)], self.sent('counters')['c.1'])
+        self.assertEqual({'samples': 4, 'emitted': 2, 'late': 0, 'failures': 0, 'metrics': 0}, a.stats())
+
+    def test_datetime_timestamps(self):
+        with self.client.aggregator(window=10) as a:
+            a.push(MetricType.Gauge, 'g.1', 1.0, datetime.utcfromtimestamp(20))
+            a.push(MetricType.Gauge, 'g.1', 3.0, datetime.utcfromtimestamp(25))
+            a.put(create_metric(MetricType.Gauge, 'g.1', create_datapoint(5.0, datetime.utcfromtimestamp(31))))
+        self.assertEqual([(20000, 2.0), (30000, 5.0)], self.sent('gauges')['g.1'])
+
+    def test_invalid_statistic(self):
+        self.assertRaises(ValueError, self.client.aggregator, summary='p99')
+
+
+class IngestPoolTestCase(FakeServerTestCase):
+    def setUp(self):
+        super(IngestPoolTestCase, self).setUp()
+        self.server.route('POST', '/hawkular/metrics/gauges/raw')
+        self.server.route('POST', '/hawkular/metrics/counters/raw')
+
+    def sent(self, metric_type):
+        sent = {}
+        for p in self.posted('/hawkular/metrics/{0}/raw'.format(metric_type)):
+            for d in p:
+                sent.setdefault(d['id'], []).extend((dp['timestamp'], dp['value']) for dp in d['data'])
+        return sent
+
+    def test_datapoints_sent_by_workers(self):
+        # Small ring and chunks to wrap around the ring buffers
+        with self.client.ingest_pool(processes=2, batch_size=50, capacity=64, chunk_size=16) as pool:
+            for i in range(500):
+                pool.push(MetricType.Gauge, 'g.{0}'.format(i % 3), i * 0.5, 1000 + i)
+            pool.put(create_metric(MetricType.Counter, 'c.1', [create_datapoint(i, 2000 + i) for i in range(10)]))
+            self.assertTrue(pool.flush(timeout=30))
+            stats = pool.stats()
+
+        self.assertEqual(510, stats['pushed'])
+        self.assertEqual(510, stats['received'])
+        self.assertEqual(510, stats['flushed'])
+        self.assertEqual(2, len(stats['workers']))
+
+        gauges = self.sent('gauges')
+        for m in range(3):
+            self.assertEqual([(1000 + i, i * 0.5) for i in range(m, 500, 3)], gauges['g.{0}'.format(m)])
+        self.assertEqual([(2000 + i, i) for i in range(10)], self.sent('counters')['c.1'])
+
+    def test_invalid_sample_rejected(self):
+        with self.client.ingest_pool(processes=1) as pool:
+            self.assertRaises(TypeError, pool.push, MetricType.Gauge, 'g.1', None, 1000)
+            self.assertRaises(ValueError, pool.push, MetricType.Gauge, 'g.1', 1.0, 'now')
+            pool.push(MetricType.Gauge, 'g.1', 2.0, 2000)
+            pool.put(create_metric(MetricType.Gauge, 'g.1', create_datapoint(3.0, datetime.utcfromtimestamp(3))))
+            self.assertTrue(pool.flush(timeout=30))
+            self.assertEqual(2, pool.stats()['pushed'])
+
+        self.assertEqual([(2000, 2.0), (3000, 3.0)], self.sent('gauges')['g.1'])
+
+    def test_unsupported_type(self):
+        with self.client.ingest_pool(processes=1) as pool:
+            self.assertRaises(ValueError, pool.push, MetricType.Availability, 'a.1', 'up')
+
+    def test_invalid_sizes(self):
+        self.assertRaises(ValueError, self.client.ingest_pool, processes=1, batch_size=1000, max_buffer=100)
+        self.assertRaises(ValueError, self.client.ingest_pool, processes=1, capacity=100, chunk_size=1000)
+
+
 @unittest.skipIf(base.is_alerts_image, "Metrics unavailable for this docker image")
 class MetricsTestCase(TestMetricFunctionsBase):
     """